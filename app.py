@@ -1,4 +1,4 @@
-import json, os
+import json, os, secrets
 from datetime import datetime
 
 from flask import Flask
@@ -7,47 +7,59 @@ from flask import request
 from flask import redirect
 
 from flask_cors import CORS
-from flask_limiter import Limiter
-from flask_limiter.util import get_remote_address
 import requests, logging
 
-from ddtrace import patch_all, tracer, config, Pin
-from ddtrace.profiling import Profiler
-
 from routes.ffxiv import ffxiv_bp
 from routes.general import general_bp
+from routes.metrics import metrics_bp
+from routes.tables import tables_bp
 from routes.wow import wow_bp
-from utils.security import add_security_headers, return_safe_html
-
-# Enable Datadog tracing
-patch_all()
-profiler = Profiler()
-profiler.start()
-
-# Initialize Datadog tracer
-DD_AGENT_HOST = os.getenv("DD_AGENT_HOST", "localhost")
-tracer.configure(
-    hostname=DD_AGENT_HOST,  # Replace with your Datadog agent hostname if different
-    port=8126,  # Replace with your Datadog agent port if different
+from utils.circuit import CircuitOpenError, data_as_of, upstream_unavailable
+from utils.compression import compress_response
+from utils.deadline import (
+    DeadlineExceeded,
+    deadline_exceeded,
+    init_deadlines,
+    latency_budget,
 )
+from utils.instrumentation import start_instrumentation
+from utils.jsonstream import iter_items
+from utils.logs import setup_logging
+from utils.metrics import METRICS_ENABLED, init_metrics
+from utils.projection import Projection
+from utils.ratelimit import RateLimiter, request_cost
+from utils.rendering import render_results
+from utils.security import add_security_headers, return_safe_html
+from utils.static_pages import static_template
+from utils.tables import table_view
+from utils.teamcraft import load_item_names
+from utils.templating import configure_templates
+from utils.upstream import post_json, post_raw
 
-# Set Datadog service and environment variables
-os.environ["DD_SERVICE"] = "flask-test"
-os.environ["DD_ENV"] = "production"
-os.environ["DD_VERSION"] = "1.0"
-os.environ["DD_LOGS_INJECTION"] = "true"
+# Every logger writes through a queue so requests never wait on stderr
+setup_logging()
 
-# Alternatively, configure Datadog settings directly
-config.service = "flask-test"
-config.env = "production"
-config.version = "1.0"
+# Datadog tracing and profiling, or nothing at all, see utils/instrumentation.py
+instrumentation = start_instrumentation()
 
 # Get API URL from environment variable or use default if not set
 api_url = os.getenv("TEMP_API_URL", "http://api.saddlebagexchange.com/api")
 
 app = Flask(__name__)
-# Attach the tracer to the Flask app
-Pin.override(app, service="flask-test")
+# Signs the /tables tokens and has to be the same on every pod, a random key
+# per pod would reject every token the other pods signed. Only a local debug
+# run (DEBUG_MODE from docker-compose.yml, or flask --debug) may go without it
+DEBUG_MODE = os.getenv("DEBUG_MODE", "").lower() in ("true", "1", "yes")
+app.secret_key = os.getenv("SECRET_KEY")
+if not app.secret_key:
+    if not (DEBUG_MODE or app.debug):
+        raise RuntimeError("SECRET_KEY must be set, see kube-manifest-fe.yml")
+    app.secret_key = secrets.token_hex(32)
+instrumentation.init_app(app)
+# Per route and per phase timings for /metrics, no agent needed
+init_metrics(app)
+# Latency budget of every request, upstream calls time out when it runs out
+init_deadlines(app)
 
 # Initialize Flask-CORS with your app and specify allowed origins
 origins = [
@@ -61,48 +73,36 @@ CORS(app, resources={r"/*": {"origins": origins}})
 # Check for NO_RATE_LIMIT environment variable
 NO_RATE_LIMIT = os.getenv("NO_RATE_LIMIT", False)
 if not NO_RATE_LIMIT:
-    # Apply rate limit if NO_RATE_LIMIT is not set
-    limiter = Limiter(get_remote_address, app=app, default_limits=["1 per second"])
-
-# Set the logging level to INFO for the Flask app
-app.logger.setLevel(logging.INFO)
-app.logger.disabled = True
-logging.basicConfig(level=logging.INFO)
-
-# Setup logging for custom errors
-
-# Configure the logger with the custom format
-log_format = (
-    "%(levelname)s:\t[%(process)d][%(asctime)s] [%(module)s][%(funcName)s]  %(message)s"
-)
-formatter = logging.Formatter(log_format)
+    # Apply rate limit if NO_RATE_LIMIT is not set, requests are charged by
+    # what they cost us, see utils/ratelimit.py and the @request_cost views
+    limiter = RateLimiter(app)
 
-# Create a handler and set the formatter
-handler = logging.StreamHandler()
-handler.setFormatter(formatter)
-
-# Create the logger and add the handler
+# app.py's own errors, written by the queue pipeline from utils/logs.py
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)  # Set the logging level to DEBUG
-logger.addHandler(handler)
-
-
-class CustomLogHandler(logging.StreamHandler):
-    def __init__(self):
-        logging.StreamHandler.__init__(self)
-
-    def format(self, record):
-        return f"{record.levelname}: {record.getMessage()}"
-
-
-custom_handler = CustomLogHandler()
-app.logger.addHandler(custom_handler)
 
 
 # Register blueprints to add routes
 app.register_blueprint(wow_bp)
 app.register_blueprint(ffxiv_bp)
 app.register_blueprint(general_bp)
+app.register_blueprint(tables_bp)
+if METRICS_ENABLED:
+    app.register_blueprint(metrics_bp)
+
+# FFXIV item names saved by an earlier run of this container. The cache is
+# not shared between pods, under gunicorn the master downloads the names
+# before forking instead (when_ready in gunicorn.conf.py)
+load_item_names()
+# Compile the templates now instead of on the first request for each page
+configure_templates(app)
+
+
+# Upstream outages: fail fast with a 503 (open circuit) or a 504 (latency
+# budget used up) when no stale copy could be served, and let _navbar.html
+# say when the results are a stale copy
+app.register_error_handler(CircuitOpenError, upstream_unavailable)
+app.register_error_handler(DeadlineExceeded, deadline_exceeded)
+app.add_template_global(data_as_of)
 
 
 # Use add_security_headers from utils/security.py
@@ -111,7 +111,12 @@ def apply_security_headers(response):
     return add_security_headers(response)
 
 
+# gzip / brotli for clients that accept it, see utils/compression.py
+app.after_request(compress_response)
+
+
 @app.route("/ffxivcraftsim", methods=["GET", "POST"])
+@request_cost(POST=0.1)
 def ffxivcraftsim():
     return redirect("https://saddlebagexchange.com/ffxiv/craftsim/queries")
 
@@ -153,7 +158,7 @@ def ffxivcraftsim():
 
 def craftsim_results_table(craftsim_results, html_file_name, json_data={}):
     if "data" not in craftsim_results:
-        logger.error(str(craftsim_results))
+        logger.error("%s", craftsim_results)
         # send generic error message to remove XSS potential
         return f"error no matching results found matching search inputs"
 
@@ -219,6 +224,7 @@ def craftsim_results_table(craftsim_results, html_file_name, json_data={}):
 
 
 @app.route("/ffxivshoppinglist", methods=["GET", "POST"])
+@request_cost(POST=0.1)
 def ffxiv_shopping_list():
     return redirect("https://saddlebagexchange.com/ffxiv/shopping-list")
 
@@ -246,7 +252,7 @@ def ffxiv_shopping_list():
 
 def ffxiv_shopping_list_result(shopping_list_results, html_file_name, json_data={}):
     if "data" not in shopping_list_results:
-        logger.error(str(shopping_list_results))
+        logger.error("%s", shopping_list_results)
         # send generic error message to remove XSS potential
         return f"error no matching results found matching search inputs"
 
@@ -289,10 +295,36 @@ def ffxiv_shopping_list_result(shopping_list_results, html_file_name, json_data=
     )
 
 
+FFXIV_BESTDEALS_COLUMNS = Projection(
+    columns=[
+        "itemName",
+        "worldName",
+        "discountHQ",
+        "discountNQ",
+        "minPriceHQ",
+        "minPrice",
+        "medianHQ",
+        "medianNQ",
+        "salesAmountHQ",
+        "salesAmountNQ",
+        "quantitySoldHQ",
+        "quantitySoldNQ",
+        "averageHQ",
+        "averageNQ",
+        "mainCategory",
+        "subCategory",
+        "itemData",
+        "uniLink",
+        "lastUploadTime",
+    ]
+)
+
+
 @app.route("/ffxivbestdeals", methods=["GET", "POST"])
+@table_view
 def ffxivbestdeals():
     if request.method == "GET":
-        return return_safe_html(render_template("ffxivbestdeals.html"))
+        return static_template("ffxivbestdeals.html")
     elif request.method == "POST":
         json_data = {
             "home_server": request.form.get("home_server"),
@@ -302,57 +334,29 @@ def ffxivbestdeals():
             "maxBuyPrice": int(request.form.get("maxBuyPrice")),
             "filters": [int(request.form.get("filters"))],
         }
-        response = requests.post(
-            f"{api_url}/bestdeals",
-            headers={"Accept": "application/json"},
-            json=json_data,
-        ).json()
+        response = post_json(f"{api_url}/bestdeals", json_data)
 
         if "data" not in response:
-            logger.error(str(response))
+            logger.error("%s", response)
             # send generic error message to remove XSS potential
             return f"error no matching results found matching search inputs"
 
         if len(response["data"]) == 0:
             logger.error(
-                f"No matching results found with seach inputs {json_data} response {response}"
+                "No matching results found with seach inputs %s response %s",
+                json_data,
+                response,
             )
             # send generic error message to remove XSS potential
             return f"error no matching results found matching search inputs"
 
-        resp_list = response["data"]
-        column_order = [
-            "itemName",
-            "worldName",
-            "discountHQ",
-            "discountNQ",
-            "minPriceHQ",
-            "minPrice",
-            "medianHQ",
-            "medianNQ",
-            "salesAmountHQ",
-            "salesAmountNQ",
-            "quantitySoldHQ",
-            "quantitySoldNQ",
-            "averageHQ",
-            "averageNQ",
-            "mainCategory",
-            "subCategory",
-            "itemData",
-            "uniLink",
-            "lastUploadTime",
-        ]
-        resp_list = [{key: item.get(key) for key in column_order} for item in resp_list]
-        fieldnames = list(resp_list[0].keys())
-        return return_safe_html(
-            render_template(
-                "ffxivbestdeals.html", results=resp_list, fieldnames=fieldnames, len=len
-            )
-        )
+        results = FFXIV_BESTDEALS_COLUMNS.result_set(response["data"])
+        return render_results("ffxivbestdeals.html", results)
 
 
 #### WOW ####
 @app.route("/uploadtimers", methods=["GET", "POST"])
+@request_cost(POST=0.1)
 def uploadtimers():
     return redirect("https://saddlebagexchange.com/wow/upload-timers")
 
@@ -369,7 +373,9 @@ def uploadtimers():
 
         if "data" not in response:
             logger.error(
-                f"No matching results found with seach inputs {json_data} response {response}"
+                "No matching results found with seach inputs %s response %s",
+                json_data,
+                response,
             )
             # send generic error message to remove XSS potential
             return f"error no matching results found matching search inputs"
@@ -417,37 +423,31 @@ def uploadtimers():
 #         )
 
 
+MEGAITEMNAMES_COLUMNS = Projection(
+    columns=["itemID", "desiredPrice", "itemName", "salesPerDay"]
+)
+
+
 @app.route("/megaitemnames", methods=["GET", "POST"])
+@request_cost(POST=3)
+@latency_budget(30)
+@table_view
 def megaitemnames():
     if request.method == "GET":
-        return return_safe_html(render_template("megaitemnames.html"))
+        return static_template("megaitemnames.html")
     elif request.method == "POST":
         json_data = {
             "region": request.form.get("region"),
             "discount": int(request.form.get("discount")),
         }
-        response = requests.post(
-            f"{api_url}/wow/megaitemnames",
-            headers={"Accept": "application/json"},
-            json=json_data,
-        ).json()
+        content = post_raw(f"{api_url}/wow/megaitemnames", json_data)
 
-        column_order = [
-            "itemID",
-            "desiredPrice",
-            "itemName",
-            "salesPerDay",
-        ]
-        response = [{key: item.get(key) for key in column_order} for item in response]
-        fieldnames = list(response[0].keys())
-        return return_safe_html(
-            render_template(
-                "megaitemnames.html", results=response, fieldnames=fieldnames, len=len
-            )
-        )
+        results = MEGAITEMNAMES_COLUMNS.result_set(iter_items(content))
+        return render_results("megaitemnames.html", results)
 
 
 @app.route("/petshoppinglist", methods=["GET", "POST"])
+@request_cost(POST=0.1)
 def petshoppinglist():
     return redirect("https://saddlebagexchange.com/wow/shopping-list")
 
@@ -470,7 +470,9 @@ def petshoppinglist():
 
         if "data" not in response:
             logger.error(
-                f"Error no matching data with given inputs {json_data} response {response}"
+                "Error no matching data with given inputs %s response %s",
+                json_data,
+                response,
             )
             if NO_RATE_LIMIT:
                 return f"Error no matching data with given inputs {json_data} response {response}"
@@ -498,6 +500,7 @@ def petshoppinglist():
 
 
 @app.route("/petmarketshare", methods=["GET", "POST"])
+@request_cost(POST=0.1)
 def petmarketshare():
     return redirect("https://saddlebagexchange.com/wow/pet-marketshare")
 
@@ -523,7 +526,9 @@ def petmarketshare():
 
         if "data" not in response:
             logger.error(
-                f"Error no matching data with given inputs {json_data} response {response}"
+                "Error no matching data with given inputs %s response %s",
+                json_data,
+                response,
             )
             if NO_RATE_LIMIT:
                 return f"Error no matching data with given inputs {json_data} response {response}"
@@ -555,6 +560,7 @@ def petmarketshare():
 
 
 @app.route("/petexport", methods=["GET", "POST"])
+@request_cost(POST=0.1)
 def petexport():
     return redirect("https://saddlebagexchange.com/wow/export-search")
 
@@ -582,7 +588,9 @@ def petexport():
 
         if "data" not in response:
             logger.error(
-                f"Error no matching data with given inputs {json_data} response {response}"
+                "Error no matching data with given inputs %s response %s",
+                json_data,
+                response,
             )
             if NO_RATE_LIMIT:
                 return f"Error no matching data with given inputs {json_data} response {response}"
@@ -612,6 +620,7 @@ def petexport():
 
 
 @app.route("/regionundercut", methods=["GET", "POST"])
+@request_cost(POST=0.1)
 def regionundercut():
     return redirect("https://saddlebagexchange.com/wow/region-undercut")
 
@@ -634,7 +643,9 @@ def regionundercut():
 
         if "undercut_list" not in response or "not_found_list" not in response:
             logger.error(
-                f"Error no matching data with given inputs {json_data} response {response}"
+                "Error no matching data with given inputs %s response %s",
+                json_data,
+                response,
             )
             if NO_RATE_LIMIT:
                 return f"Error no matching data with given inputs {json_data} response {response}"
@@ -655,7 +666,9 @@ def regionundercut():
 
         if "not_found_list" not in response:
             logger.error(
-                f"Error no matching data with given inputs {json_data} response {response}"
+                "Error no matching data with given inputs %s response %s",
+                json_data,
+                response,
             )
             # send generic error message to remove XSS potential
             return f"error no matching results found matching search inputs"
@@ -685,6 +698,7 @@ def regionundercut():
 
 
 @app.route("/bestdeals", methods=["GET", "POST"])
+@request_cost(POST=0.1)
 def bestdeals():
     return redirect("https://saddlebagexchange.com/wow/best-deals/recommended")
 
@@ -710,7 +724,9 @@ def bestdeals():
 
         if "data" not in response or len(response["data"]) == 0:
             logger.error(
-                f"Error no matching data with given inputs {json_data} response {response}"
+                "Error no matching data with given inputs %s response %s",
+                json_data,
+                response,
             )
             if NO_RATE_LIMIT:
                 return f"Error no matching data with given inputs {json_data} response {response}"
@@ -758,14 +774,18 @@ def bestdeals():
         )
 
 
+PETIMPORT_COLUMNS = Projection(
+    drop=["itemID", "lowestPriceRealmID"],
+    tail=["lowestPriceRealmName", "link", "undermineLink", "warcraftPetsLink"],
+)
 
 
 @app.route("/petimport", methods=["GET", "POST"])
+@table_view
 def petimport():
     if request.method == "GET":
-        return render_template("petimport.html")
+        return static_template("petimport.html", sanitize=False)
     elif request.method == "POST":
-        headers = {"Accept": "application/json"}
         petsOnly = request.form.get("petsOnly")
         if petsOnly == "False":
             petsOnly = False
@@ -786,11 +806,7 @@ def petimport():
             "connectedRealmIDs": {},
         }
 
-        response = requests.post(
-            f"{api_url}/api/wow/import",
-            headers=headers,
-            json=json_data,
-        ).json()
+        response = post_json(f"{api_url}/api/wow/import", json_data)
 
         if "data" not in response:
             return f"Error no matching data with given inputs {response}"
@@ -798,36 +814,13 @@ def petimport():
         if len(response) == 0:
             return f"No item found with given inputs, try lowering price or sale amount {json_data}"
 
-        for row in response:
-            del row["itemID"]
-            del row["lowestPriceRealmID"]
-            realm = row["lowestPriceRealmName"]
-            del row["lowestPriceRealmName"]
-            row["lowestPriceRealmName"] = realm
-
-            link = row["link"]
-            del row["link"]
-            row["link"] = link
-
-            undermineLink = row["undermineLink"]
-            del row["undermineLink"]
-            row["undermineLink"] = undermineLink
+        results = PETIMPORT_COLUMNS.result_set(response)
 
-            warcraftPetsLink = row["warcraftPetsLink"]
-            del row["warcraftPetsLink"]
-            row["warcraftPetsLink"] = warcraftPetsLink
-
-        fieldnames = list(response[0].keys())
-
-        return render_template(
-            "petimport.html",
-            results=response,
-            fieldnames=fieldnames,
-            len=len,
-        )
+        return render_results("petimport.html", results)
 
 
 @app.route("/ffxivsalehistory", methods=["GET", "POST"])
+@request_cost(POST=0.1)
 def ffxivsalehistory():
     return redirect("https://saddlebagexchange.com/ffxiv/extended-history")
 
@@ -884,6 +877,7 @@ def ffxivsalehistory():
 
 
 @app.route("/ffxivscripexchange", methods=["GET", "POST"])
+@request_cost(POST=0.1)
 def ffxiv_scrip_exchange():
     return redirect("https://saddlebagexchange.com/ffxiv/scrip-exchange")
 
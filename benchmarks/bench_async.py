@@ -0,0 +1,134 @@
+"""Sync upstream calls against async ones, behind the same WSGI server.
+
+    python benchmarks/bench_async.py [--requests 200] [--concurrency 50] [--delay 0.2]
+
+Keeps the comparison that removed the ASYNC_UPSTREAM mode reproducible. One
+small Flask app answers every search with the size of the upstream answer, in
+three ways:
+
+sync     utils.upstream.post_raw, the pooled requests session the app uses
+ioloop   an httpx.AsyncClient on one event loop thread, the request thread
+         waits for its call, which is what ASYNC_UPSTREAM did
+asgiref  an `async def` view, run by Flask on the request thread with a
+         fresh event loop and client each time
+
+Every request sends a different payload to the slow stub, so the response
+cache and coalescing stay out of the way and each one really waits. Needs
+httpx and flask[async], which the app itself does not install.
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stub_upstream import start as start_stub
+
+# Flask runs async views through asgiref
+if (
+    importlib.util.find_spec("httpx") is None
+    or importlib.util.find_spec("asgiref") is None
+):
+    sys.exit("bench_async.py needs httpx and flask[async]: pip install httpx asgiref")
+
+import httpx
+
+from flask import Flask
+from werkzeug.serving import make_server
+
+from utils import upstream
+
+MODES = ("sync", "ioloop", "asgiref")
+
+
+def make_app(search_url):
+    app = Flask(__name__)
+
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    client = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=upstream.POOL_SIZE), timeout=30
+    )
+
+    async def search(client, payload):
+        response = await client.post(search_url, json=payload)
+        response.raise_for_status()
+        return response.content
+
+    @app.route("/sync/<int:i>", methods=["POST"])
+    def sync_search(i):
+        return str(len(upstream.post_raw(search_url, {"avgPrice": i})))
+
+    @app.route("/ioloop/<int:i>", methods=["POST"])
+    def ioloop_search(i):
+        future = asyncio.run_coroutine_threadsafe(search(client, {"avgPrice": i}), loop)
+        return str(len(future.result()))
+
+    @app.route("/asgiref/<int:i>", methods=["POST"])
+    async def asgiref_search(i):
+        async with httpx.AsyncClient(timeout=30) as client:
+            return str(len(await search(client, {"avgPrice": i})))
+
+    return app
+
+
+def run(url, mode, total, concurrency, offset):
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=concurrency))
+
+    def one(i):
+        start = time.perf_counter()
+        response = session.post(f"{url}/{mode}/{offset + i}")
+        response.raise_for_status()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        latencies = sorted(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - start
+    return {
+        "throughput": total / elapsed,
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(len(latencies) * 0.95) - 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--delay", type=float, default=0.2)
+    parser.add_argument("--rows", type=int, default=20)
+    args = parser.parse_args()
+
+    # small answers keep decoding out of the numbers, this is about waiting
+    stub, stub_url = start_stub(delay=args.delay, rows={"/wow/outofstock": args.rows})
+    app = make_app(f"{stub_url}/api/wow/outofstock")
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}"
+
+    print(f"{'mode':<8} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    for offset, mode in enumerate(MODES):
+        result = run(url, mode, args.requests, args.concurrency, offset * args.requests)
+        print(
+            f"{mode:<8} {result['throughput']:>8.1f} "
+            f"{result['p50'] * 1000:>8.1f} {result['p95'] * 1000:>8.1f}"
+        )
+    server.shutdown()
+    stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
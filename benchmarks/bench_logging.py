@@ -0,0 +1,95 @@
+"""Time spent in the request thread per logger.error call.
+
+    python benchmarks/bench_logging.py [--calls 200] [--mb-per-second 50]
+
+Compares the old setup (a StreamHandler written synchronously) with the
+queue pipeline from utils/logs.py. The stream is a sink that takes
+len(data) / --mb-per-second to accept a write, like a busy container log
+driver. Each run logs an error carrying a 2MB upstream response, 20
+different small errors and the same small error over and over.
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.logs import LOG_FORMAT, LogPipeline
+
+RESPONSE = {"data": [{"itemID": i, "name": "x" * 40} for i in range(30_000)]}
+
+
+class SlowSink:
+    def __init__(self, bytes_per_second):
+        self.bytes_per_second = bytes_per_second
+        self.written = 0
+
+    def write(self, data):
+        self.written += len(data)
+        time.sleep(len(data) / self.bytes_per_second)
+
+    def flush(self):
+        pass
+
+
+def messages(calls):
+    for i in range(calls):
+        if i % 10 == 0:
+            yield str(RESPONSE)
+        elif i % 2:
+            yield f"Error no matching data with given inputs {{'region': {i % 20}}}"
+        else:
+            yield "Error fetching ffxiv item names [503]"
+
+
+def run(mode, calls, bytes_per_second):
+    sink = SlowSink(bytes_per_second)
+    stream = logging.StreamHandler(sink)
+    stream.setFormatter(logging.Formatter(LOG_FORMAT))
+    logger = logging.getLogger(f"bench.{mode}")
+    logger.propagate = False
+    pipeline = None
+    if mode == "sync":
+        logger.addHandler(stream)
+    else:
+        pipeline = LogPipeline([stream])
+        pipeline.start()
+        logger.addHandler(pipeline.handler)
+
+    timings = []
+    start = time.perf_counter()
+    for message in messages(calls):
+        call = time.perf_counter()
+        logger.error(message)
+        timings.append(time.perf_counter() - call)
+    in_requests = time.perf_counter() - start
+    if pipeline is not None:
+        pipeline.stop()
+    return timings, in_requests, sink.written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--mb-per-second", type=float, default=50)
+    args = parser.parse_args()
+
+    print(
+        f"{'mode':<6} {'p50 us':>8} {'p99 us':>9} {'max ms':>8} "
+        f"{'total ms':>9} {'written KB':>11}"
+    )
+    for mode in ("sync", "queue"):
+        timings, total, written = run(mode, args.calls, args.mb_per_second * 1e6)
+        quantiles = statistics.quantiles(timings, n=100)
+        print(
+            f"{mode:<6} {quantiles[49] * 1e6:>8.0f} {quantiles[98] * 1e6:>9.0f} "
+            f"{max(timings) * 1000:>8.1f} {total * 1000:>9.0f} {written / 1000:>11.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""Column projection: per row del / reinsert loops against Projection.result_set.
+
+    python benchmarks/bench_projection.py [--rows 50000] [--repeat 5]
+
+Each case runs the loop the route used before next to the Projection it
+declares now, checks both produce the same rows in the same column order
+and prints the median time and the peak traced memory of each. The loops
+edit the upstream dicts in place, the projection builds one tuple per row.
+"""
+
+import argparse
+import copy
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.projection import Projection
+
+
+def outofstock_row(i):
+    return {
+        "itemID": i,
+        "item_class": 2,
+        "item_subclass": 1,
+        "connectedRealmId": 3678,
+        "itemQuality": 4,
+        "itemName": f"Item name {i}",
+        "realmNames": "Thrall",
+        "salesPerDay": 4.5,
+        "avgPrice": 12000,
+        "link": f"https://saddlebagexchange.com/wow/item-data/{i}",
+    }
+
+
+def outofstock_loop(response):
+    for row in response:
+        del row["itemID"]
+        del row["item_class"]
+        del row["item_subclass"]
+        del row["connectedRealmId"]
+        del row["itemQuality"]
+    return response
+
+
+def petimport_row(i):
+    return {
+        "itemID": i,
+        "itemName": f"Item name {i}",
+        "lowestPriceRealmID": 3678,
+        "lowestPriceRealmName": "Thrall",
+        "lowestPrice": 1000,
+        "avgPrice": 1500,
+        "ROI": 50,
+        "salesPerDay": 2.5,
+        "link": f"https://saddlebagexchange.com/wow/item-data/{i}",
+        "undermineLink": f"https://undermine.exchange/#us-thrall/{i}",
+        "warcraftPetsLink": f"https://www.warcraftpets.com/search/?q={i}",
+    }
+
+
+def petimport_loop(response):
+    for row in response:
+        del row["itemID"]
+        del row["lowestPriceRealmID"]
+        realm = row["lowestPriceRealmName"]
+        del row["lowestPriceRealmName"]
+        row["lowestPriceRealmName"] = realm
+
+        link = row["link"]
+        del row["link"]
+        row["link"] = link
+
+        undermineLink = row["undermineLink"]
+        del row["undermineLink"]
+        row["undermineLink"] = undermineLink
+
+        warcraftPetsLink = row["warcraftPetsLink"]
+        del row["warcraftPetsLink"]
+        row["warcraftPetsLink"] = warcraftPetsLink
+    return response
+
+
+def megaitemnames_row(i):
+    return {
+        "itemID": i,
+        "itemName": f"Item name {i}",
+        "desiredPrice": i * 3,
+        "salesPerDay": 1.5,
+    }
+
+
+MEGA_ORDER = ["itemID", "desiredPrice", "itemName", "salesPerDay"]
+
+
+def megaitemnames_loop(response):
+    return [{key: item.get(key) for key in MEGA_ORDER} for item in response]
+
+
+# These mirror the declarations in app.py and routes/wow.py
+CASES = {
+    "wowoutofstock": (
+        outofstock_row,
+        outofstock_loop,
+        Projection(
+            drop=[
+                "itemID",
+                "item_class",
+                "item_subclass",
+                "connectedRealmId",
+                "itemQuality",
+            ]
+        ),
+    ),
+    "petimport": (
+        petimport_row,
+        petimport_loop,
+        Projection(
+            drop=["itemID", "lowestPriceRealmID"],
+            tail=["lowestPriceRealmName", "link", "undermineLink", "warcraftPetsLink"],
+        ),
+    ),
+    "megaitemnames": (
+        megaitemnames_row,
+        megaitemnames_loop,
+        Projection(columns=MEGA_ORDER),
+    ),
+}
+
+
+def measure(fn, make_input, repeat):
+    """Median seconds and peak traced bytes of fn(make_input())."""
+    samples = []
+    for _ in range(repeat):
+        data = make_input()
+        start = time.perf_counter()
+        fn(data)
+        samples.append(time.perf_counter() - start)
+    data = make_input()
+    tracemalloc.start()
+    fn(data)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return statistics.median(samples), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'case':<15} {'loop ms':>8} {'proj ms':>8} {'loop MB':>8} {'proj MB':>8}")
+    for name, (make_row, loop, projection) in CASES.items():
+        rows = [make_row(i) for i in range(args.rows)]
+
+        def make_input():
+            return copy.deepcopy(rows)
+
+        expected = loop(make_input())
+        actual = projection.result_set(make_input())
+        if actual.rows != [tuple(row.values()) for row in expected] or list(
+            actual.fieldnames
+        ) != list(expected[0]):
+            sys.exit(f"{name}: projection does not match the loop")
+
+        loop_time, loop_peak = measure(loop, make_input, args.repeat)
+        projection_time, projection_peak = measure(
+            projection.result_set, make_input, args.repeat
+        )
+        print(
+            f"{name:<15} {loop_time * 1000:>8.1f} {projection_time * 1000:>8.1f} "
+            f"{loop_peak / 2**20:>8.1f} {projection_peak / 2**20:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
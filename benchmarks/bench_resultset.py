@@ -0,0 +1,135 @@
+"""Dict rows against tuple ResultSet rows for the large result pages.
+
+    python benchmarks/bench_resultset.py [--rows 50000] [--repeat 5]
+
+For the /itemnames and /megaitemnames shapes this prints the memory held by
+the rows and the time to render the table with the old per template loop
+(row[fieldnames[index]] per cell) and with templates/_table.html.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from jinja2 import ChoiceLoader, DictLoader, Environment, FileSystemLoader
+
+from utils.projection import Projection
+from utils.resultset import ResultSet
+
+# the table body every result template carried before _table.html
+DICT_TABLE = """<table id="proxies">
+  <thead>
+    <tr>
+      {% for header in fieldnames %}
+        <th>{{header}}</th>
+      {% endfor %}
+    </tr>
+  </thead>
+  <tbody>
+    {% for row in results %}
+      <tr>
+        {% for index in range(0, len(fieldnames)) %}
+          <td>{{row[fieldnames[index]]}}</td>
+        {% endfor %}
+      </tr>
+    {% endfor %}
+  </tbody>
+</table>
+"""
+
+env = Environment(
+    loader=ChoiceLoader(
+        [
+            DictLoader({"dict_table.html": DICT_TABLE}),
+            FileSystemLoader(os.path.join(ROOT, "templates")),
+        ]
+    ),
+    autoescape=True,
+)
+
+
+MEGA_ORDER = ["itemID", "desiredPrice", "itemName", "salesPerDay"]
+MEGA_COLUMNS = Projection(columns=MEGA_ORDER)
+
+
+def itemnames_cases(rows):
+    """iter_pairs output, rows were built as dicts from it before."""
+    pairs = lambda: ((str(i), f"Item name {i}") for i in range(rows))
+    return (
+        lambda: [{"id": k, "name": v} for k, v in pairs()],
+        lambda: ResultSet(["id", "name"], pairs()),
+    )
+
+
+def megaitemnames_cases(rows):
+    upstream = lambda: (
+        {
+            "itemID": i,
+            "itemName": f"Item name {i}",
+            "desiredPrice": i * 3,
+            "salesPerDay": 1.5,
+        }
+        for i in range(rows)
+    )
+    return (
+        lambda: [{key: item.get(key) for key in MEGA_ORDER} for item in upstream()],
+        lambda: MEGA_COLUMNS.result_set(upstream()),
+    )
+
+
+def traced(build):
+    """Result of build() and the bytes still allocated for it afterwards."""
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def render_time(template, repeat, **context):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        template.render(**context)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    dict_template = env.get_template("dict_table.html")
+    tuple_template = env.get_template("_table.html")
+    print(f"{'page':<14} {'dict MB':>8} {'tuple MB':>8} {'dict ms':>8} {'tuple ms':>8}")
+    for name, cases in (
+        ("itemnames", itemnames_cases),
+        ("megaitemnames", megaitemnames_cases),
+    ):
+        build_dicts, build_results = cases(args.rows)
+        dicts, dict_size = traced(build_dicts)
+        results, tuple_size = traced(build_results)
+        dict_ms = render_time(
+            dict_template,
+            args.repeat,
+            results=dicts,
+            fieldnames=list(results.fieldnames),
+            len=len,
+        )
+        tuple_ms = render_time(tuple_template, args.repeat, results=results)
+        print(
+            f"{name:<14} {dict_size / 2**20:>8.1f} {tuple_size / 2**20:>8.1f} "
+            f"{dict_ms * 1000:>8.0f} {tuple_ms * 1000:>8.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""Latency, throughput and peak memory of every route, against the stub upstream.
+
+    python benchmarks/bench_routes.py [--requests 50] [--save baseline.json]
+    python benchmarks/bench_routes.py --compare baseline.json [--threshold 20]
+
+Drives app.py through the Flask test client, one request at a time, with
+every upstream (the Saddlebag API, Teamcraft items.json with its ETag and
+Universalis marketable) answered by benchmarks/stub_upstream.py. The
+response cache is cleared before each request so every search does its
+full work. The routes take turns over --rounds rounds. Peak memory is the tracemalloc peak of one more request per
+route, measured separately so tracing does not skew the timings.
+
+--save writes the results as JSON; --compare prints the change against
+such a file and exits with status 1 when a p50 got slower by more than
+--threshold percent.
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stub_upstream import app_env, start as start_stub
+
+OUTOFSTOCK_FORM = {
+    "region": "NA",
+    "salesPerDay": "0.2",
+    "avgPrice": "1000",
+    "minMarketValue": "100000",
+    "populationWP": "3000",
+    "populationBlizz": "1",
+    "rankingWP": "90",
+    "item_class": "-1",
+}
+BESTDEALS_FORM = {
+    "home_server": "Famfrit",
+    "discount": "50",
+    "medianPrice": "1000",
+    "salesAmount": "1",
+    "maxBuyPrice": "1000000",
+    "filters": "0",
+}
+PETIMPORT_FORM = {
+    "petsOnly": "False",
+    "region": "NA",
+    "homeRealmID": "3678",
+    "ROI": "50",
+    "avgPrice": "100",
+    "maxPurchasePrice": "1000000",
+    "profitAmount": "1000",
+    "salesPerDay": "0.1",
+}
+
+# name -> (method, path, form)
+SCENARIOS = {
+    "GET /": ("GET", "/", None),
+    "GET /wowoutofstock": ("GET", "/wowoutofstock", None),
+    "POST /wowoutofstock": ("POST", "/wowoutofstock", OUTOFSTOCK_FORM),
+    "POST /wowoutofstock batch": (
+        "POST",
+        "/wowoutofstock",
+        dict(OUTOFSTOCK_FORM, region=["NA", "EU"], item_class=["2", "4"]),
+    ),
+    "POST /itemnames": ("POST", "/itemnames", {}),
+    # once the other searches push its table out of the cache, the page is
+    # rebuilt by replaying the search, like in production
+    "GET /tables page": ("GET", None, None),
+    "POST /megaitemnames": (
+        "POST",
+        "/megaitemnames",
+        {"region": "NA", "discount": "70"},
+    ),
+    "POST /ffxivbestdeals": ("POST", "/ffxivbestdeals", BESTDEALS_FORM),
+    "POST /petimport": ("POST", "/petimport", PETIMPORT_FORM),
+    "POST /ffxiv_itemnames": ("POST", "/ffxiv_itemnames", {}),
+}
+
+TABLE_URL = re.compile(rb'"ajax": "(/tables/[^"]+)"')
+
+
+def setup():
+    stub, url = start_stub()
+    os.environ.update(app_env(url))
+    os.environ.update(
+        # NO_RATE_LIMIT would also skip the sanitizer, a bucket that never
+        # runs out keeps the limiter and sanitizer costs in the numbers
+        RATE_LIMIT_RATE="1e9",
+        RATE_LIMIT_BURST="1e9",
+        INSTRUMENTATION="none",
+        METRICS_ENABLED="false",
+        # revalidate items.json on every request, the stub answers 304
+        ITEM_NAMES_REVALIDATE_SECONDS="0",
+        ITEM_NAMES_CACHE_DIR=tempfile.mkdtemp(prefix="bench-routes-"),
+        TEMPLATE_CACHE_DIR="",
+    )
+    import logging
+
+    import app
+    from utils.cache import response_cache
+
+    logging.disable(logging.WARNING)
+    return stub, app.app.test_client(), response_cache
+
+
+def request_for(client, name):
+    method, path, form = SCENARIOS[name]
+    if path is None:
+        # first page of the server side table a large /itemnames search leaves
+        page = client.post("/itemnames", data={}).get_data()
+        path = TABLE_URL.search(page).group(1).decode()
+        path += "?draw=1&start=0&length=100&order[0][column]=1&order[0][dir]=asc"
+    if method == "GET":
+        return lambda: client.get(path, headers={"Accept-Encoding": "gzip"})
+    return lambda: client.post(path, data=form, headers={"Accept-Encoding": "gzip"})
+
+
+def measure(send, clear_cache, requests):
+    latencies = []
+    for _ in range(requests):
+        clear_cache()
+        start = time.perf_counter()
+        response = send()
+        response.get_data()
+        response.close()
+        latencies.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            raise RuntimeError(f"status {response.status_code}")
+    return latencies
+
+
+def peak_memory(send, clear_cache):
+    clear_cache()
+    tracemalloc.start()
+    send().close()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def summarize(latencies, peak):
+    quantiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "p50": quantiles[49],
+        "p95": quantiles[94],
+        "p99": quantiles[98],
+        "throughput": len(latencies) / sum(latencies),
+        "peak_bytes": peak,
+    }
+
+
+def compare(results, baseline, threshold):
+    print(
+        f"\n{'vs baseline':<26} {'p50':>8} {'p95':>8} {'p99':>8} "
+        f"{'req/s':>8} {'peak':>8}"
+    )
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            print(f"{name:<26} {'new':>8}")
+            continue
+        changes = {
+            key: (result[key] / before[key] - 1) * 100 if before[key] else 0.0
+            for key in ("p50", "p95", "p99", "throughput", "peak_bytes")
+        }
+        print(f"{name:<26} " + " ".join(f"{changes[key]:>+7.1f}%" for key in changes))
+        if changes["p50"] > threshold:
+            regressions.append(name)
+    if regressions:
+        print(f"\np50 more than {threshold}% slower: {', '.join(regressions)}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--only", action="append", help="scenario name, repeatable")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON written by --save")
+    parser.add_argument("--threshold", type=float, default=20.0)
+    args = parser.parse_args()
+
+    stub, client, response_cache = setup()
+    print(
+        f"{'route':<26} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+        f"{'req/s':>8} {'peak MB':>8}"
+    )
+    names = args.only or list(SCENARIOS)
+    senders = {name: request_for(client, name) for name in names}
+    for name in names:
+        measure(senders[name], response_cache.clear, args.warmup)
+
+    # the routes take turns so a noisy neighbour hits all of them alike
+    latencies = {name: [] for name in names}
+    for round in range(args.rounds):
+        for name in names:
+            latencies[name] += measure(
+                senders[name], response_cache.clear, args.requests // args.rounds
+            )
+
+    results = {}
+    for name in names:
+        result = summarize(
+            latencies[name], peak_memory(senders[name], response_cache.clear)
+        )
+        results[name] = result
+        print(
+            f"{name:<26} {result['p50'] * 1000:>8.1f} {result['p95'] * 1000:>8.1f} "
+            f"{result['p99'] * 1000:>8.1f} {result['throughput']:>8.1f} "
+            f"{result['peak_bytes'] / 1e6:>8.1f}"
+        )
+    stub.shutdown()
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
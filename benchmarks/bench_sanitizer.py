@@ -0,0 +1,83 @@
+"""Benchmark of the two return_safe_html engines on the live result pages.
+
+    python benchmarks/bench_sanitizer.py [--repeat 5]
+
+The pages are rendered from a ResultSet like the routes do, each one is
+checked to carry the expected number of table cells before it is timed.
+tests/test_security.py checks that the tokenizer output matches the lxml
+round trip.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+from lxml import html as lxml_html
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from flask import Flask, render_template
+
+from utils.resultset import ResultSet
+from utils.security import HtmlStreamSanitizer, lxml_safe_html
+
+# template -> fieldnames used for the rows, these are the live result pages
+TABLE_TEMPLATES = {
+    "itemnames.html": ["id", "name"],
+    "megaitemnames.html": ["itemID", "desiredPrice", "itemName", "salesPerDay"],
+    "wow_outofstock.html": ["itemName", "realmNames", "salesPerDay", "link"],
+}
+
+app = Flask(__name__, template_folder=os.path.join(ROOT, "templates"))
+
+
+def render_page(template, rows):
+    fieldnames = TABLE_TEMPLATES[template]
+    results = ResultSet(
+        fieldnames, [tuple(f"{name} {i}" for name in fieldnames) for i in range(rows)]
+    )
+    with app.test_request_context(f"/{template}", method="POST"):
+        page = render_template(template, results=results)
+    cells = len(lxml_html.document_fromstring(page).xpath("//tbody/tr/td"))
+    if cells != rows * len(fieldnames):
+        sys.exit(f"{template}: {cells} table cells, expected {rows * len(fieldnames)}")
+    return page
+
+
+def tokenizer_safe_html(markup):
+    sanitizer = HtmlStreamSanitizer()
+    return sanitizer.feed(markup) + sanitizer.close()
+
+
+def benchmark(repeat):
+    print(f"{'page':<24} {'rows':>6} {'KB':>7} {'lxml ms':>8} {'tok ms':>8} {'x':>5}")
+    for template in TABLE_TEMPLATES:
+        for rows in (100, 1000, 10000):
+            page = render_page(template, rows)
+            timings = {}
+            for engine, fn in (("lxml", lxml_safe_html), ("tok", tokenizer_safe_html)):
+                samples = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    fn(page)
+                    samples.append(time.perf_counter() - start)
+                timings[engine] = statistics.median(samples) * 1000
+            print(
+                f"{template:<24} {rows:>6} {len(page) / 1024:>7.0f} "
+                f"{timings['lxml']:>8.2f} {timings['tok']:>8.2f} "
+                f"{timings['lxml'] / timings['tok']:>5.1f}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    benchmark(args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""Werkzeug development server against the gunicorn production entry point.
+
+    python benchmarks/bench_serving.py [--clients 32] [--duration 20]
+
+Both servers run app.py as a subprocess against the local stub upstream.
+Closed loop clients (each sends its next request as soon as the previous
+answer arrives) cycle through a mix of two static pages and a result page.
+The script prints throughput and latency percentiles per server.
+"""
+
+import argparse
+import http.client
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import stub_upstream
+
+OUTOFSTOCK_FORM = {
+    "region": "NA",
+    "salesPerDay": "0.2",
+    "avgPrice": "1000",
+    "minMarketValue": "100000",
+    "populationWP": "3000",
+    "populationBlizz": "1",
+    "rankingWP": "90",
+    "item_class": "-1",
+}
+
+MIX = [
+    ("GET", "/", None),
+    ("POST", "/wowoutofstock", OUTOFSTOCK_FORM),
+    ("GET", "/wowoutofstock", None),
+]
+
+DEV_SERVER = (
+    "import sys; sys.path.insert(0, {root!r}); import app; "
+    "app.app.run(host='127.0.0.1', port={port})"
+)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server on port {port} did not start")
+
+
+def client(port, stop, latencies, errors, offset):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    i = offset
+    while not stop.is_set():
+        method, path, form = MIX[i % len(MIX)]
+        i += 1
+        body = urlencode(form) if form else None
+        headers = {"Content-Type": "application/x-www-form-urlencoded"} if form else {}
+        start = time.perf_counter()
+        try:
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                errors.append(response.status)
+            elif response.getheader("Connection", "").lower() == "close":
+                connection.close()
+        except (OSError, http.client.HTTPException) as exc:
+            errors.append(type(exc).__name__)
+            connection.close()
+            continue
+        latencies.append(time.perf_counter() - start)
+    connection.close()
+
+
+def load(port, clients, duration):
+    stop = threading.Event()
+    latencies, errors = [], []
+    threads = [
+        threading.Thread(target=client, args=(port, stop, latencies, errors, i))
+        for i in range(clients)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return latencies, errors
+
+
+def report(name, latencies, errors, duration):
+    latencies.sort()
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(
+        f"{name:<10} {len(latencies) / duration:>8.1f} "
+        f"{quantiles[49] * 1000:>8.0f} {quantiles[94] * 1000:>8.0f} "
+        f"{quantiles[98] * 1000:>8.0f} {len(errors):>8}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--warmup", type=float, default=3)
+    args = parser.parse_args()
+
+    stub, stub_url = stub_upstream.start()
+    env = dict(
+        os.environ,
+        TEMP_API_URL=f"{stub_url}/api",
+        SECRET_KEY="benchmark",
+        # one client address, one bucket that never runs out. NO_RATE_LIMIT
+        # would also turn off the sanitizer
+        RATE_LIMIT_RATE="1e9",
+        RATE_LIMIT_BURST="1e9",
+        RATE_LIMIT_PER_WORKER="true",
+        INSTRUMENTATION=os.getenv("INSTRUMENTATION", "none"),
+        SERVER_SIDE_TABLES="false",
+    )
+
+    columns = ("req/s", "p50 ms", "p95 ms", "p99 ms", "errors")
+    print(f"{'server':<10}" + "".join(f" {column:>8}" for column in columns))
+    for name in ("werkzeug", "gunicorn"):
+        port = free_port()
+        if name == "werkzeug":
+            command = [
+                sys.executable,
+                "-c",
+                DEV_SERVER.format(root=ROOT, port=port),
+            ]
+        else:
+            command = [
+                sys.executable,
+                "-m",
+                "gunicorn",
+                "--config",
+                "gunicorn.conf.py",
+                "--bind",
+                f"127.0.0.1:{port}",
+                "app:app",
+            ]
+        server = subprocess.Popen(
+            command,
+            cwd=ROOT,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            wait_until_up(port)
+            load(port, args.clients, args.warmup)
+            latencies, errors = load(port, args.clients, args.duration)
+            report(name, latencies, errors, args.duration)
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=60)
+    stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
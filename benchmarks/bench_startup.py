@@ -0,0 +1,73 @@
+"""Import-to-first-response time for each instrumentation backend.
+
+    python benchmarks/bench_startup.py [--runs 5] [--requests 500]
+
+Every run is a fresh interpreter that imports app.py, serves GET / through
+the test client and then times --requests more GETs of the same cached
+page, so the per request overhead of the backend shows up too. No
+Datadog agent is needed, the datadog mode simply fails to export.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {root!r})
+import app
+client = app.app.test_client()
+assert client.get("/").status_code == 200
+first = time.perf_counter() - start
+start = time.perf_counter()
+for _ in range({requests}):
+    client.get("/")
+per_request = (time.perf_counter() - start) / {requests}
+print(json.dumps({{"first": first, "per_request": per_request}}))
+"""
+
+
+def run(mode, requests):
+    env = dict(
+        os.environ,
+        INSTRUMENTATION=mode,
+        SECRET_KEY="benchmark",
+        # the limiter and sanitizer stay on, their import and per request
+        # cost is part of startup. The bucket just never runs out
+        RATE_LIMIT_RATE="1e9",
+        RATE_LIMIT_BURST="1e9",
+        DD_TRACE_STARTUP_LOGS="false",
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD.format(root=ROOT, requests=requests)],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=ROOT,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    print(f"{'mode':<8} {'first response ms':>18} {'per request us':>15}")
+    for mode in ("none", "datadog"):
+        results = [run(mode, args.requests) for _ in range(args.runs)]
+        first = statistics.median(result["first"] for result in results)
+        per_request = statistics.median(result["per_request"] for result in results)
+        print(f"{mode:<8} {first * 1000:>18.0f} {per_request * 1e6:>15.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+"""Closed loop load test of one pod over a sweep of concurrency levels.
+
+    python benchmarks/loadtest.py [--levels 1,2,4,8,16,32,64] [--duration 20]
+        [--server gunicorn|werkzeug | --url http://host:port] [--report loadtest.json]
+
+Starts the app (gunicorn with gunicorn.conf.py unless told otherwise) against
+benchmarks/stub_upstream.py, then for every level runs that many clients,
+each sending its next request as soon as the previous answer arrives. The
+traffic is a weighted mix of static pages, favicon, openapi-spec.json and
+search POSTs (see MIX). Per level it records throughput and latency
+percentiles, overall and per request type, and the CPU share and RSS of
+every server process read from /proc. The report is JSON, the table on
+stdout is the same numbers.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.stub_upstream import app_env, start as start_stub
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def _outofstock_form(rng):
+    # a different search each time, so the response cache only helps as much
+    # as it would with real users
+    return {
+        "region": rng.choice(["NA", "EU"]),
+        "salesPerDay": "0.2",
+        "avgPrice": str(rng.randrange(100, 5000)),
+        "minMarketValue": "100000",
+        "populationWP": "3000",
+        "populationBlizz": "1",
+        "rankingWP": "90",
+        "item_class": "-1",
+    }
+
+
+def _bestdeals_form(rng):
+    return {
+        "home_server": "Famfrit",
+        "discount": str(rng.randrange(30, 90)),
+        "medianPrice": "1000",
+        "salesAmount": "1",
+        "maxBuyPrice": "1000000",
+        "filters": "0",
+    }
+
+
+# name -> (weight, method, path, form factory)
+MIX = {
+    "static": (30, "GET", "/", None),
+    "static search page": (15, "GET", "/wowoutofstock", None),
+    "favicon": (15, "GET", "/favicon.ico", None),
+    "openapi": (10, "GET", "/openapi-spec.json", None),
+    "outofstock search": (15, "POST", "/wowoutofstock", _outofstock_form),
+    "ffxivbestdeals search": (5, "POST", "/ffxivbestdeals", _bestdeals_form),
+    "itemnames search": (5, "POST", "/itemnames", lambda rng: {}),
+    "megaitemnames search": (
+        5,
+        "POST",
+        "/megaitemnames",
+        lambda rng: {"region": "NA", "discount": str(rng.randrange(50, 90))},
+    ),
+}
+
+DEV_SERVER = (
+    "import sys; sys.path.insert(0, {root!r}); import app; "
+    "app.app.run(host='127.0.0.1', port={port}, threaded=True)"
+)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(host, port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server on port {port} did not start")
+
+
+def start_server(kind, env):
+    port = free_port()
+    if kind == "werkzeug":
+        command = [sys.executable, "-c", DEV_SERVER.format(root=ROOT, port=port)]
+    else:
+        command = [
+            sys.executable,
+            "-m",
+            "gunicorn",
+            "--config",
+            "gunicorn.conf.py",
+            "--bind",
+            f"127.0.0.1:{port}",
+            "app:app",
+        ]
+    server = subprocess.Popen(
+        command,
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    wait_until_up("127.0.0.1", port)
+    return server, f"http://127.0.0.1:{port}"
+
+
+def process_tree(pid):
+    """pid and every descendant, read from /proc."""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as file:
+                    ppid = int(file.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+    tree, todo = [], [pid]
+    while todo:
+        current = todo.pop()
+        tree.append(current)
+        todo.extend(children.get(current, []))
+    return tree
+
+
+def process_sample(pid):
+    """(cpu seconds, rss bytes) of one process, None once it is gone."""
+    try:
+        with open(f"/proc/{pid}/stat") as file:
+            fields = file.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    # utime and stime are fields 14 and 15, rss 24 (1 based, before the split)
+    cpu = (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+    return cpu, int(fields[21]) * PAGE_SIZE
+
+
+def client(url, stop, samples, seed):
+    rng = random.Random(seed)
+    names = list(MIX)
+    weights = [MIX[name][0] for name in names]
+    parts = urlsplit(url)
+    connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=120)
+    while not stop.is_set():
+        name = rng.choices(names, weights)[0]
+        _, method, path, form = MIX[name]
+        body = urlencode(form(rng)) if form else None
+        headers = {"Accept-Encoding": "gzip"}
+        if body is not None:
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        start = time.perf_counter()
+        try:
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            ok = response.status == 200
+            if response.getheader("Connection", "").lower() == "close":
+                connection.close()
+        except (OSError, http.client.HTTPException):
+            ok = False
+            connection.close()
+        samples.append((name, time.perf_counter() - start, ok))
+    connection.close()
+
+
+def percentiles(latencies):
+    if len(latencies) < 2:
+        value = latencies[0] if latencies else 0.0
+        return {"p50": value, "p95": value, "p99": value}
+    quantiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {"p50": quantiles[49], "p95": quantiles[94], "p99": quantiles[98]}
+
+
+def run_level(url, concurrency, duration, warmup, server_pid):
+    stop = threading.Event()
+    samples = []
+    threads = [
+        threading.Thread(target=client, args=(url, stop, samples, seed), daemon=True)
+        for seed in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(warmup)
+
+    pids = process_tree(server_pid) if server_pid else []
+    before = {pid: process_sample(pid) for pid in pids}
+    del samples[:]
+    start = time.perf_counter()
+    time.sleep(duration)
+    elapsed = time.perf_counter() - start
+    measured = list(samples)
+    after = {pid: process_sample(pid) for pid in pids}
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    workers = []
+    for pid in pids:
+        if before[pid] is None or after[pid] is None:
+            continue
+        workers.append(
+            {
+                "pid": pid,
+                "role": "master" if pid == server_pid else "worker",
+                "cpu_percent": (after[pid][0] - before[pid][0]) / elapsed * 100,
+                "rss_mb": after[pid][1] / 1e6,
+            }
+        )
+
+    good = [latency for _, latency, ok in measured if ok]
+    level = {
+        "concurrency": concurrency,
+        "requests": len(measured),
+        "errors": len(measured) - len(good),
+        "throughput": len(good) / elapsed,
+        **percentiles(good),
+        "by_request": {},
+        "processes": workers,
+    }
+    for name in MIX:
+        latencies = [latency for kind, latency, ok in measured if kind == name and ok]
+        level["by_request"][name] = {
+            "requests": len(latencies),
+            "throughput": len(latencies) / elapsed,
+            **percentiles(latencies),
+        }
+    return level
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--levels", default="1,2,4,8,16,32,64")
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--warmup", type=float, default=3)
+    parser.add_argument(
+        "--server", choices=["gunicorn", "werkzeug"], default="gunicorn"
+    )
+    parser.add_argument("--url", help="load an already running server instead")
+    parser.add_argument("--report", default="loadtest.json")
+    args = parser.parse_args()
+    levels = [int(level) for level in args.levels.split(",")]
+
+    stub = server = None
+    url = args.url
+    if url is None:
+        stub, stub_url = start_stub()
+        env = dict(
+            os.environ,
+            **app_env(stub_url),
+            # every client comes from 127.0.0.1, so one bucket that never
+            # runs out. NO_RATE_LIMIT would also turn off the sanitizer
+            RATE_LIMIT_RATE="1e9",
+            RATE_LIMIT_BURST="1e9",
+            RATE_LIMIT_PER_WORKER="true",
+            INSTRUMENTATION=os.getenv("INSTRUMENTATION", "none"),
+        )
+        server, url = start_server(args.server, env)
+
+    print(
+        f"{'clients':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+        f"{'errors':>7} {'cpu %':>7} {'rss MB':>8}"
+    )
+    report_levels = []
+    try:
+        for concurrency in levels:
+            level = run_level(
+                url,
+                concurrency,
+                args.duration,
+                args.warmup,
+                server.pid if server else None,
+            )
+            report_levels.append(level)
+            cpu = sum(process["cpu_percent"] for process in level["processes"])
+            rss = sum(process["rss_mb"] for process in level["processes"])
+            print(
+                f"{concurrency:>7} {level['throughput']:>8.1f} "
+                f"{level['p50'] * 1000:>8.1f} {level['p95'] * 1000:>8.1f} "
+                f"{level['p99'] * 1000:>8.1f} {level['errors']:>7} "
+                f"{cpu:>7.0f} {rss:>8.0f}"
+            )
+    finally:
+        if server is not None:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=60)
+        if stub is not None:
+            stub.shutdown()
+
+    best = max(report_levels, key=lambda level: level["throughput"])
+    report = {
+        "server": args.url or args.server,
+        "cpus": len(os.sched_getaffinity(0)),
+        "duration": args.duration,
+        "mix": {name: weight for name, (weight, *_) in MIX.items()},
+        "levels": report_levels,
+        "peak_throughput": {
+            "concurrency": best["concurrency"],
+            "throughput": best["throughput"],
+        },
+    }
+    with open(args.report, "w") as file:
+        json.dump(report, file, indent=2)
+    print(
+        f"peak {best['throughput']:.1f} req/s at {best['concurrency']} clients, "
+        f"report in {args.report}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+"""Local stand-in for the upstream APIs so benchmarks never leave the machine.
+
+Run it on its own with `python benchmarks/stub_upstream.py --port 8900` and
+point the app at it with the environment printed on start, or start it from
+a benchmark with `start()` and use `app_env(url)`.
+
+Bodies are generated at realistic sizes. A recorded body in
+benchmarks/fixtures/<name>.json (see `--record`) is replayed instead.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _itemnames(rows):
+    return {str(i): f"Item name {i}" for i in range(rows)}
+
+
+def _megaitemnames(rows):
+    return [
+        {
+            "itemID": i,
+            "itemName": f"Item name {i}",
+            "desiredPrice": i * 3,
+            "salesPerDay": 1.5,
+        }
+        for i in range(rows)
+    ]
+
+
+def _outofstock(rows):
+    return {
+        "data": [
+            {
+                "itemID": i,
+                "item_class": 2,
+                "item_subclass": 1,
+                "connectedRealmId": 3678,
+                "itemQuality": 4,
+                "itemName": f"Item name {i}",
+                "realmNames": "Thrall",
+                "salesPerDay": 4.5,
+                "avgPrice": 12000,
+                "link": f"https://saddlebagexchange.com/wow/item-data/{i}",
+            }
+            for i in range(rows)
+        ]
+    }
+
+
+def _bestdeals(rows):
+    return {
+        "data": [
+            {
+                "itemID": i,
+                "itemName": f"Item name {i}",
+                "worldName": "Famfrit",
+                "discountHQ": 45,
+                "discountNQ": 60,
+                "minPriceHQ": 1200,
+                "minPrice": 900,
+                "medianHQ": 2500,
+                "medianNQ": 2100,
+                "salesAmountHQ": 12,
+                "salesAmountNQ": 30,
+                "quantitySoldHQ": 14,
+                "quantitySoldNQ": 95,
+                "averageHQ": 2400,
+                "averageNQ": 2000,
+                "mainCategory": "Crafting",
+                "subCategory": "Ingredient",
+                "itemData": f"https://saddlebagexchange.com/queries/item-data/{i}",
+                "uniLink": f"https://universalis.app/market/{i}",
+                "lastUploadTime": "2024-10-01 12:00:00",
+            }
+            for i in range(rows)
+        ]
+    }
+
+
+def _petimport(rows):
+    return {
+        "data": [
+            {
+                "itemID": i,
+                "itemName": f"Pet name {i}",
+                "lowestPrice": 15000 + i,
+                "lowestPriceRealmID": 3678,
+                "lowestPriceRealmName": "Thrall",
+                "homeMinPrice": 30000,
+                "avgTSMPrice": 28000,
+                "profit": 15000 - i,
+                "ROI": 100,
+                "salesPerDay": 0.8,
+                "link": f"https://saddlebagexchange.com/wow/item-data/{i}",
+                "undermineLink": f"https://undermine.exchange/#us-thrall/82800-{i}",
+                "warcraftPetsLink": f"https://www.warcraftpets.com/search/?q={i}",
+            }
+            for i in range(rows)
+        ]
+    }
+
+
+def _teamcraft_items(rows):
+    return {
+        str(i): {
+            "en": f"Item name {i}",
+            "de": f"Gegenstand {i}",
+            "ja": f"\u30a2\u30a4\u30c6\u30e0{i}",
+            "fr": f"Objet {i}",
+        }
+        for i in range(1, rows + 1)
+    }
+
+
+def _marketable(rows):
+    # every other item is on the market board
+    return list(range(1, rows * 2, 2))
+
+
+# upstream path suffix -> (generator, default row count), the longest
+# matching suffix wins
+ROUTES = {
+    "/wow/itemnames": (_itemnames, 20000),
+    "/wow/megaitemnames": (_megaitemnames, 20000),
+    "/wow/outofstock": (_outofstock, 500),
+    "/bestdeals": (_bestdeals, 2000),
+    "/api/wow/import": (_petimport, 3000),
+    "/items.json": (_teamcraft_items, 45000),
+    "/marketable": (_marketable, 16000),
+}
+# answered with an ETag and 304 when the client sends it back, like GitHub
+ETAG_ROUTES = {"/items.json"}
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# what --record fetches from the real services, suffix -> (method, url, payload)
+RECORD = {
+    "/wow/itemnames": (
+        "POST",
+        "http://api.saddlebagexchange.com/api/wow/itemnames",
+        {},
+    ),
+    "/wow/megaitemnames": (
+        "POST",
+        "http://api.saddlebagexchange.com/api/wow/megaitemnames",
+        {"region": "NA", "discount": 1},
+    ),
+    "/wow/outofstock": (
+        "POST",
+        "http://api.saddlebagexchange.com/api/wow/outofstock",
+        {
+            "region": "NA",
+            "salesPerDay": 0.1,
+            "avgPrice": 100,
+            "minMarketValue": 10000,
+            "populationWP": 1000,
+            "populationBlizz": 1,
+            "rankingWP": 90,
+            "includeCategories": [],
+            "excludeCategories": [],
+        },
+    ),
+    "/bestdeals": (
+        "POST",
+        "http://api.saddlebagexchange.com/api/bestdeals",
+        {
+            "home_server": "Famfrit",
+            "discount": 50,
+            "medianPrice": 1000,
+            "salesAmount": 1,
+            "maxBuyPrice": 1000000,
+            "filters": [0],
+        },
+    ),
+    "/api/wow/import": (
+        "POST",
+        "http://api.saddlebagexchange.com/api/api/wow/import",
+        {
+            "region": "NA",
+            "homeRealmID": 3678,
+            "ROI": 50,
+            "avgPrice": 100,
+            "maxPurchasePrice": 1000000,
+            "profitAmount": 1000,
+            "salesPerDay": 0.1,
+            "includeCategories": [],
+            "excludeCategories": [],
+            "sortBy": "lowestPrice",
+            "petsOnly": False,
+            "connectedRealmIDs": {},
+        },
+    ),
+    "/items.json": (
+        "GET",
+        "https://raw.githubusercontent.com/ffxiv-teamcraft/ffxiv-teamcraft/staging/libs/data/src/lib/json/items.json",
+        None,
+    ),
+    "/marketable": ("GET", "https://universalis.app/api/marketable", None),
+}
+
+
+def _fixture_path(suffix):
+    return os.path.join(FIXTURE_DIR, suffix.strip("/").replace("/", "_") + ".json")
+
+
+def _body(suffix, rows):
+    path = _fixture_path(suffix)
+    if os.path.exists(path):
+        with open(path, "rb") as file:
+            return file.read()
+    generator, default_rows = ROUTES[suffix]
+    return json.dumps(generator(rows.get(suffix, default_rows))).encode()
+
+
+def record():
+    """Save the current real answer of every upstream as a fixture."""
+    import requests
+
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    for suffix, (method, url, payload) in RECORD.items():
+        response = requests.request(method, url, json=payload, timeout=120)
+        response.raise_for_status()
+        with open(_fixture_path(suffix), "wb") as file:
+            file.write(response.content)
+        print(f"{suffix}: {len(response.content)} bytes")
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # the default backlog of 5 resets connections under benchmark bursts
+    request_queue_size = 1024
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    delay = 0.0
+    rows = {}
+    bodies = {}
+    calls = {}
+
+    def _respond(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        path = self.path.split("?")[0].rstrip("/")
+        StubHandler.calls[path] = StubHandler.calls.get(path, 0) + 1
+        suffix = max(
+            (suffix for suffix in ROUTES if path.endswith(suffix)),
+            key=len,
+            default=None,
+        )
+        body = self.bodies.get(suffix)
+        if body is None and suffix is not None:
+            body = self.bodies[suffix] = _body(suffix, self.rows)
+        if self.delay:
+            time.sleep(self.delay)
+        if body is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        etag = None
+        if suffix in ETAG_ROUTES:
+            etag = f'"{hashlib.md5(body).hexdigest()}"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if etag:
+            self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = _respond
+    do_POST = _respond
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start(port=0, delay=0.0, rows=None):
+    """Serve the stub in a daemon thread, returns (server, base_url).
+
+    `rows` overrides the default row count per route suffix.
+    """
+    handler = type(
+        "Handler", (StubHandler,), {"delay": delay, "rows": rows or {}, "bodies": {}}
+    )
+    server = StubServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def app_env(url):
+    """Environment pointing every upstream the app uses at the stub on `url`,
+    with the SECRET_KEY the app refuses to start without."""
+    return {
+        "SECRET_KEY": "benchmark",
+        "TEMP_API_URL": f"{url}/api",
+        "TEAMCRAFT_ITEMS_URL": f"{url}/teamcraft/items.json",
+        "UNIVERSALIS_API_URL": f"{url}/universalis",
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--delay", type=float, default=0.0)
+    parser.add_argument(
+        "--record",
+        action="store_true",
+        help=f"fetch the real upstream answers into {FIXTURE_DIR} and exit",
+    )
+    args = parser.parse_args()
+    if args.record:
+        record()
+        raise SystemExit
+    server, url = start(args.port, args.delay)
+    print(f"stub upstream listening on {url}")
+    for name, value in app_env(url).items():
+        print(f"{name}={value}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,134 @@
+# Production server settings, used by the Dockerfile:
+#   gunicorn --config gunicorn.conf.py app:app
+# `python app.py` still starts the Werkzeug development server for local work.
+import math
+import os
+import shutil
+
+
+def _cgroup_cpu_limit():
+    """CPUs the container's cgroup quota allows, None when there is no quota."""
+    try:
+        # cgroup v2: "<quota> <period>" or "max <period>"
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota == "max":
+            return None
+        return int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+    except (OSError, ValueError):
+        return None
+    return quota / period if quota > 0 else None
+
+
+# CPUs assumed when the pod has no CPU limit. It could then be placed on a
+# node of any size, and 2 * 16 + 1 workers of ~250MB each would not fit
+# the memory a pod of this app is given
+UNLIMITED_CPUS = 2
+
+
+def _cpu_count():
+    # honours the CPU set the container is pinned to, unlike os.cpu_count(),
+    # and the CPU limit of the pod, which the CPU set does not show
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    limit = _cgroup_cpu_limit()
+    if limit is None:
+        return min(cpus, UNLIMITED_CPUS)
+    return min(cpus, max(1, math.ceil(limit)))
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+# pre-forked workers, each serving requests from a small thread pool so a
+# worker waiting on the upstream API does not hold up the others.
+# WEB_CONCURRENCY sets the worker count outright, otherwise it follows the
+# CPUs the pod may use (resources.limits.cpu in kube-manifest-fe.yml).
+# Memory: a fresh worker is ~40MB RSS, only ~8MB of it private thanks to
+# preload_app. Each worker fills its own response cache
+# (RESPONSE_CACHE_MAX_BYTES, 64MB) and result tables (TABLE_CACHE_ENTRIES,
+# 16), which took one to ~240MB RSS under a long search mix. Budget about
+# 250MB per worker against the pod's memory limit, or shrink those caches
+worker_class = "gthread"
+workers = int(
+    os.getenv("WEB_CONCURRENCY")
+    or os.getenv("WEB_WORKERS")
+    or str(_cpu_count() * 2 + 1)
+)
+threads = int(os.getenv("WEB_THREADS", "4"))
+
+# memory:// rate limit buckets live in one worker, with several workers a
+# client gets a full burst from each. Share them through Redis
+# (RATE_LIMIT_STORAGE, see kube-manifest-fe.yml), or set
+# RATE_LIMIT_PER_WORKER=true where that does not matter (benchmarks)
+if (
+    workers > 1
+    and not os.getenv("NO_RATE_LIMIT")
+    and os.getenv("RATE_LIMIT_STORAGE", "memory://").startswith("memory:")
+    and os.getenv("RATE_LIMIT_PER_WORKER", "").lower() not in ("true", "1", "yes")
+):
+    raise RuntimeError(
+        f"{workers} workers would each keep their own memory:// rate limit "
+        "buckets, set RATE_LIMIT_STORAGE to a redis:// URL"
+    )
+
+# import app.py (templates, projections, item names) once in the master and
+# fork the workers from it so they share that memory copy-on-write. Anything
+# that opens connections or starts threads at import has to be fork aware
+# (ddtrace is, the upstream sessions and pools are created lazily).
+preload_app = True
+
+# on SIGTERM stop accepting, let in flight requests finish, then exit. Keep
+# this below the orchestrator's grace period (30s by default on Kubernetes)
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "25"))
+timeout = int(os.getenv("WORKER_TIMEOUT", "60"))
+keepalive = int(os.getenv("KEEPALIVE", "5"))
+
+# recycle workers now and then so a slow leak can not grow forever
+max_requests = int(os.getenv("MAX_REQUESTS", "5000"))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", "500"))
+
+# each worker writes its metrics here and /metrics on any of them reports
+# the sum over the pod, see utils/metrics.py
+os.environ.setdefault("METRICS_DIR", "/tmp/temp-fe-metrics")
+
+
+def on_starting(server):
+    # values of an earlier run of the container would count twice
+    shutil.rmtree(os.environ["METRICS_DIR"], ignore_errors=True)
+    os.makedirs(os.environ["METRICS_DIR"])
+
+
+def when_ready(server):
+    # runs in the master once app.py is loaded and before any worker is
+    # forked, so every worker starts with the FFXIV item names in memory
+    # instead of each downloading items.json on its first /ffxiv_itemnames
+    from utils.teamcraft import preload_item_names
+
+    preload_item_names()
+
+
+def post_fork(server, worker):
+    from utils import metrics
+
+    metrics.start_worker()
+
+
+def worker_exit(server, worker):
+    from utils import metrics
+
+    metrics.stop_worker()
+
+
+def child_exit(server, worker):
+    from utils import metrics
+
+    metrics.retire_worker(worker.pid)
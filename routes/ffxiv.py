@@ -1,41 +1,58 @@
-from flask import Blueprint, render_template, request
-import requests
+from flask import Blueprint, request
+import logging
 import os
-from utils.security import return_safe_html
+from utils.deadline import DeadlineExceeded
+from utils.fanout import fan_out
+from utils.ratelimit import request_cost
+from utils.rendering import render_results
+from utils.resultset import ResultSet
+from utils.static_pages import static_template
+from utils.tables import table_view
+from utils.teamcraft import get_item_names
+from utils.upstream import get_json
 
 api_url = os.getenv("TEMP_API_URL", "http://api.saddlebagexchange.com/api")
+universalis_url = os.getenv("UNIVERSALIS_API_URL", "https://universalis.app/api")
+
+logger = logging.getLogger(__name__)
 
 ffxiv_bp = Blueprint("ffxiv", __name__)
 
 
 @ffxiv_bp.route("/ffxiv", methods=["GET", "POST"])
 def ffxiv():
-    return render_template("ffxiv_index.html", len=len)
+    return static_template("ffxiv_index.html", sanitize=False)
 
 
 @ffxiv_bp.route("/ffxiv_itemnames", methods=["GET", "POST"])
+@table_view
 def ffxivitemnames():
     if request.method == "GET":
-        return render_template("ffxiv_itemnames.html")
+        return static_template("ffxiv_itemnames.html", sanitize=False)
     elif request.method == "POST":
-        raw_items_names = requests.get(
-            "https://raw.githubusercontent.com/ffxiv-teamcraft/ffxiv-teamcraft/staging/libs/data/src/lib/json/items.json"
-        ).json()
-        item_ids = requests.get("https://universalis.app/api/marketable").json()
-
-        resp_list = [
-            {"id": id, "name": raw_items_names[str(id)]["en"]} for id in item_ids
-        ]
-
-        return return_safe_html(
-            render_template(
-                "ffxiv_itemnames.html",
-                results=resp_list,
-                fieldnames=["id", "name"],
-                len=len,
-            )
+        results, errors = fan_out(
+            {
+                "item_names": get_item_names,
+                "item_ids": lambda: get_json(f"{universalis_url}/marketable"),
+            }
+        )
+        if errors:
+            logger.error("Error fetching ffxiv item names %s", errors)
+            for exc in errors.values():
+                if isinstance(exc, DeadlineExceeded):
+                    raise exc
+            return "Error refresh the page or contact the devs on discord"
+        item_names = results["item_names"]
+        item_ids = results["item_ids"]
+
+        # ids that teamcraft does not know about yet are left out
+        table = ResultSet(
+            ["id", "name"],
+            [(id, item_names[str(id)]) for id in item_ids if str(id) in item_names],
         )
 
+        return render_results("ffxiv_itemnames.html", table)
+
 
 # {
 #   "home_server": "Famfrit",
@@ -44,5 +61,6 @@ def ffxivitemnames():
 #   ]
 # }
 @ffxiv_bp.route("/pricecheck", methods=["GET", "POST"])
+@request_cost(POST=0.1)
 def ffxiv_pricecheck():
     return redirect("https://saddlebagexchange.com/price-sniper")
@@ -1,21 +1,21 @@
-from flask import Blueprint, render_template, send_from_directory
-from utils.security import return_safe_html
+from flask import Blueprint, send_from_directory
+from utils.ratelimit import request_cost
+from utils.static_pages import static_file, static_template
 
 general_bp = Blueprint("general", __name__)
 
 
 @general_bp.route("/", methods=["GET", "POST"])
 def root():
-    return return_safe_html(render_template("index.html"))
+    return static_template("index.html")
 
 
 @general_bp.route("/favicon.ico", methods=["GET", "POST"])
+@request_cost(GET=0, POST=0)
 def favicon():
     return send_from_directory("templates", "chocobo.png")
 
 
 @general_bp.route("/openapi-spec.json", methods=["GET", "POST"])
 def openapispec():
-    with open("openapi-spec.json", "r") as file:
-        content = file.read()
-    return content
+    return static_file("openapi-spec.json", "application/json")
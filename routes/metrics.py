@@ -0,0 +1,23 @@
+import hmac
+import os
+
+from flask import Blueprint, Response, abort, request
+from utils.metrics import exposition
+from utils.ratelimit import request_cost
+
+# the scraper sends "Authorization: Bearer <METRICS_TOKEN>", without a token
+# set /metrics is not served at all. The source address proves nothing here,
+# the LoadBalancer SNATs outside clients to private addresses
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+metrics_bp = Blueprint("metrics", __name__)
+
+
+@metrics_bp.route("/metrics", methods=["GET"])
+@request_cost(GET=0)
+def metrics():
+    expected = f"Bearer {METRICS_TOKEN}".encode()
+    given = request.headers.get("Authorization", "").encode()
+    if not METRICS_TOKEN or not hmac.compare_digest(given, expected):
+        abort(404)
+    return Response(exposition(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,44 @@
+from flask import Blueprint, current_app, jsonify, request
+from utils.deadline import latency_budget
+from utils.ratelimit import request_cost, view_cost
+from utils.tables import query_table, rebuild_table, replay_target, result_tables
+
+tables_bp = Blueprint("tables", __name__)
+
+PAGE_COST = 0.2
+
+
+def table_cost():
+    """A page of a stored table, plus the search it replays when not stored."""
+    token = request.view_args["token"]
+    if result_tables.get(token) is not None:
+        return PAGE_COST
+    target = replay_target(token)
+    if target is None:
+        return PAGE_COST
+    view, path, _, data = target
+    # a cost can depend on the form (one search per region of a batch), read
+    # it from the form the token replays, not from this GET
+    with current_app.test_request_context(path, method="POST", data=data):
+        return PAGE_COST + view_cost(view, "POST")
+
+
+@tables_bp.route("/tables/<token>", methods=["GET"])
+# every page, sort and search of a server side table is one request
+@request_cost(GET=table_cost)
+# may replay a large search to rebuild the table
+@latency_budget(30)
+def table_data(token):
+    table = result_tables.get(token) or rebuild_table(token)
+    if table is None:
+        # DataTables shows this in place of the rows
+        return jsonify(
+            {
+                "draw": request.args.get("draw", 0, type=int),
+                "recordsTotal": 0,
+                "recordsFiltered": 0,
+                "data": [],
+                "error": "These results expired, submit the form again",
+            }
+        )
+    return jsonify(query_table(table, request.args))
@@ -1,93 +1,193 @@
-from flask import Blueprint, render_template, request
-import requests
+from flask import Blueprint, request
+import itertools
+import logging
 import os
-from utils.security import return_safe_html
+from utils.deadline import DeadlineExceeded, latency_budget
+from utils.fanout import fan_out
+from utils.jsonstream import iter_pairs
+from utils.projection import Projection
+from utils.ratelimit import DEFAULT_COSTS, request_cost
+from utils.rendering import render_results
+from utils.resultset import ResultSet
+from utils.static_pages import static_template
+from utils.tables import table_view
+from utils.upstream import post_json, post_raw
 
 api_url = os.getenv("TEMP_API_URL", "http://api.saddlebagexchange.com/api")
 
+logger = logging.getLogger(__name__)
+
 wow_bp = Blueprint("wow", __name__)
 
 NO_RATE_LIMIT = os.getenv("NO_RATE_LIMIT", "False").lower() in ("true", "1", "yes")
+# region and category pairs one /wowoutofstock batch may search at once
+OUTOFSTOCK_MAX_BATCH = int(os.getenv("OUTOFSTOCK_MAX_BATCH", "8"))
+
+# the item_class options of wow_outofstock.html
+ITEM_CLASSES = {
+    -1: "All",
+    0: "Consumable",
+    1: "Container",
+    2: "Weapon",
+    3: "Gem",
+    4: "Armor",
+    7: "Tradegoods",
+    8: "Item Enhancement",
+    9: "Recipe",
+    12: "Quest Item",
+    15: "Miscellaneous",
+    16: "Glyph",
+    17: "Battle Pet",
+    19: "Profession",
+}
+
 
 @wow_bp.route("/wow", methods=["GET", "POST"])
 def wow():
-    return render_template("wow_index.html", len=len)
+    return static_template("wow_index.html", sanitize=False)
 
 
 @wow_bp.route("/itemnames", methods=["GET", "POST"])
+@request_cost(POST=3)
+@latency_budget(30)
+@table_view
 def itemnames():
     if request.method == "GET":
-        return render_template("itemnames.html")
+        return static_template("itemnames.html", sanitize=False)
     elif request.method == "POST":
         json_data = {}
-        response = requests.post(
-            f"{api_url}/wow/itemnames",
-            headers={"Accept": "application/json"},
-            json=json_data,
-        ).json()
+        content = post_raw(f"{api_url}/wow/itemnames", json_data)
+
+        # the (id, name) pairs come straight from the body and are the rows
+        results = ResultSet(["id", "name"], iter_pairs(content))
+
+        return render_results("itemnames.html", results)
+
+
+OUTOFSTOCK_COLUMNS = Projection(
+    drop=["itemID", "item_class", "item_subclass", "connectedRealmId", "itemQuality"]
+)
+# batches tag every row with where it was found, at the end so the link
+# columns of the page keep their place
+OUTOFSTOCK_BATCH_COLUMNS = Projection(
+    drop=["itemID", "item_class", "item_subclass", "connectedRealmId", "itemQuality"],
+    tail=["region", "category"],
+)
+
+
+def outofstock_searches():
+    """(region, item_class) pairs of the form, one per region and category picked."""
+    regions = request.form.getlist("region")
+    try:
+        categories = [int(category) for category in request.form.getlist("item_class")]
+    except ValueError:
+        return []
+    if -1 in categories:
+        # all categories already covers the others
+        categories = [-1]
+    return list(dict.fromkeys(itertools.product(regions, categories)))
+
 
-        resp_list = [{"id": k, "name": v} for k, v in response.items()]
+def outofstock_query(region, category):
+    return {
+        "region": region,
+        "salesPerDay": float(request.form.get("salesPerDay")),
+        "avgPrice": int(request.form.get("avgPrice")),
+        "minMarketValue": int(request.form.get("minMarketValue")),
+        "populationWP": int(request.form.get("populationWP")),
+        "populationBlizz": int(request.form.get("populationBlizz")),
+        "rankingWP": int(request.form.get("rankingWP")),
+        "includeCategories": [] if category == -1 else [category],
+        "excludeCategories": [],
+    }
 
-        return return_safe_html(
-            render_template(
-                "itemnames.html", results=resp_list, fieldnames=["id", "name"], len=len
+
+def merge_outofstock(responses):
+    """Rows of every search in `responses` ((region, category) -> response),
+    tagged with region and category, an item and realm found twice only once."""
+    rows = []
+    seen = set()
+    for (region, category), response in responses.items():
+        for row in response.get("data") or []:
+            key = (region, row.get("itemID"), row.get("connectedRealmId"))
+            if key in seen:
+                continue
+            seen.add(key)
+            item_class = row.get("item_class", category)
+            row["region"] = region
+            row["category"] = ITEM_CLASSES.get(item_class, str(item_class))
+            rows.append(row)
+    return rows
+
+
+def outofstock_batch(searches):
+    """All `searches` at once, rendered as one table."""
+    if len(searches) > OUTOFSTOCK_MAX_BATCH:
+        return f"Pick at most {OUTOFSTOCK_MAX_BATCH} region and category combinations"
+    queries = {search: outofstock_query(*search) for search in searches}
+    responses, errors = fan_out(
+        {
+            search: lambda json_data=json_data: post_json(
+                f"{api_url}/wow/outofstock", json_data
             )
-        )
+            for search, json_data in queries.items()
+        }
+    )
+    if errors:
+        logger.error("Error fetching out of stock batch %s", errors)
+        if not responses:
+            for exc in errors.values():
+                if isinstance(exc, DeadlineExceeded):
+                    raise exc
+            return "Error refresh the page or contact the devs on discord"
+
+    rows = merge_outofstock(responses)
+    if not rows:
+        if errors:
+            return "Error refresh the page or contact the devs on discord"
+        logger.error("Error no matching data with given inputs %s", queries)
+        return "error no matching results found matching search inputs"
+    results = OUTOFSTOCK_BATCH_COLUMNS.result_set(rows)
+
+    # the searches that answered are shown, the page says which ones did not
+    failed_searches = [
+        f"{region} {ITEM_CLASSES.get(category, category)}"
+        for region, category in searches
+        if (region, category) in errors
+    ]
+    return render_results(
+        "wow_outofstock.html", results, failed_searches=failed_searches
+    )
 
 
 @wow_bp.route("/wowoutofstock", methods=["GET", "POST"])
+# a batch costs a search per region and category pair, a form without any
+# still costs one
+@request_cost(POST=lambda: DEFAULT_COSTS["POST"] * max(1, len(outofstock_searches())))
+@table_view
 def wow_outofstock_api():
     if request.method == "GET":
-        return return_safe_html(render_template("wow_outofstock.html"))
+        return static_template("wow_outofstock.html")
     elif request.method == "POST":
-        category = int(request.form.get("item_class"))
-        if category == -1:
-            include_cat = []
-        else:
-            include_cat = [category]
-        json_data = {
-            "region": request.form.get("region"),
-            "salesPerDay": float(request.form.get("salesPerDay")),
-            "avgPrice": int(request.form.get("avgPrice")),
-            "minMarketValue": int(request.form.get("minMarketValue")),
-            "populationWP": int(request.form.get("populationWP")),
-            "populationBlizz": int(request.form.get("populationBlizz")),
-            "rankingWP": int(request.form.get("rankingWP")),
-            "includeCategories": include_cat,
-            "excludeCategories": [],
-        }
+        searches = outofstock_searches()
+        if not searches:
+            return "error no matching results found matching search inputs"
+        if len(searches) > 1:
+            return outofstock_batch(searches)
+        json_data = outofstock_query(*searches[0])
 
-        response = requests.post(
-            f"{api_url}/wow/outofstock",
-            headers={"Accept": "application/json"},
-            json=json_data,
-        ).json()
+        response = post_json(f"{api_url}/wow/outofstock", json_data)
 
         if "data" not in response or len(response["data"]) == 0:
-            # @coderabbitai will need to move the logger function over so it can be used here
-            print(
-                f"Error no matching data with given inputs {json_data} response {response}"
+            logger.error(
+                "Error no matching data with given inputs %s response %s",
+                json_data,
+                response,
             )
             if NO_RATE_LIMIT:
                 return f"Error no matching data with given inputs {json_data} response {response}"
             # send generic error message to remove XSS potential
             return "error no matching results found matching search inputs"
-        response = response["data"]
-
-        for row in response:
-            del row["itemID"]
-            del row["item_class"]
-            del row["item_subclass"]
-            del row["connectedRealmId"]
-            del row["itemQuality"]
-
-        fieldnames = list(response[0].keys())
-
-        return return_safe_html(
-            render_template(
-                "wow_outofstock.html",
-                results=response,
-                fieldnames=fieldnames,
-                len=len,
-            )
-        )
\ No newline at end of file
+        results = OUTOFSTOCK_COLUMNS.result_set(response["data"])
+
+        return render_results("wow_outofstock.html", results)
@@ -0,0 +1,28 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# tests may import app.py: no Datadog patching, no files written outside the
+# test run and the SECRET_KEY it refuses to start without
+os.environ.setdefault("INSTRUMENTATION", "none")
+os.environ.setdefault("SECRET_KEY", "test")
+os.environ.setdefault("TEMPLATE_CACHE_DIR", "")
+os.environ.setdefault("METRICS_DIR", "")
+
+
+class Clock:
+    """Stand-in for time.monotonic that only moves when a test moves it."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
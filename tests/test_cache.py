@@ -0,0 +1,113 @@
+from types import SimpleNamespace
+
+import pytest
+
+from utils import cache, upstream
+from utils.cache import ResponseCache, endpoint_ttl, make_key, response_cache
+
+
+@pytest.fixture
+def clock(clock, monkeypatch):
+    monkeypatch.setattr(cache, "time", SimpleNamespace(monotonic=clock, time=clock))
+    return clock
+
+
+class FakeResponse:
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self.content = content
+
+
+@pytest.fixture
+def upstream_calls(monkeypatch):
+    """Answers every upstream call with 200, returns the list of calls made."""
+    calls = []
+
+    def fake_request(method, url, json=None, **kwargs):
+        calls.append((method, url, json))
+        return FakeResponse(200, b'{"rows": []}')
+
+    monkeypatch.setattr(upstream, "request", fake_request)
+    response_cache.clear()
+    yield calls
+    response_cache.clear()
+
+
+def test_hit_until_the_ttl_runs_out(clock):
+    responses = ResponseCache()
+    responses.set("k", b"body", ttl=60)
+    clock.now += 59
+    assert responses.get("k") == b"body"
+    clock.now += 1
+    assert responses.get("k") is None
+
+
+def test_least_recently_used_goes_first_when_full(clock):
+    responses = ResponseCache(max_bytes=10)
+    responses.set("a", b"aaaa", ttl=60)
+    responses.set("b", b"bbbb", ttl=60)
+    responses.get("a")
+    responses.set("c", b"cccc", ttl=60)
+    assert responses.get("b") is None
+    assert responses.get("a") == b"aaaa"
+    assert responses.current_bytes == 8
+
+
+def test_uncacheable_answers_are_not_kept(clock):
+    responses = ResponseCache(max_bytes=10)
+    responses.set("big", b"x" * 11, ttl=60)
+    responses.set("no ttl", b"x", ttl=0)
+    assert responses.get("big") is None
+    assert responses.get("no ttl") is None
+    assert responses.current_bytes == 0
+
+
+def test_replacing_an_entry_keeps_the_size_right(clock):
+    responses = ResponseCache()
+    responses.set("k", b"long body", ttl=60)
+    responses.set("k", b"short", ttl=60)
+    assert responses.current_bytes == len(b"short")
+
+
+def test_stale_copy_outlives_the_ttl(clock):
+    responses = ResponseCache(stale_max_age=100)
+    responses.set("k", b"body", ttl=60)
+    stored_at = clock.now
+    clock.now += 120
+    assert responses.get("k") is None
+    assert responses.get_stale("k") == (b"body", stored_at)
+    clock.now += 40
+    assert responses.get_stale("k") is None
+    assert responses.current_bytes == 0
+
+
+def test_key_ignores_payload_key_order():
+    url = "POST http://api/wow/outofstock"
+    assert make_key(url, {"a": 1, "b": 2}) == make_key(url, {"b": 2, "a": 1})
+    assert make_key(url, {"a": 1}) != make_key(url, {"a": 2})
+    assert make_key(url, {"a": 1}) != make_key(
+        "GET http://api/wow/outofstock", {"a": 1}
+    )
+
+
+def test_ttl_by_endpoint():
+    assert endpoint_ttl("http://api/api/wow/outofstock") == 300
+    assert endpoint_ttl("http://api/api/wow/itemnames/") == 3600
+    assert endpoint_ttl("https://universalis.app/api/v2/marketable") == 3600
+    assert endpoint_ttl("http://api/api/wow/regionpricecheck") == 0
+
+
+def test_same_search_is_answered_from_the_cache(upstream_calls):
+    url = "http://cache.test/api/wow/outofstock"
+    assert upstream.post_json(url, {"region": "NA", "salesPerDay": 1}) == {"rows": []}
+    assert upstream.post_json(url, {"salesPerDay": 1, "region": "NA"}) == {"rows": []}
+    assert len(upstream_calls) == 1
+    upstream.post_json(url, {"region": "EU", "salesPerDay": 1})
+    assert len(upstream_calls) == 2
+
+
+def test_endpoints_without_a_ttl_always_go_upstream(upstream_calls):
+    url = "http://cache.test/api/wow/regionpricecheck"
+    upstream.post_json(url, {"region": "NA"})
+    upstream.post_json(url, {"region": "NA"})
+    assert len(upstream_calls) == 2
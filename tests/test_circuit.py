@@ -0,0 +1,157 @@
+import pytest
+from flask import Flask
+
+from utils import upstream
+from utils.circuit import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    CircuitOpenError,
+    breaker_for,
+    data_as_of,
+    endpoint_of,
+    mark_stale,
+)
+from utils.deadline import DeadlineExceeded
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker(
+        "api/wow/outofstock",
+        failures=3,
+        slow_seconds=10,
+        reset_seconds=30,
+        clock=clock,
+    )
+
+
+def fail(breaker, times):
+    for _ in range(times):
+        breaker.before_call()
+        breaker.record(False)
+
+
+def test_opens_after_consecutive_failures(breaker):
+    fail(breaker, 2)
+    assert breaker.state == CLOSED
+    fail(breaker, 1)
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError) as info:
+        breaker.before_call()
+    assert info.value.retry_after == pytest.approx(30)
+
+
+def test_success_resets_the_count(breaker):
+    fail(breaker, 2)
+    breaker.record(True, 0.1)
+    fail(breaker, 2)
+    assert breaker.state == CLOSED
+
+
+def test_slow_answers_count_as_failures(breaker):
+    for _ in range(3):
+        breaker.before_call()
+        breaker.record(True, 12)
+    assert breaker.state == OPEN
+
+
+def test_one_probe_after_the_reset_time(breaker, clock):
+    fail(breaker, 3)
+    clock.now += 29
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    clock.now += 1
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+    # only the probe goes through until it answers
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_probe_success_closes(breaker, clock):
+    fail(breaker, 3)
+    clock.now += 30
+    breaker.before_call()
+    breaker.record(True, 0.2)
+    assert breaker.state == CLOSED
+    breaker.before_call()
+
+
+def test_probe_failure_opens_again(breaker, clock):
+    fail(breaker, 3)
+    clock.now += 30
+    breaker.before_call()
+    breaker.record(False)
+    assert breaker.state == OPEN
+    assert breaker.opened_at == clock.now
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_lost_probe_does_not_hold_the_circuit(breaker, clock):
+    fail(breaker, 3)
+    clock.now += 30
+    breaker.before_call()
+    # the probe never records, another one goes through a reset period later
+    clock.now += 30
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+
+
+def test_cancelled_probe_lets_the_next_call_probe(breaker, clock):
+    fail(breaker, 3)
+    clock.now += 30
+    breaker.before_call()
+    breaker.cancel()
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+
+
+def out_of_budget(*args, **kwargs):
+    raise DeadlineExceeded(20)
+
+
+def test_used_up_budget_is_not_an_upstream_failure(monkeypatch):
+    url = "http://budget.test/api/search"
+    monkeypatch.setattr(upstream, "request", out_of_budget)
+    breaker = breaker_for(url)
+    for _ in range(breaker.failures + 1):
+        with pytest.raises(DeadlineExceeded):
+            upstream._fetch("POST", url, {}, 0, None)
+    assert breaker.state == CLOSED
+    assert breaker.failed == 0
+
+
+def test_call_slow_by_itself_still_counts(monkeypatch):
+    url = "http://slow.test/api/search"
+    monkeypatch.setattr(upstream, "request", out_of_budget)
+    breaker = breaker_for(url)
+    monkeypatch.setattr(breaker, "slow_seconds", 0)
+    for _ in range(breaker.failures):
+        with pytest.raises(DeadlineExceeded):
+            upstream._fetch("POST", url, {}, 0, None)
+    assert breaker.state == OPEN
+
+
+def test_endpoint_folds_numeric_ids():
+    assert endpoint_of("https://universalis.app/api/v2/history/NA/5333/") == (
+        "universalis.app/api/v2/history/NA/{id}"
+    )
+    assert endpoint_of("https://universalis.app/api/v2/history/NA/1") == endpoint_of(
+        "https://universalis.app/api/v2/history/NA/2"
+    )
+    assert endpoint_of("http://api.saddlebagexchange.com/api/wow/outofstock") == (
+        "api.saddlebagexchange.com/api/wow/outofstock"
+    )
+
+
+def test_data_as_of_shows_the_oldest_stale_copy():
+    app = Flask(__name__)
+    assert data_as_of() is None
+    with app.test_request_context("/"):
+        assert data_as_of() is None
+        mark_stale(86400 * 2)
+        mark_stale(86400 * 3)
+        assert data_as_of() == "1970-01-03 00:00 UTC"
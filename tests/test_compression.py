@@ -0,0 +1,88 @@
+import gzip
+import zlib
+
+import brotli
+import pytest
+from flask import Flask, Response
+
+from utils.compression import COMPRESS_MIN_SIZE, compress_response
+
+PAGE = "<tr><td>row</td></tr>\n" * 200
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.after_request(compress_response)
+
+    @app.route("/page")
+    def page():
+        return PAGE
+
+    @app.route("/small")
+    def small():
+        return "x" * (COMPRESS_MIN_SIZE - 1)
+
+    @app.route("/image")
+    def image():
+        return Response(b"\x89PNG" * 1000, mimetype="image/png")
+
+    @app.route("/stream")
+    def stream():
+        rows = ("<tr><td>%d</td></tr>\n" % i for i in range(500))
+        return Response(rows, mimetype="text/html")
+
+    @app.route("/not-modified")
+    def not_modified():
+        return Response(status=304)
+
+    return app.test_client()
+
+
+def test_gzip_when_brotli_is_not_accepted(client):
+    response = client.get("/page", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert gzip.decompress(response.data).decode() == PAGE
+    assert int(response.headers["Content-Length"]) == len(response.data)
+
+
+def test_brotli_is_preferred(client):
+    response = client.get("/page", headers={"Accept-Encoding": "gzip, deflate, br"})
+    assert response.headers["Content-Encoding"] == "br"
+    assert brotli.decompress(response.data).decode() == PAGE
+
+
+def test_identity_without_accept_encoding(client):
+    response = client.get("/page", headers={"Accept-Encoding": ""})
+    assert "Content-Encoding" not in response.headers
+    assert response.get_data(as_text=True) == PAGE
+    assert "Accept-Encoding" in response.headers["Vary"]
+
+
+def test_refused_encoding_is_not_used(client):
+    response = client.get("/page", headers={"Accept-Encoding": "br;q=0, gzip;q=0"})
+    assert "Content-Encoding" not in response.headers
+
+
+@pytest.mark.parametrize("path", ["/small", "/image", "/not-modified"])
+def test_left_alone(client, path):
+    response = client.get(path, headers={"Accept-Encoding": "gzip, br"})
+    assert "Content-Encoding" not in response.headers
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "br"])
+def test_streamed_body_is_compressed_as_it_goes(client, encoding):
+    response = client.get("/stream", headers={"Accept-Encoding": encoding})
+    assert response.headers["Content-Encoding"] == encoding
+    assert "Content-Length" not in response.headers
+    chunks = list(response.response)
+    response.close()
+    # flushed per chunk, not held until the end
+    assert len([chunk for chunk in chunks if chunk]) > 1
+    body = b"".join(chunks)
+    if encoding == "gzip":
+        text = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+    else:
+        text = brotli.decompress(body)
+    assert text.decode() == "".join("<tr><td>%d</td></tr>\n" % i for i in range(500))
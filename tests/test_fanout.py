@@ -0,0 +1,131 @@
+import time
+
+import pytest
+from flask import Flask
+
+from utils import deadline
+from utils.deadline import (
+    BUDGET_RESERVE,
+    REQUEST_BUDGET,
+    DeadlineExceeded,
+    deadline_exceeded,
+    init_deadlines,
+    latency_budget,
+)
+from utils.fanout import fan_out
+
+
+@pytest.fixture(autouse=True)
+def no_budget():
+    # the test client runs views on this thread, their budget outlives them
+    deadline._deadline.set(None)
+    yield
+    deadline._deadline.set(None)
+
+
+@pytest.fixture
+def budget():
+    """Give the test a request budget of `seconds`, like _start_request does."""
+
+    def start(seconds):
+        deadline._deadline.set((time.monotonic() + seconds, seconds))
+
+    return start
+
+
+def sleeper(seconds, result=None):
+    def call():
+        time.sleep(seconds)
+        return result
+
+    return call
+
+
+def failing():
+    raise ValueError("upstream said no")
+
+
+def test_calls_run_concurrently():
+    started = time.monotonic()
+    results, errors = fan_out({name: sleeper(0.2, name) for name in "abcd"})
+    assert results == {name: name for name in "abcd"}
+    assert errors == {}
+    assert time.monotonic() - started < 0.6
+
+
+def test_a_failed_call_does_not_sink_the_others():
+    results, errors = fan_out({"good": sleeper(0, 1), "bad": failing})
+    assert results == {"good": 1}
+    assert isinstance(errors["bad"], ValueError)
+
+
+def test_a_call_past_its_own_timeout_is_an_error():
+    started = time.monotonic()
+    results, errors = fan_out({"fast": sleeper(0, 1), "slow": (sleeper(1), 0.1)})
+    assert results == {"fast": 1}
+    assert isinstance(errors["slow"], TimeoutError)
+    assert time.monotonic() - started < 0.5
+
+
+def test_the_request_budget_cuts_every_wait_short(budget):
+    budget(0.2)
+    started = time.monotonic()
+    results, errors = fan_out({"slow": sleeper(1), "slower": sleeper(2)})
+    assert results == {}
+    assert all(isinstance(error, DeadlineExceeded) for error in errors.values())
+    assert time.monotonic() - started < 0.5
+
+
+def test_calls_see_the_request_budget(budget):
+    budget(5)
+    results, _ = fan_out({"left": deadline.remaining})
+    assert 4 < results["left"] <= 5
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    init_deadlines(app)
+    app.register_error_handler(DeadlineExceeded, deadline_exceeded)
+
+    @app.route("/default")
+    def default():
+        return {"left": deadline.remaining()}
+
+    @app.route("/long")
+    @latency_budget(30)
+    def long():
+        return {"left": deadline.remaining()}
+
+    @app.route("/used-up")
+    @latency_budget(BUDGET_RESERVE + 0.05)
+    def used_up():
+        time.sleep(0.1)
+        deadline.timeouts()
+        return "not reached"
+
+    return app.test_client()
+
+
+def test_views_get_their_budget_less_the_reserve(client):
+    left = client.get("/default").json["left"]
+    assert REQUEST_BUDGET - BUDGET_RESERVE - 1 < left <= REQUEST_BUDGET - BUDGET_RESERVE
+    left = client.get("/long").json["left"]
+    assert 30 - BUDGET_RESERVE - 1 < left <= 30 - BUDGET_RESERVE
+
+
+def test_used_up_budget_answers_504(client):
+    response = client.get("/used-up")
+    assert response.status_code == 504
+
+
+def test_timeouts_shrink_with_the_budget(budget):
+    assert deadline.timeouts() == (
+        deadline.UPSTREAM_CONNECT_TIMEOUT,
+        deadline.UPSTREAM_READ_TIMEOUT,
+    )
+    budget(1)
+    connect, read = deadline.timeouts()
+    assert connect <= 1 and read <= 1
+    assert deadline.cap(10) <= 1
+    assert deadline.cap(0.5) == 0.5
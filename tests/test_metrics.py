@@ -0,0 +1,80 @@
+import json
+import os
+
+import pytest
+
+from utils import metrics
+
+ROUTE = "/test-metrics"
+GET_REQUESTS = (
+    f'{metrics.requests_total.name}{{route="{ROUTE}",method="GET",status="200"}}'
+)
+POST_REQUESTS = (
+    f'{metrics.requests_total.name}{{route="{ROUTE}",method="POST",status="200"}}'
+)
+
+
+@pytest.fixture
+def metrics_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_DIR", str(tmp_path))
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", True)
+    return tmp_path
+
+
+def other_worker(directory, pid, requests, cache_entries):
+    """Write the values a worker with `pid` would have flushed."""
+    buckets = [0] * (len(metrics.DURATION_BUCKETS) + 1)
+    buckets[0] = requests
+    data = {
+        metrics.requests_total.name: [[[ROUTE, "GET", "200"], requests]],
+        metrics.request_seconds.name: [[[ROUTE], [buckets, 0.001 * requests]]],
+        metrics.response_cache_entries.name: [[[], cache_entries]],
+    }
+    (directory / f"{pid}.json").write_text(json.dumps(data))
+
+
+def sample(text, series):
+    """Value of `series` in an exposition, 0 when it is not there."""
+    for line in text.splitlines():
+        if line.startswith(series + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0
+
+
+def test_exposition_sums_the_other_workers(metrics_dir):
+    before = sample(metrics.exposition(), GET_REQUESTS)
+    other_worker(metrics_dir, 1, requests=3, cache_entries=2)
+    other_worker(metrics_dir, 2, requests=4, cache_entries=5)
+    text = metrics.exposition()
+
+    assert sample(text, GET_REQUESTS) == before + 7
+    assert sample(text, f'{metrics.request_seconds.name}_count{{route="{ROUTE}"}}') == 7
+    own_entries = metrics.response_cache_entries.snapshot().get((), 0)
+    assert sample(text, metrics.response_cache_entries.name) == own_entries + 7
+
+
+def test_retired_worker_keeps_counters_and_drops_gauges(metrics_dir):
+    other_worker(metrics_dir, 1, requests=3, cache_entries=2)
+    other_worker(metrics_dir, 2, requests=4, cache_entries=5)
+    metrics.retire_worker(1)
+    metrics.retire_worker(2)
+    assert sorted(os.listdir(metrics_dir)) == [".lock", "retired.json"]
+
+    text = metrics.exposition()
+    own = metrics.requests_total.snapshot().get((ROUTE, "GET", "200"), 0)
+    assert sample(text, GET_REQUESTS) == own + 7
+    own_entries = metrics.response_cache_entries.snapshot().get((), 0)
+    assert sample(text, metrics.response_cache_entries.name) == own_entries
+
+
+def test_flush_writes_this_workers_values(metrics_dir):
+    metrics.requests_total.inc((ROUTE, "POST", "200"))
+    metrics.flush()
+    data = json.loads((metrics_dir / f"{os.getpid()}.json").read_text())
+    series = dict(
+        (tuple(labels), value) for labels, value in data[metrics.requests_total.name]
+    )
+    assert series[(ROUTE, "POST", "200")] >= 1
+    # the own file is never added on top of the live values
+    text = metrics.exposition()
+    assert sample(text, POST_REQUESTS) == series[(ROUTE, "POST", "200")]
@@ -0,0 +1,158 @@
+import copy
+
+from app import PETIMPORT_COLUMNS
+from routes.wow import OUTOFSTOCK_BATCH_COLUMNS, OUTOFSTOCK_COLUMNS
+from utils.projection import Projection
+
+MEGA_ORDER = ["itemID", "desiredPrice", "itemName", "salesPerDay"]
+
+
+def outofstock_rows():
+    return [
+        {
+            "itemID": i,
+            "item_class": 2,
+            "item_subclass": 1,
+            "connectedRealmId": 3678,
+            "itemQuality": 4,
+            "itemName": f"Item {i}",
+            "realmNames": "Thrall",
+            "salesPerDay": 4.5,
+            "avgPrice": 12000,
+            "link": f"https://saddlebagexchange.com/wow/item-data/{i}",
+        }
+        for i in range(5)
+    ]
+
+
+def petimport_rows():
+    return [
+        {
+            "itemID": i,
+            "itemName": f"Item {i}",
+            "lowestPriceRealmID": 3678,
+            "lowestPriceRealmName": "Thrall",
+            "lowestPrice": 1000,
+            "avgPrice": 1500,
+            "ROI": 50,
+            "salesPerDay": 2.5,
+            "link": f"https://saddlebagexchange.com/wow/item-data/{i}",
+            "undermineLink": f"https://undermine.exchange/#us-thrall/{i}",
+            "warcraftPetsLink": f"https://www.warcraftpets.com/search/?q={i}",
+        }
+        for i in range(5)
+    ]
+
+
+# the loops the routes ran before they declared a Projection
+def outofstock_loop(response):
+    for row in response:
+        del row["itemID"]
+        del row["item_class"]
+        del row["item_subclass"]
+        del row["connectedRealmId"]
+        del row["itemQuality"]
+    return response
+
+
+def petimport_loop(response):
+    for row in response:
+        del row["itemID"]
+        del row["lowestPriceRealmID"]
+        for key in [
+            "lowestPriceRealmName",
+            "link",
+            "undermineLink",
+            "warcraftPetsLink",
+        ]:
+            row[key] = row.pop(key)
+    return response
+
+
+def megaitemnames_loop(response):
+    return [{key: item.get(key) for key in MEGA_ORDER} for item in response]
+
+
+def assert_matches(result_set, rows):
+    assert list(result_set.fieldnames) == list(rows[0])
+    assert result_set.rows == [tuple(row.values()) for row in rows]
+
+
+def test_outofstock_matches_the_loop():
+    rows = outofstock_rows()
+    expected = outofstock_loop(copy.deepcopy(rows))
+    assert_matches(OUTOFSTOCK_COLUMNS.result_set(rows), expected)
+
+
+def test_outofstock_batch_moves_region_and_category_last():
+    rows = outofstock_rows()
+    for row in rows:
+        row["region"] = "NA"
+        row["category"] = "Weapon"
+    results = OUTOFSTOCK_BATCH_COLUMNS.result_set(rows)
+    assert results.fieldnames[-2:] == ("region", "category")
+    assert results.rows[0][-2:] == ("NA", "Weapon")
+    assert "itemID" not in results.fieldnames
+
+
+def test_petimport_matches_the_loop():
+    rows = petimport_rows()
+    expected = petimport_loop(copy.deepcopy(rows))
+    assert_matches(PETIMPORT_COLUMNS.result_set(rows), expected)
+
+
+def test_columns_match_the_loop_with_missing_keys():
+    rows = [
+        {"itemName": "a", "itemID": 1, "salesPerDay": 1.5, "desiredPrice": 3},
+        {"itemName": "b", "itemID": 2},
+    ]
+    expected = megaitemnames_loop(copy.deepcopy(rows))
+    assert_matches(Projection(columns=MEGA_ORDER).result_set(rows), expected)
+    assert expected[1]["desiredPrice"] is None
+
+
+def test_columns_missing_from_the_first_row():
+    rows = [{"itemID": 1}, {"itemID": 2, "itemName": "b"}]
+    results = Projection(columns=["itemID", "itemName"]).result_set(rows)
+    assert results.rows == [(1, None), (2, "b")]
+
+
+def test_drop_and_tail_with_uneven_rows():
+    rows = petimport_rows()
+    del rows[1]["undermineLink"]
+    del rows[3]["ROI"]
+    results = PETIMPORT_COLUMNS.result_set(rows)
+    fieldnames = list(results.fieldnames)
+    assert results.rows[1][fieldnames.index("undermineLink")] is None
+    assert results.rows[3][fieldnames.index("ROI")] is None
+    assert results.rows[3][fieldnames.index("itemName")] == "Item 3"
+    # the other rows keep the loop's layout
+    expected = petimport_loop(copy.deepcopy(petimport_rows()))
+    assert results.rows[0] == tuple(expected[0].values())
+
+
+def test_rows_from_an_iterator():
+    rows = outofstock_rows()
+    expected = outofstock_loop(copy.deepcopy(rows))
+    assert_matches(OUTOFSTOCK_COLUMNS.result_set(iter(rows)), expected)
+
+
+def test_single_column_rows_are_tuples():
+    results = Projection(columns=["itemID"]).result_set([{"itemID": 1, "x": 2}])
+    assert results.rows == [(1,)]
+    results = Projection(drop=["x"]).result_set([{"itemID": 1, "x": 2}])
+    assert results.rows == [(1,)]
+
+
+def test_empty_input():
+    assert Projection(columns=MEGA_ORDER).result_set([]).fieldnames == tuple(MEGA_ORDER)
+    assert len(Projection(drop=["itemID"]).result_set(iter([]))) == 0
+
+
+def test_layout_is_worked_out_per_key_order():
+    projection = Projection(drop=["x"], tail=["a"])
+    first = projection.result_set([{"a": 1, "b": 2, "x": 3}])
+    second = projection.result_set([{"b": 2, "x": 3, "c": 4, "a": 1}])
+    assert first.fieldnames == ("b", "a")
+    assert second.fieldnames == ("b", "c", "a")
+    assert second.rows == [(2, 4, 1)]
@@ -0,0 +1,119 @@
+import pytest
+from flask import Flask, request
+
+from utils.ratelimit import MemoryStorage, RateLimiter, RedisStorage, request_cost
+
+
+@pytest.fixture
+def client(clock):
+    app = Flask(__name__)
+    RateLimiter(app, storage=MemoryStorage(clock=clock), rate=1, burst=5)
+
+    @app.route("/search", methods=["GET", "POST"])
+    @request_cost(POST=2)
+    def search():
+        return "ok"
+
+    @app.route("/free")
+    @request_cost(GET=0)
+    def free():
+        return "ok"
+
+    @app.route("/huge", methods=["POST"])
+    @request_cost(POST=50)
+    def huge():
+        return "ok"
+
+    @app.route("/batch", methods=["POST"])
+    # one search per value, like /wowoutofstock batches
+    @request_cost(POST=lambda: float(len(request.form.getlist("search"))))
+    def batch():
+        return "ok"
+
+    return app.test_client()
+
+
+def test_bucket_takes_cost_and_refills(clock):
+    storage = MemoryStorage(clock=clock)
+    assert storage.take("ip", 3, rate=1, burst=5) == 0
+    assert storage.take("ip", 3, rate=1, burst=5) == pytest.approx(1.0)
+    clock.now += 1
+    assert storage.take("ip", 3, rate=1, burst=5) == 0
+
+
+def test_bucket_never_refills_past_burst(clock):
+    storage = MemoryStorage(clock=clock)
+    storage.take("ip", 5, rate=1, burst=5)
+    clock.now += 3600
+    assert storage.take("ip", 5, rate=1, burst=5) == 0
+    assert storage.take("ip", 0.5, rate=1, burst=5) == pytest.approx(0.5)
+
+
+def test_buckets_are_per_key(clock):
+    storage = MemoryStorage(clock=clock)
+    storage.take("a", 5, rate=1, burst=5)
+    assert storage.take("b", 5, rate=1, burst=5) == 0
+
+
+def test_prune_drops_only_full_buckets(clock):
+    storage = MemoryStorage(clock=clock, max_keys=2)
+    storage.take("old", 1, rate=1, burst=5)
+    clock.now += 10
+    storage.take("recent", 1, rate=1, burst=5)
+    storage.take("new", 1, rate=1, burst=5)
+    assert set(storage.buckets) == {"recent", "new"}
+
+
+def test_search_cost_and_retry_after(client):
+    assert client.post("/search").status_code == 200
+    assert client.post("/search").status_code == 200
+    response = client.post("/search")
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
+
+
+def test_pages_cost_the_default(client):
+    # GET costs 0.1, a burst of 5 covers 50 pages
+    for _ in range(50):
+        assert client.get("/search").status_code == 200
+    assert client.get("/search").status_code == 429
+
+
+def test_zero_cost_is_exempt(client):
+    for _ in range(100):
+        assert client.get("/free").status_code == 200
+
+
+def test_cost_is_capped_at_the_burst(client, clock):
+    assert client.post("/huge").status_code == 200
+    assert client.post("/huge").status_code == 429
+    clock.now += 5
+    assert client.post("/huge").status_code == 200
+
+
+def test_callable_cost_sees_the_form(client):
+    assert (
+        client.post("/batch", data={"search": ["a", "b", "c", "d"]}).status_code == 200
+    )
+    assert client.post("/batch", data={"search": ["a", "b"]}).status_code == 429
+
+
+def test_redis_storage_matches_memory():
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    storage = RedisStorage(None, client=fakeredis.FakeRedis())
+    assert storage.take("ratelimit:ip", 3, 1, 5) == 0
+    assert storage.take("ratelimit:ip", 3, 1, 5) == pytest.approx(1.0, abs=0.05)
+    storage.reset()
+    assert storage.take("ratelimit:ip", 5, 1, 5) == 0
+
+
+def test_redis_storage_fails_open():
+    class Down:
+        def register_script(self, script):
+            def run(**kwargs):
+                raise ConnectionError("redis is down")
+
+            return run
+
+    assert RedisStorage(None, client=Down()).take("ratelimit:ip", 3, 1, 5) == 0.0
@@ -0,0 +1,223 @@
+import os
+
+import pytest
+from flask import Flask, render_template
+from lxml import etree
+from lxml import html as lxml_html
+
+from utils import security
+from utils.resultset import ResultSet
+from utils.security import (
+    HtmlStreamSanitizer,
+    lxml_safe_html,
+    return_safe_html,
+    safe_html_stream,
+)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HOSTILE_VALUES = [
+    "<script>alert(1)</script>",
+    '"><img src=x onerror=alert(1)>',
+    "' onmouseover='alert(1)",
+    "</td></tr></tbody></table><script>alert(1)</script>",
+    "<!-- unterminated",
+    "-->",
+    "<![CDATA[x]]>",
+    "<?php echo 1 ?>",
+    "javascript:alert(1)",
+    "&amp; &lt; &#60; &#x3C; &bogus",
+    "<svg onload=alert(1)>",
+    "Ægir's Ωmega 漢字 🐤",
+    "a < b > c & d",
+    "</script><script>alert(1)</script>",
+    "<style>body{display:none}</style>",
+]
+
+SNIPPETS = [
+    "<p>a < b & c > d</p>",
+    '<a href=x onclick="evil()">t</a>',
+    "<img src='a\"b'>",
+    '<script>if (a<b) {x="</p>"}</script><p>x</p>',
+    "<!-- c --><p>after</p>",
+    "<?php x ?><p>pi</p>",
+    '<div title="a>b">x</div>',
+    "&amp;&lt;&bogus &#39;",
+    "<p>unterminated <!-- x",
+    "<SCRIPT>a<b</SCRIPT ><p>x</p>",
+    "<DIV CLASS=Upper>x</DIV>",
+    "<table><tr><td>1<td>2</table>",
+    "<ul><li>one<li>two</ul>",
+    "<input disabled value=x>",
+    "<p>x</p",
+    '<a href="&#34;x">q</a>',
+    "<br/><hr />",
+    "<p>text with > and >> arrows</p>",
+    '<a ONCLICK="x()" href=y>z</a>',
+    "<img src=x onerror=alert(1)//>",
+    "<p title='a\"b'>q</p>",
+    "<div\tonmouseover=x>tab</div>",
+    "<svg><a xlink:href=x onfocus=y>s</a></svg>",
+]
+
+# template -> fieldnames used for the rows, these are the live result pages
+TABLE_TEMPLATES = {
+    "itemnames.html": ["id", "name"],
+    "ffxiv_itemnames.html": ["id", "name"],
+    "megaitemnames.html": ["itemID", "desiredPrice", "itemName", "salesPerDay"],
+    "wow_outofstock.html": ["itemName", "realmNames", "salesPerDay", "link"],
+    "ffxivbestdeals.html": ["itemName", "worldName", "discountHQ", "uniLink"],
+    "petimport.html": ["itemName", "ROI", "link", "undermineLink"],
+}
+ROWS = 50
+
+app = Flask(__name__, template_folder=os.path.join(ROOT, "templates"))
+
+
+def render_page(template, hostile=False):
+    fieldnames = TABLE_TEMPLATES[template]
+    rows = [
+        tuple(
+            (
+                HOSTILE_VALUES[(i + j) % len(HOSTILE_VALUES)]
+                if hostile
+                else f"{name} {i}"
+            )
+            for j, name in enumerate(fieldnames)
+        )
+        for i in range(ROWS)
+    ]
+    with app.test_request_context(f"/{template}", method="POST"):
+        return render_template(template, results=ResultSet(fieldnames, rows))
+
+
+def tokenizer_safe_html(markup, chunk_size=None):
+    sanitizer = HtmlStreamSanitizer()
+    if chunk_size is None:
+        return sanitizer.feed(markup) + sanitizer.close()
+    out = [
+        sanitizer.feed(markup[i : i + chunk_size])
+        for i in range(0, len(markup), chunk_size)
+    ]
+    return "".join(out) + sanitizer.close()
+
+
+def _text(value):
+    return " ".join((value or "").split())
+
+
+def _children(element):
+    # processing instructions are dropped by the tokenizer on purpose
+    return [
+        child
+        for child in element
+        if not isinstance(child, etree._ProcessingInstruction)
+    ]
+
+
+def dom_difference(expected, actual, path=""):
+    """Describe how `actual` is looser than `expected`, None when it is not.
+
+    The tokenizer may only be stricter than the lxml round trip: drop on*
+    attributes and processing instructions.
+    """
+    path = f"{path}/{expected.tag if isinstance(expected.tag, str) else 'comment'}"
+    if expected.tag != actual.tag:
+        return f"{path}: became {actual.tag}"
+    if _text(expected.text) != _text(actual.text):
+        return f"{path}: text {expected.text!r} became {actual.text!r}"
+    if _text(expected.tail) != _text(actual.tail):
+        return f"{path}: tail {expected.tail!r} became {actual.tail!r}"
+    if isinstance(expected.tag, str):
+        for name, value in actual.attrib.items():
+            if expected.attrib.get(name) != value:
+                return f"{path}: extra or changed attribute {name}={value!r}"
+        for name in set(expected.attrib.keys()) - set(actual.attrib.keys()):
+            if not name.lower().startswith("on"):
+                return f"{path}: attribute {name} was dropped"
+    expected_children = _children(expected)
+    actual_children = _children(actual)
+    if len(expected_children) != len(actual_children):
+        return (
+            f"{path}: {len(expected_children)} children became {len(actual_children)}"
+        )
+    for expected_child, actual_child in zip(expected_children, actual_children):
+        difference = dom_difference(expected_child, actual_child, path)
+        if difference:
+            return difference
+    return None
+
+
+def active_content(tree):
+    """Script elements and event handler attributes in a parsed page."""
+    scripts = len(tree.xpath("//script"))
+    handlers = len(tree.xpath("//@*[starts-with(name(), 'on')]"))
+    return scripts, handlers
+
+
+def parse(markup):
+    return lxml_html.document_fromstring(markup)
+
+
+def assert_matches_lxml(markup):
+    actual = parse(tokenizer_safe_html(markup))
+    assert dom_difference(parse(lxml_safe_html(markup)), actual) is None
+    assert active_content(actual)[1] == 0
+
+
+@pytest.mark.parametrize("snippet", SNIPPETS)
+def test_snippet_matches_lxml(snippet):
+    assert_matches_lxml(f"<div>{snippet}</div>")
+
+
+@pytest.mark.parametrize("template", TABLE_TEMPLATES)
+@pytest.mark.parametrize("hostile", [False, True])
+def test_result_page_matches_lxml(template, hostile):
+    page = render_page(template, hostile)
+    # an empty table would compare equal and prove nothing
+    cells = len(TABLE_TEMPLATES[template]) * ROWS
+    assert len(parse(page).xpath("//tbody/tr/td")) == cells
+    assert_matches_lxml(page)
+
+
+@pytest.mark.parametrize("template", TABLE_TEMPLATES)
+def test_hostile_rows_add_no_active_content(template):
+    benign = parse(tokenizer_safe_html(render_page(template)))
+    hostile = parse(tokenizer_safe_html(render_page(template, hostile=True)))
+    assert active_content(hostile) == active_content(benign)
+    assert len(hostile.xpath("//tbody/tr/td")) == len(benign.xpath("//tbody/tr/td"))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 4096])
+def test_chunked_feed_matches_one_pass(chunk_size):
+    page = render_page("wow_outofstock.html", hostile=True)
+    assert tokenizer_safe_html(page, chunk_size) == tokenizer_safe_html(page)
+
+
+def test_return_safe_html_runs_the_tokenizer():
+    page = render_page("wow_outofstock.html", hostile=True)
+    assert return_safe_html(page) == tokenizer_safe_html(page)
+
+
+def test_sanitizer_lxml_switches_back_to_the_round_trip(monkeypatch):
+    monkeypatch.setattr(security, "SANITIZER", "lxml")
+    page = render_page("itemnames.html")
+    assert return_safe_html(page) == lxml_safe_html(page)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 13, 1000])
+def test_stream_matches_the_whole_page(chunk_size):
+    page = render_page("megaitemnames.html", hostile=True)
+    chunks = (page[i : i + chunk_size] for i in range(0, len(page), chunk_size))
+    assert "".join(safe_html_stream(chunks)) == return_safe_html(page)
+
+
+def test_stream_holds_back_an_unfinished_tag():
+    sanitizer = HtmlStreamSanitizer()
+    assert sanitizer.feed("<p>a</p><img src=x on") == "<p>a</p>"
+    assert sanitizer.feed("error=alert(1)>") == '<img src="x">'
+    assert sanitizer.feed("&am") == ""
+    # a script body is passed through once its end tag has arrived
+    assert sanitizer.feed("p;<script>if (a<b) {}") == "&amp;<script>"
+    assert sanitizer.feed("</script><p>") == "if (a<b) {}</script><p>"
+    assert sanitizer.close() == ""
@@ -0,0 +1,118 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from types import SimpleNamespace
+
+import pytest
+
+from utils import upstream
+from utils.cache import response_cache
+from utils.metrics import Counter
+from utils.singleflight import SingleFlight
+
+CALLERS = 8
+
+
+class Gate:
+    """A function that blocks until released, counting how often it ran."""
+
+    def __init__(self, result="answer"):
+        self.result = result
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        self.started.set()
+        assert self.release.wait(5)
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+def joined(flight, callers):
+    """Wait until `callers` wait on the leader's call."""
+    for _ in range(500):
+        if flight.collapsed.values.get((), 0) >= callers:
+            return
+        time.sleep(0.01)
+    raise AssertionError("callers never joined")
+
+
+@pytest.fixture
+def flight():
+    return SingleFlight(collapsed=Counter("test_collapsed", "", ()))
+
+
+def test_concurrent_callers_share_one_call(flight):
+    gate = Gate()
+    with ThreadPoolExecutor(CALLERS) as pool:
+        futures = [pool.submit(flight.do, "k", gate)]
+        assert gate.started.wait(5)
+        futures += [pool.submit(flight.do, "k", gate) for _ in range(CALLERS - 1)]
+        joined(flight, CALLERS - 1)
+        gate.release.set()
+        assert [future.result() for future in futures] == ["answer"] * CALLERS
+    assert gate.calls == 1
+    assert flight.collapsed.values[()] == CALLERS - 1
+
+
+def test_every_caller_gets_the_exception(flight):
+    gate = Gate(result=ValueError("upstream said no"))
+    with ThreadPoolExecutor(CALLERS) as pool:
+        futures = [pool.submit(flight.do, "k", gate)]
+        assert gate.started.wait(5)
+        futures += [pool.submit(flight.do, "k", gate) for _ in range(CALLERS - 1)]
+        joined(flight, CALLERS - 1)
+        gate.release.set()
+        for future in futures:
+            with pytest.raises(ValueError):
+                future.result()
+    assert gate.calls == 1
+
+
+def test_a_finished_call_is_not_reused(flight):
+    assert flight.do("k", lambda: 1) == 1
+    assert flight.do("k", lambda: 2) == 2
+    assert flight._calls == {}
+    assert flight.collapsed.values.get((), 0) == 0
+
+
+def test_different_keys_run_separately(flight):
+    gate = Gate()
+    with ThreadPoolExecutor(2) as pool:
+        first = pool.submit(flight.do, "a", gate)
+        second = pool.submit(flight.do, "b", gate)
+        for _ in range(500):
+            if gate.calls == 2:
+                break
+            time.sleep(0.01)
+        gate.release.set()
+        assert first.result() == second.result() == "answer"
+    assert gate.calls == 2
+    assert flight.collapsed.values.get((), 0) == 0
+
+
+def test_identical_searches_make_one_upstream_call(monkeypatch):
+    url = "http://singleflight.test/api/wow/regionpricecheck"
+    gate = Gate(result=b'{"rows": []}')
+
+    def fake_request(method, url, json=None, **kwargs):
+        return SimpleNamespace(status_code=200, content=gate())
+
+    monkeypatch.setattr(upstream, "request", fake_request)
+    monkeypatch.setattr(upstream, "inflight", SingleFlight(Counter("c", "", ())))
+    response_cache.clear()
+    with ThreadPoolExecutor(CALLERS) as pool:
+        futures = [pool.submit(upstream.post_json, url, {"region": "NA"})]
+        assert gate.started.wait(5)
+        futures += [
+            pool.submit(upstream.post_json, url, {"region": "NA"})
+            for _ in range(CALLERS - 1)
+        ]
+        joined(upstream.inflight, CALLERS - 1)
+        gate.release.set()
+        assert [future.result() for future in futures] == [{"rows": []}] * CALLERS
+    assert gate.calls == 1
@@ -0,0 +1,93 @@
+import gzip
+
+import brotli
+import pytest
+from flask import Flask
+
+from utils import static_pages
+from utils.compression import compress_response
+from utils.static_pages import cached_page
+
+PAGE = "<p>the same page for everyone</p>\n" * 100
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.after_request(compress_response)
+    app.renders = 0
+
+    def render():
+        app.renders += 1
+        return PAGE
+
+    @app.route("/page")
+    def page():
+        return cached_page("test-page", render)
+
+    static_pages._pages.pop("test-page", None)
+    client = app.test_client()
+    yield client
+    static_pages._pages.pop("test-page", None)
+    for encoding in ("gzip", "br"):
+        static_pages._encoded.pop(("test-page", encoding), None)
+
+
+def test_page_has_a_strong_etag_and_is_revalidated(client):
+    response = client.get("/page", headers={"Accept-Encoding": ""})
+    assert response.status_code == 200
+    assert response.get_data(as_text=True) == PAGE
+    etag, weak = response.get_etag()
+    assert etag and not weak
+    assert response.headers["Cache-Control"] == "no-cache"
+
+
+def test_matching_etag_answers_304(client):
+    etag = client.get("/page", headers={"Accept-Encoding": ""}).headers["ETag"]
+    response = client.get(
+        "/page", headers={"Accept-Encoding": "", "If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    assert response.data == b""
+    assert response.headers["ETag"] == etag
+
+
+def test_stale_etag_gets_the_page(client):
+    response = client.get(
+        "/page", headers={"Accept-Encoding": "", "If-None-Match": '"old-deploy"'}
+    )
+    assert response.status_code == 200
+    assert response.get_data(as_text=True) == PAGE
+
+
+@pytest.mark.parametrize(
+    "encoding, decompress", [("gzip", gzip.decompress), ("br", brotli.decompress)]
+)
+def test_compressed_copy_has_its_own_etag(client, encoding, decompress):
+    plain = client.get("/page", headers={"Accept-Encoding": ""}).get_etag()[0]
+    response = client.get("/page", headers={"Accept-Encoding": encoding})
+    assert response.headers["Content-Encoding"] == encoding
+    assert response.get_etag()[0] == f"{plain}-{encoding}"
+    # compress_response leaves the already compressed body alone
+    assert decompress(response.data).decode() == PAGE
+    etag = response.headers["ETag"]
+    response = client.get(
+        "/page", headers={"Accept-Encoding": encoding, "If-None-Match": etag}
+    )
+    assert response.status_code == 304
+
+
+def test_page_is_rendered_and_compressed_once(client, monkeypatch):
+    compressions = []
+    compress = static_pages.compress
+
+    def counted(body, encoding, best=False):
+        compressions.append(encoding)
+        return compress(body, encoding, best)
+
+    monkeypatch.setattr(static_pages, "compress", counted)
+    for _ in range(3):
+        client.get("/page", headers={"Accept-Encoding": "br"})
+        client.get("/page", headers={"Accept-Encoding": ""})
+    assert client.application.renders == 1
+    assert compressions == ["br"]
@@ -0,0 +1,132 @@
+import base64
+
+import pytest
+from flask import Flask, jsonify, request
+from itsdangerous import URLSafeSerializer
+
+from routes.tables import PAGE_COST, table_cost, tables_bp
+from utils.ratelimit import request_cost
+from utils.resultset import ResultSet
+from utils.tables import request_token, result_tables, store_table, table_view
+
+SEARCH_COST = 3
+REGIONS = ["NA", "EU", "KR", "TW", "CN", "OC", "LA", "BR"]
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.secret_key = "test"
+    app.register_blueprint(tables_bp)
+    app.searches = []
+
+    @app.route("/batch", methods=["POST"])
+    @request_cost(POST=lambda: SEARCH_COST * len(request.form.getlist("region")))
+    @table_view
+    def batch():
+        regions = request.form.getlist("region")
+        app.searches.append(regions)
+        rows = [(region, f"<b>{i}</b>", i) for i, region in enumerate(regions)]
+        return jsonify(store_table(ResultSet(["region", "name", "sales"], rows)))
+
+    @app.route("/not-a-table", methods=["POST"])
+    def not_a_table():
+        app.searches.append("not-a-table")
+        return "ok"
+
+    result_tables._entries.clear()
+    yield app
+    result_tables._entries.clear()
+
+
+def token_for(app, path, data):
+    with app.test_request_context(path, method="POST", data=data):
+        return request_token()
+
+
+def table_url(client, regions):
+    return client.post("/batch", data={"region": regions}).json["ajax"]
+
+
+def expired(response):
+    return response.json["data"] == [] and "expired" in response.json["error"]
+
+
+def test_replay_is_charged_for_the_stored_form(app):
+    token = token_for(app, "/batch", {"region": REGIONS})
+    assert result_tables.get(token) is None
+    with app.test_request_context(f"/tables/{token}"):
+        assert table_cost() == PAGE_COST + SEARCH_COST * len(REGIONS)
+
+
+def test_stored_table_costs_one_page(app):
+    token = token_for(app, "/batch", {"region": ["NA", "EU"]})
+    result_tables.set(token, object())
+    with app.test_request_context(f"/tables/{token}"):
+        assert table_cost() == PAGE_COST
+
+
+def test_pages_come_from_the_stored_table(app):
+    client = app.test_client()
+    url = table_url(client, REGIONS)
+    page = client.get(f"{url}?draw=3&start=2&length=3").json
+    assert page["draw"] == 3
+    assert page["recordsTotal"] == page["recordsFiltered"] == len(REGIONS)
+    assert page["data"] == [
+        ["KR", "&lt;b&gt;2&lt;/b&gt;", "2"],
+        ["TW", "&lt;b&gt;3&lt;/b&gt;", "3"],
+        ["CN", "&lt;b&gt;4&lt;/b&gt;", "4"],
+    ]
+    assert app.searches == [REGIONS]
+
+
+def test_order_and_search(app):
+    client = app.test_client()
+    url = table_url(client, REGIONS)
+    page = client.get(f"{url}?order[0][column]=2&order[0][dir]=desc&length=2").json
+    assert [row[0] for row in page["data"]] == ["BR", "LA"]
+    page = client.get(f"{url}?search[value]=n").json
+    assert page["recordsFiltered"] == 2
+    assert sorted(row[0] for row in page["data"]) == ["CN", "NA"]
+
+
+def test_expired_table_is_rebuilt_from_the_token(app):
+    client = app.test_client()
+    url = table_url(client, ["NA", "EU"])
+    result_tables._entries.clear()
+    page = client.get(url).json
+    assert [row[0] for row in page["data"]] == ["NA", "EU"]
+    # the replay ran the search once more and stored the table again
+    assert app.searches == [["NA", "EU"], ["NA", "EU"]]
+    client.get(url)
+    assert len(app.searches) == 2
+
+
+def test_tampered_token_is_not_replayed(app):
+    client = app.test_client()
+    url = table_url(client, ["NA"])
+    result_tables._entries.clear()
+    head, _, signature = url.rpartition(".")
+    other_signature = ("A" if signature[0] != "A" else "B") + signature[1:]
+    assert expired(client.get(f"{head}.{other_signature}"))
+    # another form under the original signature
+    payload = base64.urlsafe_b64encode(b'["/batch",[["region",["EU"]]]]').rstrip(b"=")
+    assert expired(client.get(f"/tables/{payload.decode()}.{signature}"))
+    assert app.searches == [["NA"]]
+
+
+def test_token_signed_with_another_key_is_not_replayed(app):
+    forged = URLSafeSerializer("other", salt="result-table").dumps(
+        ["/batch", [["region", ["NA"]]]]
+    )
+    assert expired(app.test_client().get(f"/tables/{forged}"))
+    assert app.searches == []
+
+
+def test_only_table_views_are_replayed(app):
+    with app.test_request_context():
+        token = URLSafeSerializer(app.secret_key, salt="result-table").dumps(
+            ["/not-a-table", []]
+        )
+    assert expired(app.test_client().get(f"/tables/{token}"))
+    assert app.searches == []
@@ -0,0 +1,73 @@
+import os
+
+import pytest
+from flask import Flask
+
+from utils import templating
+from utils.templating import bytecode_cache, configure_templates
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    templates = tmp_path / "templates"
+    templates.mkdir()
+    (templates / "page.html").write_text("<p>{{ name }}</p>")
+    (templates / "other.html").write_text("{% extends 'page.html' %}")
+    (templates / "notes.txt").write_text("{{ not a template")
+    monkeypatch.setattr(templating, "TEMPLATE_CACHE_DIR", "")
+    monkeypatch.setattr(templating, "TEMPLATES_AUTO_RELOAD", None)
+    return Flask(__name__, template_folder=str(templates))
+
+
+def loaded(app):
+    return sorted(name for _, name in app.jinja_env.cache.keys())
+
+
+def test_every_html_template_is_compiled_up_front(app):
+    configure_templates(app)
+    assert loaded(app) == ["other.html", "page.html"]
+
+
+def test_precompiling_can_be_turned_off(app, monkeypatch):
+    monkeypatch.setattr(templating, "PRECOMPILE_TEMPLATES", False)
+    configure_templates(app)
+    assert loaded(app) == []
+
+
+@pytest.mark.parametrize("debug", [True, False])
+def test_auto_reload_follows_debug(app, debug):
+    app.debug = debug
+    configure_templates(app)
+    assert app.jinja_env.auto_reload is debug
+
+
+def test_auto_reload_setting_wins_over_debug(app, monkeypatch):
+    monkeypatch.setattr(templating, "TEMPLATES_AUTO_RELOAD", "true")
+    configure_templates(app)
+    assert app.jinja_env.auto_reload is True
+
+
+def test_compiled_templates_are_kept_in_the_cache_dir(app, tmp_path, monkeypatch):
+    directory = tmp_path / "bytecode"
+    monkeypatch.setattr(templating, "TEMPLATE_CACHE_DIR", str(directory))
+    configure_templates(app)
+    assert len(os.listdir(directory)) == 2
+    assert os.stat(directory).st_mode & 0o777 == 0o700
+
+
+def test_cache_dir_others_can_write_is_refused(tmp_path):
+    directory = tmp_path / "shared"
+    directory.mkdir()
+    directory.chmod(0o777)
+    with pytest.raises(RuntimeError):
+        bytecode_cache(str(directory))
+
+
+def test_refused_cache_dir_only_disables_the_cache(app, tmp_path, monkeypatch):
+    directory = tmp_path / "shared"
+    directory.mkdir()
+    directory.chmod(0o777)
+    monkeypatch.setattr(templating, "TEMPLATE_CACHE_DIR", str(directory))
+    configure_templates(app)
+    assert app.jinja_env.bytecode_cache is None
+    assert loaded(app) == ["other.html", "page.html"]
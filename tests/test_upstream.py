@@ -0,0 +1,52 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from utils import deadline, upstream
+from utils.deadline import DeadlineExceeded
+
+SLOW_SECONDS = 2
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        time.sleep(SLOW_SECONDS)
+        body = b"{}"
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def slow_url(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SlowHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(upstream, "POOL_SIZE", 1)
+    monkeypatch.setattr(upstream, "RETRIES", 0)
+    yield f"http://127.0.0.1:{server.server_port}/slow"
+    server.shutdown()
+
+
+def test_full_pool_wait_ends_with_the_budget(slow_url):
+    holder = threading.Thread(target=upstream.request, args=("GET", slow_url))
+    holder.start()
+    time.sleep(0.2)
+
+    budget = 0.3
+    deadline._deadline.set((time.monotonic() + budget, budget))
+    started = time.monotonic()
+    try:
+        with pytest.raises(DeadlineExceeded):
+            upstream.request("GET", slow_url)
+    finally:
+        deadline._deadline.set(None)
+    # not until the only pooled connection came back
+    assert time.monotonic() - started < SLOW_SECONDS / 2
+    holder.join()
@@ -0,0 +1,111 @@
+from flask import Flask
+
+from routes.wow import merge_outofstock, outofstock_query, outofstock_searches
+
+FORM = {
+    "salesPerDay": "0.2",
+    "avgPrice": "1000",
+    "minMarketValue": "100000",
+    "populationWP": "3000",
+    "populationBlizz": "1",
+    "rankingWP": "90",
+}
+
+
+def row(item, realm, **extra):
+    return {
+        "itemID": item,
+        "connectedRealmId": realm,
+        "itemName": f"Item {item}",
+        **extra,
+    }
+
+
+def searches(**form):
+    with Flask(__name__).test_request_context(
+        "/wowoutofstock", method="POST", data=form
+    ):
+        return outofstock_searches()
+
+
+def test_merge_tags_rows_with_region_and_category():
+    rows = merge_outofstock(
+        {
+            ("NA", 2): {"data": [row(1, 10, item_class=2)]},
+            ("EU", 4): {"data": [row(2, 20, item_class=4)]},
+        }
+    )
+    assert [(r["itemID"], r["region"], r["category"]) for r in rows] == [
+        (1, "NA", "Weapon"),
+        (2, "EU", "Armor"),
+    ]
+
+
+def test_merge_keeps_an_item_and_realm_once_per_region():
+    rows = merge_outofstock(
+        {
+            ("NA", 2): {"data": [row(1, 10, item_class=2), row(1, 11, item_class=2)]},
+            ("NA", -1): {"data": [row(1, 10, item_class=2), row(3, 10, item_class=0)]},
+            ("EU", -1): {"data": [row(1, 10, item_class=2)]},
+        }
+    )
+    assert [(r["region"], r["itemID"], r["connectedRealmId"]) for r in rows] == [
+        ("NA", 1, 10),
+        ("NA", 1, 11),
+        ("NA", 3, 10),
+        ("EU", 1, 10),
+    ]
+    # the first search to find a row tags it
+    assert rows[0]["category"] == "Weapon"
+
+
+def test_merge_category_without_item_class():
+    rows = merge_outofstock(
+        {("NA", 9): {"data": [row(1, 10)]}, ("EU", 99): {"data": [row(1, 10)]}}
+    )
+    assert [r["category"] for r in rows] == ["Recipe", "99"]
+
+
+def test_merge_skips_answers_without_data():
+    rows = merge_outofstock(
+        {
+            ("NA", 2): {"data": []},
+            ("EU", 2): {"error": "no data"},
+            ("NA", 4): {"data": None},
+            ("EU", 4): {"data": [row(1, 10, item_class=4)]},
+        }
+    )
+    assert len(rows) == 1
+
+
+def test_searches_cross_regions_and_categories():
+    assert searches(region=["NA", "EU"], item_class=["2", "4"]) == [
+        ("NA", 2),
+        ("NA", 4),
+        ("EU", 2),
+        ("EU", 4),
+    ]
+
+
+def test_all_categories_covers_the_others():
+    assert searches(region=["NA"], item_class=["2", "-1", "4"]) == [("NA", -1)]
+
+
+def test_searches_are_deduplicated():
+    assert searches(region=["NA", "NA"], item_class=["2", "2"]) == [("NA", 2)]
+
+
+def test_incomplete_or_malformed_forms_search_nothing():
+    assert searches(region=["NA"]) == []
+    assert searches(item_class=["2"]) == []
+    assert searches(region=["NA"], item_class=["weapons"]) == []
+
+
+def test_query_per_search():
+    with Flask(__name__).test_request_context(
+        "/wowoutofstock", method="POST", data=FORM
+    ):
+        assert outofstock_query("EU", 4)["includeCategories"] == [4]
+        assert outofstock_query("EU", -1)["includeCategories"] == []
+        assert outofstock_query("EU", 4)["region"] == "EU"
+        assert outofstock_query("EU", 4)["salesPerDay"] == 0.2
@@ -0,0 +1,109 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+from utils.metrics import (
+    response_cache_bytes,
+    response_cache_entries,
+    response_cache_lookups,
+)
+
+MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# expired responses are kept this long as a fallback for when the upstream is down
+STALE_MAX_AGE = int(os.getenv("RESPONSE_CACHE_STALE_MAX_AGE", str(24 * 3600)))
+
+# Seconds to keep an upstream response, matched against the end of the url path.
+# Endpoints not listed here are never cached.
+ENDPOINT_TTLS = {
+    "/wow/itemnames": 3600,
+    "/wow/megaitemnames": 300,
+    "/wow/outofstock": 300,
+    "/wow/import": 300,
+    "/bestdeals": 60,
+    "/marketable": 3600,
+}
+
+
+def endpoint_ttl(url):
+    path = urlsplit(url).path.rstrip("/")
+    for endpoint, ttl in ENDPOINT_TTLS.items():
+        if path.endswith(endpoint):
+            return ttl
+    return 0
+
+
+def make_key(url, payload=None):
+    """Canonical hash of an upstream call, key order in the payload does not matter."""
+    normalized = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(f"{url}\n{normalized}".encode()).hexdigest()
+
+
+class ResponseCache:
+    """LRU of raw upstream response bodies bounded by their total size in bytes.
+
+    Bodies are stored undecoded so every hit hands the caller a fresh object
+    that the route can mutate freely. Expired bodies stay until they are
+    stale_max_age past expiry or pushed out, get_stale can still read them.
+    """
+
+    def __init__(self, max_bytes=MAX_BYTES, stale_max_age=STALE_MAX_AGE):
+        self.max_bytes = max_bytes
+        self.stale_max_age = stale_max_age
+        self.current_bytes = 0
+        self._entries = OrderedDict()  # key -> (expires_at, stored_at, content)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                response_cache_lookups.inc(("miss",))
+                return None
+            self._entries.move_to_end(key)
+            response_cache_lookups.inc(("hit",))
+            return entry[2]
+
+    def get_stale(self, key):
+        """(content, stored_at) even when expired, stored_at is a unix time."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] + self.stale_max_age <= time.monotonic():
+                self._remove(key)
+                self._record_size()
+                return None
+            return entry[2], entry[1]
+
+    def set(self, key, content, ttl):
+        if ttl <= 0 or len(content) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + ttl, time.time(), content)
+            self.current_bytes += len(content)
+            while self.current_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+            self._record_size()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+            self._record_size()
+
+    def _remove(self, key):
+        content = self._entries.pop(key)[2]
+        self.current_bytes -= len(content)
+
+    def _record_size(self):
+        response_cache_entries.set((), len(self._entries))
+        response_cache_bytes.set((), self.current_bytes)
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,163 @@
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+from flask import g, has_request_context
+
+# consecutive failed (or slow) calls that open the circuit of an endpoint
+CIRCUIT_FAILURES = int(os.getenv("CIRCUIT_FAILURES", "5"))
+# a call answered after this many seconds counts as failed
+CIRCUIT_SLOW_SECONDS = float(os.getenv("CIRCUIT_SLOW_SECONDS", "10"))
+# an open circuit lets one probe through after this many seconds
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """The endpoint failed too often recently, the call was not attempted."""
+
+    def __init__(self, endpoint, retry_after):
+        super().__init__(f"circuit for {endpoint} is open, retry in {retry_after:.0f}s")
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+
+
+class UpstreamError(Exception):
+    """The upstream answered with a 5xx, `content` is the body it sent."""
+
+    def __init__(self, status_code, content):
+        super().__init__(f"upstream answered {status_code}")
+        self.status_code = status_code
+        self.content = content
+
+
+class CircuitBreaker:
+    """Closed -> open after `failures` bad calls in a row, open -> half open
+    after `reset_seconds`, where a single probe decides between closed and
+    open again."""
+
+    def __init__(
+        self,
+        endpoint,
+        failures=CIRCUIT_FAILURES,
+        slow_seconds=CIRCUIT_SLOW_SECONDS,
+        reset_seconds=CIRCUIT_RESET_SECONDS,
+        clock=time.monotonic,
+    ):
+        self.endpoint = endpoint
+        self.failures = failures
+        self.slow_seconds = slow_seconds
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.state = CLOSED
+        self.failed = 0
+        self.opened_at = 0.0
+        self.probe_started = None
+        self.lock = threading.Lock()
+
+    def before_call(self):
+        """Raise CircuitOpenError unless the call may go ahead."""
+        with self.lock:
+            if self.state == CLOSED:
+                return
+            now = self.clock()
+            if self.state == OPEN and now - self.opened_at >= self.reset_seconds:
+                self.state = HALF_OPEN
+                self.probe_started = None
+            # a probe that never came back does not hold the circuit forever
+            if self.state == HALF_OPEN and (
+                self.probe_started is None
+                or now - self.probe_started >= self.reset_seconds
+            ):
+                self.probe_started = now
+                return
+            retry_after = max(0.0, self.opened_at + self.reset_seconds - now)
+        raise CircuitOpenError(self.endpoint, retry_after)
+
+    def cancel(self):
+        """A call given up for a reason of our own says nothing about the
+        upstream, a half open circuit lets the next call probe instead."""
+        with self.lock:
+            if self.state == HALF_OPEN:
+                self.probe_started = None
+
+    def record(self, ok, seconds=0.0):
+        ok = ok and seconds < self.slow_seconds
+        with self.lock:
+            if ok:
+                if self.state != CLOSED:
+                    logger.warning(
+                        "upstream %s recovered, circuit closed", self.endpoint
+                    )
+                self.state = CLOSED
+                self.failed = 0
+                return
+            self.failed += 1
+            if self.state == HALF_OPEN or self.failed >= self.failures:
+                if self.state != OPEN:
+                    logger.error(
+                        "upstream %s failed %s times, circuit open for %.0fs",
+                        self.endpoint,
+                        self.failed,
+                        self.reset_seconds,
+                    )
+                self.state = OPEN
+                self.opened_at = self.clock()
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+_ID_SEGMENT = re.compile(r"/\d+(?=/|$)")
+
+
+def endpoint_of(url):
+    """host + path with numeric ids folded, so /history/NA/1 and /history/NA/2 share one."""
+    parts = urlsplit(url)
+    return parts.netloc + _ID_SEGMENT.sub("/{id}", parts.path.rstrip("/"))
+
+
+def breaker_for(url):
+    endpoint = endpoint_of(url)
+    breaker = _breakers.get(endpoint)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(endpoint, CircuitBreaker(endpoint))
+    return breaker
+
+
+def mark_stale(stored_at):
+    """Note on the request that part of the page comes from a stale copy,
+    _navbar.html shows the oldest one as "data as of"."""
+    if not has_request_context():
+        return
+    oldest = getattr(g, "data_as_of", None)
+    if oldest is None or stored_at < oldest:
+        g.data_as_of = stored_at
+
+
+def data_as_of():
+    """Template global, the stale data marker as text or None."""
+    if not has_request_context():
+        return None
+    stored_at = getattr(g, "data_as_of", None)
+    if stored_at is None:
+        return None
+    return datetime.fromtimestamp(stored_at, timezone.utc).strftime(
+        "%Y-%m-%d %H:%M UTC"
+    )
+
+
+def upstream_unavailable(exc):
+    """Error handler for CircuitOpenError when there was no stale copy to serve."""
+    return (
+        "The market data service is not answering right now, please try again shortly",
+        503,
+        {"Retry-After": str(max(1, round(exc.retry_after)))},
+    )
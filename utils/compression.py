@@ -0,0 +1,104 @@
+import gzip
+import os
+import zlib
+
+from flask import Response, request
+
+from utils.metrics import timed
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - gzip only
+    brotli = None
+
+# Bodies smaller than this are sent as they are, compressing them gains nothing
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+# Per request levels, pages compressed once (see static_pages) use the maximum
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+COMPRESSIBLE_TYPES = {
+    "text/html",
+    "text/css",
+    "text/plain",
+    "text/javascript",
+    "application/javascript",
+    "application/json",
+    "image/svg+xml",
+}
+
+
+def accepted_encoding(mimetype, size=None):
+    """The encoding to use for this request, None to send the body as is."""
+    if mimetype not in COMPRESSIBLE_TYPES:
+        return None
+    if size is not None and size < COMPRESS_MIN_SIZE:
+        return None
+    accept = request.accept_encodings
+    if brotli is not None and accept.quality("br") > 0:
+        return "br"
+    if accept.quality("gzip") > 0:
+        return "gzip"
+    return None
+
+
+def compress(body, encoding, best=False):
+    with timed("compress"):
+        if encoding == "br":
+            return brotli.compress(body, quality=11 if best else BROTLI_QUALITY)
+        return gzip.compress(body, compresslevel=9 if best else GZIP_LEVEL, mtime=0)
+
+
+def _compress_stream(chunks, encoding):
+    """Compress a streamed body, flushing after every chunk so the browser
+    can render rows while the rest of the page is still being produced."""
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        for chunk in chunks:
+            with timed("compress"):
+                data = compressor.process(chunk) + compressor.flush()
+            if data:
+                yield data
+        with timed("compress"):
+            data = compressor.finish()
+        yield data
+        return
+
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        with timed("compress"):
+            data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    with timed("compress"):
+        data = compressor.flush()
+    yield data
+
+
+def compress_response(response: Response):
+    """after_request hook compressing dynamic responses for clients that accept it."""
+    if (
+        response.status_code < 200
+        or response.status_code in (204, 304)
+        or "Content-Encoding" in response.headers
+        # files sent by send_file keep their own passthrough body
+        or response.direct_passthrough
+        or response.mimetype not in COMPRESSIBLE_TYPES
+    ):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    if response.is_streamed:
+        encoding = accepted_encoding(response.mimetype)
+        if encoding is None:
+            return response
+        response.response = _compress_stream(response.iter_encoded(), encoding)
+        response.headers.pop("Content-Length", None)
+    else:
+        body = response.get_data()
+        encoding = accepted_encoding(response.mimetype, len(body))
+        if encoding is None:
+            return response
+        response.set_data(compress(body, encoding))
+    response.headers["Content-Encoding"] = encoding
+    return response
@@ -0,0 +1,92 @@
+import os
+import time
+from contextvars import ContextVar
+
+from flask import current_app, request
+
+# seconds a request may take end to end, views can ask for their own with
+# @latency_budget. Keep it well under the gunicorn worker timeout
+REQUEST_BUDGET = float(os.getenv("REQUEST_BUDGET_SECONDS", "20"))
+# part of the budget kept back for rendering the answer after the last upstream call
+BUDGET_RESERVE = float(os.getenv("REQUEST_BUDGET_RESERVE", "1"))
+# seconds to wait for an upstream connection, the read timeout is what is left
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "3.05"))
+# read timeout of upstream calls made outside a request, e.g. at startup
+UPSTREAM_READ_TIMEOUT = float(os.getenv("UPSTREAM_READ_TIMEOUT", "30"))
+
+_budgets = {}
+# (monotonic time the upstream calls must be done by, budget), fan_out
+# threads see it too since they run in a copy of the request's context
+_deadline = ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """The request used up its latency budget waiting on upstreams."""
+
+    def __init__(self, budget):
+        super().__init__(f"latency budget of {budget:.0f}s used up")
+        self.budget = budget
+
+
+def latency_budget(seconds):
+    """Give a view its own end to end budget, e.g. @latency_budget(30)."""
+
+    def decorate(view):
+        _budgets[view] = seconds
+        return view
+
+    return decorate
+
+
+def _start_request():
+    view = current_app.view_functions.get(request.endpoint)
+    budget = _budgets.get(view, REQUEST_BUDGET)
+    _deadline.set((time.monotonic() + budget - BUDGET_RESERVE, budget))
+
+
+def init_deadlines(app):
+    """Start the clock before any other hook, rate limiting included."""
+    app.before_request_funcs.setdefault(None, []).insert(0, _start_request)
+
+
+def current():
+    """The budget of the current request, for code running outside its context."""
+    return _deadline.get()
+
+
+def remaining():
+    """Seconds left for upstream calls, None outside a request."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline[0] - time.monotonic()
+
+
+def check():
+    """Raise DeadlineExceeded once the budget is used up."""
+    deadline = _deadline.get()
+    if deadline is not None and time.monotonic() >= deadline[0]:
+        raise DeadlineExceeded(deadline[1])
+
+
+def cap(seconds):
+    """`seconds`, or less when the budget runs out sooner."""
+    left = remaining()
+    return seconds if left is None else max(0.0, min(seconds, left))
+
+
+def timeouts():
+    """(connect, read) timeouts for the next upstream call."""
+    check()
+    left = remaining()
+    if left is None:
+        return UPSTREAM_CONNECT_TIMEOUT, UPSTREAM_READ_TIMEOUT
+    return min(UPSTREAM_CONNECT_TIMEOUT, left), left
+
+
+def deadline_exceeded(exc):
+    """Error handler for DeadlineExceeded when there was no stale copy to serve."""
+    return (
+        "The market data service took too long to answer, please try again shortly",
+        504,
+    )
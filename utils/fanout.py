@@ -0,0 +1,64 @@
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from utils import deadline
+from utils.deadline import DeadlineExceeded
+
+MAX_WORKERS = int(os.getenv("FANOUT_WORKERS", "16"))
+DEFAULT_TIMEOUT = float(os.getenv("FANOUT_TIMEOUT", "30"))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=MAX_WORKERS, thread_name_prefix="fanout"
+                )
+    return _executor
+
+
+def fan_out(calls, timeout=DEFAULT_TIMEOUT):
+    """Run independent upstream calls concurrently.
+
+    `calls` maps a name to a callable, or to a (callable, timeout) tuple to give
+    that call its own deadline, none waits past the request's latency budget.
+    Returns (results, errors) keyed by name, a call that raised or missed its
+    deadline lands in errors so the route can decide what a partial answer is
+    worth.
+    """
+    executor = _get_executor()
+    start = time.monotonic()
+    futures = {}
+    deadlines = {}
+    for name, call in calls.items():
+        fn, call_timeout = call if isinstance(call, tuple) else (call, timeout)
+        # carry the flask request context, and with it the budget, into the
+        # worker thread
+        futures[name] = executor.submit(contextvars.copy_context().run, fn)
+        deadlines[name] = (start + call_timeout, call_timeout)
+
+    results = {}
+    errors = {}
+    for name, future in futures.items():
+        expires_at, call_timeout = deadlines[name]
+        try:
+            wait = deadline.cap(max(0, expires_at - time.monotonic()))
+            results[name] = future.result(timeout=wait)
+        except FutureTimeoutError:
+            future.cancel()
+            errors[name] = TimeoutError(f"{name} took longer than {call_timeout}s")
+            if time.monotonic() < expires_at:
+                # cut short by the request's budget rather than its own timeout
+                errors[name] = DeadlineExceeded(deadline.current()[1])
+        except Exception as exc:
+            errors[name] = exc
+    return results, errors
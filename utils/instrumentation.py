@@ -0,0 +1,73 @@
+import logging
+import os
+
+# "datadog" (tracer, profiler and library patching) or "none"
+INSTRUMENTATION = os.getenv("INSTRUMENTATION", "datadog").lower()
+
+logger = logging.getLogger(__name__)
+
+
+class Instrumentation:
+    """No-op backend, nothing is imported, patched or started."""
+
+    name = "none"
+
+    def start(self):
+        pass
+
+    def init_app(self, app):
+        pass
+
+
+class DatadogInstrumentation(Instrumentation):
+    """ddtrace is only imported when this backend is selected."""
+
+    name = "datadog"
+
+    def start(self):
+        from ddtrace import config, patch_all, tracer
+        from ddtrace.profiling import Profiler
+
+        # Enable Datadog tracing
+        patch_all()
+        self.profiler = Profiler()
+        self.profiler.start()
+
+        # Initialize Datadog tracer
+        tracer.configure(
+            hostname=os.getenv("DD_AGENT_HOST", "localhost"),
+            port=8126,
+        )
+
+        # Set Datadog service and environment variables
+        os.environ["DD_SERVICE"] = "flask-test"
+        os.environ["DD_ENV"] = "production"
+        os.environ["DD_VERSION"] = "1.0"
+        os.environ["DD_LOGS_INJECTION"] = "true"
+
+        config.service = "flask-test"
+        config.env = "production"
+        config.version = "1.0"
+
+    def init_app(self, app):
+        from ddtrace import Pin
+
+        # Attach the tracer to the Flask app
+        Pin.override(app, service="flask-test")
+
+
+BACKENDS = {
+    "none": Instrumentation,
+    "datadog": DatadogInstrumentation,
+}
+
+
+def start_instrumentation(name=INSTRUMENTATION):
+    """Start the configured backend, call init_app on the result once the app exists."""
+    backend = BACKENDS.get(name)
+    if backend is None:
+        logger.warning("unknown INSTRUMENTATION %r, instrumentation is off", name)
+        backend = Instrumentation
+    instrumentation = backend()
+    instrumentation.start()
+    return instrumentation
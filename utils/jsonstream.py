@@ -0,0 +1,33 @@
+import json
+
+try:
+    import ijson
+except ImportError:  # pragma: no cover - falls back to a full json.loads
+    ijson = None
+
+
+def _walk(data, path):
+    for key in filter(None, path.split(".")):
+        data = data[key]
+    return data
+
+
+def iter_items(content, path=""):
+    """Yield the elements of the JSON array at dotted `path` one at a time.
+
+    With ijson installed the document is never materialized, only the element
+    currently being yielded is alive.
+    """
+    if ijson is None:
+        yield from _walk(json.loads(content), path)
+        return
+    prefix = f"{path}.item" if path else "item"
+    yield from ijson.items(content, prefix, use_float=True)
+
+
+def iter_pairs(content, path=""):
+    """Yield (key, value) pairs of the JSON object at dotted `path`."""
+    if ijson is None:
+        yield from _walk(json.loads(content), path).items()
+        return
+    yield from ijson.kvitems(content, path, use_float=True)
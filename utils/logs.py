@@ -0,0 +1,149 @@
+import atexit
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = (
+    "%(levelname)s:\t[%(process)d][%(asctime)s] [%(module)s][%(funcName)s]  %(message)s"
+)
+# longer messages (whole upstream responses) are cut to this many characters
+LOG_MAX_MESSAGE = int(os.getenv("LOG_MAX_MESSAGE", "2000"))
+# the same message is written at most LOG_SAMPLE_BURST times per window
+LOG_SAMPLE_WINDOW = float(os.getenv("LOG_SAMPLE_WINDOW", "60"))
+LOG_SAMPLE_BURST = int(os.getenv("LOG_SAMPLE_BURST", "5"))
+# records waiting for the writer thread, beyond this they are dropped
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+
+class TruncateFilter(logging.Filter):
+    """Cut the formatted message down to max_length characters."""
+
+    def __init__(self, max_length=LOG_MAX_MESSAGE):
+        super().__init__()
+        self.max_length = max_length
+
+    def filter(self, record):
+        message = record.getMessage()
+        if len(message) > self.max_length:
+            record.msg = (
+                f"{message[: self.max_length]}"
+                f"... [{len(message) - self.max_length} more characters]"
+            )
+            record.args = None
+        return True
+
+
+class SampleFilter(logging.Filter):
+    """Let through the first `burst` copies of a message in every window.
+
+    The first copy after a window with drops says how many were dropped.
+    """
+
+    def __init__(
+        self, window=LOG_SAMPLE_WINDOW, burst=LOG_SAMPLE_BURST, clock=time.monotonic
+    ):
+        super().__init__()
+        self.window = window
+        self.burst = burst
+        self.clock = clock
+        self.seen = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        key = (record.name, record.levelno, record.getMessage())
+        now = self.clock()
+        with self.lock:
+            start, count = self.seen.get(key, (now, 0))
+            suppressed = 0
+            if now - start >= self.window:
+                suppressed = max(0, count - self.burst)
+                start, count = now, 0
+            if len(self.seen) >= 10_000 and key not in self.seen:
+                self._prune(now)
+            self.seen[key] = (start, count + 1)
+        if count >= self.burst:
+            return False
+        if suppressed:
+            record.msg = (
+                f"{record.getMessage()} [{suppressed} identical messages suppressed]"
+            )
+            record.args = None
+        return True
+
+    def _prune(self, now):
+        self.seen = {
+            key: (start, count)
+            for key, (start, count) in self.seen.items()
+            if now - start < self.window
+        }
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full."""
+
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_pipeline = None
+
+
+class LogPipeline:
+    """Request threads only filter and enqueue, a listener thread does the writing."""
+
+    def __init__(self, handlers, queue_size=LOG_QUEUE_SIZE):
+        self.handlers = handlers
+        self.queue_size = queue_size
+        self.handler = DroppingQueueHandler(queue.Queue(queue_size))
+        self.handler.addFilter(TruncateFilter())
+        self.handler.addFilter(SampleFilter())
+        self.listener = None
+
+    def start(self):
+        self.listener = QueueListener(
+            self.handler.queue, *self.handlers, respect_handler_level=True
+        )
+        self.listener.start()
+
+    def stop(self):
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    def after_fork(self):
+        # threads do not survive fork, a preloaded gunicorn worker gets a new
+        # queue (the old one's lock may have been held) and its own listener
+        self.handler.queue = queue.Queue(self.queue_size)
+        self.start()
+
+
+def setup_logging(level=LOG_LEVEL):
+    """Send every logger's records through the queue to stderr, once per process."""
+    global _pipeline
+    if _pipeline is not None:
+        return _pipeline
+
+    stream = logging.StreamHandler(sys.stderr)
+    stream.setFormatter(logging.Formatter(LOG_FORMAT))
+    _pipeline = LogPipeline([stream])
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(_pipeline.handler)
+    root.setLevel(level)
+
+    _pipeline.start()
+    atexit.register(_pipeline.stop)
+    os.register_at_fork(after_in_child=_pipeline.after_fork)
+    return _pipeline
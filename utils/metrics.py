@@ -0,0 +1,422 @@
+import bisect
+import fcntl
+import json
+import os
+import threading
+import time
+from contextvars import ContextVar
+
+from flask import request
+
+# set to false to leave out the hooks and the /metrics page entirely
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "True").lower() in ("true", "1", "yes")
+# gunicorn.conf.py points this at a directory the workers of the pod share.
+# Every worker writes its values there each METRICS_FLUSH_SECONDS and when it
+# exits, /metrics on any worker reports the sum over all of them. Unset, each
+# process only reports its own values
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+
+DURATION_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30,
+)  # fmt: skip
+SIZE_BUCKETS = tuple(1024 * 4**i for i in range(9))  # 1KB .. 64MB
+
+# fetch (upstream call, including cache hits and waiting on the same search
+# in flight), decode (json.loads), transform (Projection), render (Jinja),
+# sanitize (return_safe_html) and compress
+PHASES = ("fetch", "decode", "transform", "render", "sanitize", "compress")
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values):
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.values)
+
+    @staticmethod
+    def merge(values, labels, value):
+        """Add another worker's `value` of series `labels` to `values`."""
+        values[labels] = values.get(labels, 0) + value
+
+    def exposition(self, values=None):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} counter",
+        ]
+        if values is None:
+            values = self.snapshot()
+        for labels, value in sorted(values.items()):
+            if labels:
+                lines.append(
+                    f"{self.name}{{{_labels(self.labelnames, labels)}}} {value}"
+                )
+            else:
+                lines.append(f"{self.name} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    def set(self, labels, value):
+        with self.lock:
+            self.values[labels] = value
+
+    def exposition(self, values=None):
+        lines = super().exposition(values)
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # labels -> [count per bucket (the last one is +Inf), sum]
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.values.get(labels)
+            if series is None:
+                series = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                labels: [counts[:], total]
+                for labels, (counts, total) in self.values.items()
+            }
+
+    @staticmethod
+    def merge(values, labels, value):
+        """Add another worker's `value` of series `labels` to `values`."""
+        counts, total = value
+        series = values.get(labels)
+        if series is None:
+            values[labels] = [list(counts), total]
+        else:
+            series[0] = [a + b for a, b in zip(series[0], counts)]
+            series[1] += total
+
+    def exposition(self, values=None):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        if values is None:
+            values = self.snapshot()
+        bounds = [repr(float(bound)) for bound in self.buckets] + ["+Inf"]
+        for labels, (counts, total) in sorted(values.items()):
+            label_text = _labels(self.labelnames, labels)
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                lines.append(
+                    f'{self.name}_bucket{{{label_text},le="{bound}"}} {cumulative}'
+                )
+            lines.append(f"{self.name}_sum{{{label_text}}} {total}")
+            lines.append(f"{self.name}_count{{{label_text}}} {cumulative}")
+        return lines
+
+
+requests_total = Counter(
+    "temp_fe_requests_total", "Requests served.", ("route", "method", "status")
+)
+request_seconds = Histogram(
+    "temp_fe_request_duration_seconds",
+    "Time from the first hook until the last byte of the body.",
+    ("route",),
+    DURATION_BUCKETS,
+)
+phase_seconds = Histogram(
+    "temp_fe_phase_duration_seconds",
+    "Time a request spent in each phase, concurrent upstream calls add up.",
+    ("route", "phase"),
+    DURATION_BUCKETS,
+)
+response_bytes = Histogram(
+    "temp_fe_response_size_bytes",
+    "Response body size as sent, after compression.",
+    ("route",),
+    SIZE_BUCKETS,
+)
+upstream_responses = Counter(
+    "temp_fe_upstream_responses_total",
+    "Upstream answers by host and status code, error when no answer came.",
+    ("host", "status"),
+)
+upstream_collapsed = Counter(
+    "temp_fe_upstream_collapsed_total",
+    "Upstream calls saved by waiting on the same call already in flight.",
+    (),
+)
+response_cache_lookups = Counter(
+    "temp_fe_response_cache_lookups_total",
+    "Response cache lookups by result, hit or miss (absent or expired).",
+    ("result",),
+)
+response_cache_entries = Gauge(
+    "temp_fe_response_cache_entries",
+    "Upstream responses held by the workers' response caches.",
+    (),
+)
+response_cache_bytes = Gauge(
+    "temp_fe_response_cache_bytes",
+    "Size of the upstream responses held by the workers' response caches.",
+    (),
+)
+
+REGISTRY = [
+    requests_total,
+    request_seconds,
+    phase_seconds,
+    response_bytes,
+    upstream_responses,
+    upstream_collapsed,
+    response_cache_lookups,
+    response_cache_entries,
+    response_cache_bytes,
+]
+
+
+class RequestMetrics:
+    """Phase totals of one request, also added to from fan_out threads."""
+
+    __slots__ = ("route", "start", "phases", "size", "lock")
+
+    def __init__(self, route):
+        self.route = route
+        self.start = time.perf_counter()
+        self.phases = {}
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def add(self, phase, seconds):
+        with self.lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+
+_current = ContextVar("request_metrics", default=None)
+
+
+class timed:
+    """with timed("render"): ... adds the time to the current request's phase."""
+
+    __slots__ = ("phase", "metrics", "start")
+
+    def __init__(self, phase):
+        self.phase = phase
+
+    def __enter__(self):
+        self.metrics = _current.get()
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        if self.metrics is not None:
+            self.metrics.add(self.phase, time.perf_counter() - self.start)
+
+
+def timed_iter(iterable, phase):
+    """Yield from `iterable`, adding the time spent producing items to `phase`."""
+    iterator = iter(iterable)
+    while True:
+        with timed(phase):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def record_upstream(host, status):
+    if METRICS_ENABLED:
+        upstream_responses.inc((host, str(status)))
+
+
+def _counted(body, metrics):
+    for chunk in body:
+        metrics.size += len(chunk)
+        yield chunk
+
+
+def _start_request():
+    rule = request.url_rule
+    _current.set(RequestMetrics(rule.rule if rule is not None else "unmatched"))
+
+
+def _finish_response(response):
+    metrics = _current.get()
+    if metrics is None:
+        return response
+    if response.is_streamed and not response.direct_passthrough:
+        response.response = _counted(response.response, metrics)
+    else:
+        metrics.size = response.content_length or 0
+    method = request.method
+    status = str(response.status_code)
+
+    def observe():
+        route = metrics.route
+        requests_total.inc((route, method, status))
+        request_seconds.observe((route,), time.perf_counter() - metrics.start)
+        response_bytes.observe((route,), metrics.size)
+        for phase, seconds in metrics.phases.items():
+            phase_seconds.observe((route, phase), seconds)
+
+    # runs once the server has sent the whole body, streamed or not
+    response.call_on_close(observe)
+    return response
+
+
+def init_metrics(app):
+    """Install the hooks, before any other so they see every request and the
+    final (compressed) body."""
+    if not METRICS_ENABLED:
+        return
+    app.before_request_funcs.setdefault(None, []).insert(0, _start_request)
+    app.after_request_funcs.setdefault(None, []).insert(0, _finish_response)
+
+
+def _worker_file(pid):
+    return os.path.join(METRICS_DIR, f"{pid}.json")
+
+
+# counters and histograms of workers that have exited, gauges of those go
+_RETIRED_FILE = "retired.json"
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write(path, data):
+    temp = f"{path}.{os.getpid()}.tmp"
+    with open(temp, "w") as f:
+        json.dump(data, f)
+    os.replace(temp, path)
+
+
+class _dir_lock:
+    """flock on METRICS_DIR, shared while reading, exclusive while retiring."""
+
+    def __init__(self, operation):
+        self.operation = operation
+
+    def __enter__(self):
+        self.file = open(os.path.join(METRICS_DIR, ".lock"), "a")
+        fcntl.flock(self.file, self.operation)
+
+    def __exit__(self, *exc_info):
+        self.file.close()
+
+
+def flush():
+    """Write this worker's values to METRICS_DIR."""
+    data = {
+        metric.name: [
+            [list(labels), value] for labels, value in metric.snapshot().items()
+        ]
+        for metric in REGISTRY
+    }
+    _write(_worker_file(os.getpid()), data)
+
+
+def _flush_loop():
+    while True:
+        time.sleep(METRICS_FLUSH_SECONDS)
+        flush()
+
+
+def start_worker():
+    """Flush this worker's values now and then, gunicorn's post_fork calls it."""
+    if METRICS_ENABLED and METRICS_DIR:
+        threading.Thread(target=_flush_loop, name="metrics-flush", daemon=True).start()
+
+
+def stop_worker():
+    """Write the final values of an exiting worker, from gunicorn's worker_exit."""
+    if METRICS_ENABLED and METRICS_DIR:
+        flush()
+
+
+def retire_worker(pid):
+    """Fold the counters and histograms of the exited worker `pid` into
+    retired.json so the totals never go down, from gunicorn's child_exit."""
+    if not (METRICS_ENABLED and METRICS_DIR):
+        return
+    path = _worker_file(pid)
+    retired_path = os.path.join(METRICS_DIR, _RETIRED_FILE)
+    with _dir_lock(fcntl.LOCK_EX):
+        data = _read(path)
+        if data:
+            retired = _read(retired_path)
+            for metric in REGISTRY:
+                if isinstance(metric, Gauge):
+                    continue
+                values = {
+                    tuple(labels): value
+                    for labels, value in retired.get(metric.name, ())
+                }
+                for labels, value in data.get(metric.name, ()):
+                    metric.merge(values, tuple(labels), value)
+                retired[metric.name] = [
+                    [list(labels), value] for labels, value in values.items()
+                ]
+            _write(retired_path, retired)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _other_workers():
+    own = os.path.basename(_worker_file(os.getpid()))
+    with _dir_lock(fcntl.LOCK_SH):
+        return [
+            _read(os.path.join(METRICS_DIR, name))
+            for name in sorted(os.listdir(METRICS_DIR))
+            if name.endswith(".json") and name != own
+        ]
+
+
+def exposition():
+    """All metrics in the Prometheus text format, summed over the workers
+    sharing METRICS_DIR. The other workers' values are up to
+    METRICS_FLUSH_SECONDS old."""
+    others = _other_workers() if METRICS_DIR else []
+    lines = []
+    for metric in REGISTRY:
+        values = metric.snapshot()
+        for data in others:
+            for labels, value in data.get(metric.name, ()):
+                metric.merge(values, tuple(labels), value)
+        lines.extend(metric.exposition(values))
+    return "\n".join(lines) + "\n"
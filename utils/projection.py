@@ -0,0 +1,75 @@
+import itertools
+from operator import itemgetter
+
+from utils.metrics import timed
+from utils.resultset import ResultSet
+
+
+class Projection:
+    """Column rules for a result table, worked out once per upstream key layout.
+
+    Either `columns` lists the exact output columns (missing keys become
+    None), or the upstream key order is kept with `drop` keys left out and
+    `tail` columns moved to the end, in that order.
+
+    Rows come out as tuples read by one operator.itemgetter, a dict per row
+    is never built.
+    """
+
+    def __init__(self, columns=None, drop=(), tail=()):
+        self.columns = list(columns) if columns is not None else None
+        self.drop = set(drop)
+        self.tail = list(tail)
+        self._getters = {}
+
+    def fieldnames(self, keys):
+        """The output columns for rows with upstream keys `keys`."""
+        if self.columns is not None:
+            return list(self.columns)
+        moved = set(self.tail)
+        return [
+            key for key in keys if key not in self.drop and key not in moved
+        ] + self.tail
+
+    def getter(self, keys):
+        """(fieldnames, row -> tuple) for rows with upstream keys `keys`."""
+        keys = tuple(keys)
+        compiled = self._getters.get(keys)
+        if compiled is None:
+            fieldnames = self.fieldnames(keys)
+            get = _tuple_getter(fieldnames)
+
+            # a row without one of the keys gets None there, like a missing
+            # column, instead of failing the whole page
+            def row_tuple(row):
+                try:
+                    return get(row)
+                except KeyError:
+                    return tuple([row.get(column) for column in fieldnames])
+
+            compiled = self._getters[keys] = (fieldnames, row_tuple)
+        return compiled
+
+    def result_set(self, rows):
+        """Project every row of `rows`, any iterable such as iter_items, into
+        a tuple ResultSet. The layout comes from the keys of the first row."""
+        with timed("transform"):
+            if isinstance(rows, list):
+                first = rows[0] if rows else None
+            else:
+                rows = iter(rows)
+                first = next(rows, None)
+                rows = itertools.chain((first,), rows)
+            if first is None:
+                return ResultSet(self.columns or (), [])
+            fieldnames, row_tuple = self.getter(first.keys())
+            return ResultSet(fieldnames, list(map(row_tuple, rows)))
+
+
+def _tuple_getter(keys):
+    """row -> tuple of the values of `keys`, itemgetter returns a bare value
+    for a single key."""
+    if len(keys) == 1:
+        key = keys[0]
+        return lambda row: (row[key],)
+    return itemgetter(*keys)
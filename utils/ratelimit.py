@@ -0,0 +1,192 @@
+import logging
+import math
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+from flask import current_app, request
+from werkzeug.exceptions import TooManyRequests
+
+# every client IP gets a bucket of RATE_LIMIT_BURST tokens that refills at
+# RATE_LIMIT_RATE tokens per second, each request takes its cost out of it
+RATE_LIMIT_RATE = float(os.getenv("RATE_LIMIT_RATE", "1"))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "5"))
+# "memory://" keeps the buckets in this process, "redis://host:6379/0"
+# shares them between every worker and replica
+RATE_LIMIT_STORAGE = os.getenv("RATE_LIMIT_STORAGE", "memory://")
+
+# costs of requests to routes without their own, by method. Browsing (GET
+# serves a cached static page) is nearly free, a search (POST) goes upstream
+DEFAULT_COSTS = {
+    "GET": float(os.getenv("RATE_LIMIT_PAGE_COST", "0.1")),
+    "HEAD": 0.0,
+    "OPTIONS": 0.0,
+    "POST": float(os.getenv("RATE_LIMIT_SEARCH_COST", "1")),
+}
+
+logger = logging.getLogger(__name__)
+
+_costs = {}
+
+
+def request_cost(**costs):
+    """Declare what a view costs per method, e.g. @request_cost(POST=3).
+
+    Methods left out keep DEFAULT_COSTS, a cost of 0 exempts the method. A
+    callable cost is called during the request, for views whose cost depends
+    on the form.
+    """
+
+    def decorate(view):
+        _costs[view] = costs
+        return view
+
+    return decorate
+
+
+def view_cost(view, method):
+    """What a `method` request to `view` costs, see request_cost."""
+    cost = _costs.get(view, {}).get(method, DEFAULT_COSTS.get(method, 1.0))
+    if callable(cost):
+        cost = cost()
+    return cost
+
+
+class MemoryStorage:
+    """Buckets in a dict, for a single process and as the stand-in for tests."""
+
+    def __init__(self, url=None, clock=time.monotonic, max_keys=100_000):
+        self.clock = clock
+        self.max_keys = max_keys
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def take(self, key, cost, rate, burst):
+        """Take cost tokens, return 0 or the seconds until they are there."""
+        with self.lock:
+            now = self.clock()
+            tokens, stamp = self.buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - stamp) * rate)
+            wait = 0.0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                wait = (cost - tokens) / rate
+            if key not in self.buckets and len(self.buckets) >= self.max_keys:
+                self._prune(now, rate, burst)
+            self.buckets[key] = (tokens, now)
+            return wait
+
+    def _prune(self, now, rate, burst):
+        # a bucket that has refilled completely is the same as no bucket
+        full = now - burst / rate
+        self.buckets = {
+            key: (tokens, stamp)
+            for key, (tokens, stamp) in self.buckets.items()
+            if stamp > full
+        }
+
+    def reset(self):
+        with self.lock:
+            self.buckets.clear()
+
+
+# the same bucket arithmetic on the Redis server, so concurrent requests from
+# several workers can not both spend the last token. Uses the server clock
+TAKE_SCRIPT = """
+local cost, rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'stamp')
+local tokens = tonumber(state[1]) or burst
+local stamp = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - stamp) * rate)
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'stamp', tostring(now))
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[4]))
+return tostring(wait)
+"""
+
+
+class RedisStorage:
+    """Buckets shared through Redis, redis-py is only imported when used."""
+
+    def __init__(self, url, client=None):
+        if client is None:
+            import redis
+
+            client = redis.Redis.from_url(url, socket_timeout=0.5)
+        self.client = client
+        self.script = client.register_script(TAKE_SCRIPT)
+
+    def take(self, key, cost, rate, burst):
+        ttl = math.ceil(burst / rate) + 1
+        try:
+            return float(self.script(keys=[key], args=[cost, rate, burst, ttl]))
+        except Exception as exc:
+            # an unreachable store must not take the site down with it
+            logger.warning("rate limit storage unavailable, allowing request: %s", exc)
+            return 0.0
+
+    def reset(self):
+        for key in self.client.scan_iter("ratelimit:*"):
+            self.client.delete(key)
+
+
+STORAGES = {
+    "memory": MemoryStorage,
+    "redis": RedisStorage,
+    "rediss": RedisStorage,
+    "unix": RedisStorage,
+}
+
+
+def storage_from_url(url):
+    scheme = urlsplit(url).scheme
+    storage = STORAGES.get(scheme)
+    if storage is None:
+        raise ValueError(f"unknown RATE_LIMIT_STORAGE scheme {scheme!r}")
+    return storage(url)
+
+
+class RateLimiter:
+    """Token bucket per client IP, charged by the cost of the request."""
+
+    def __init__(
+        self,
+        app=None,
+        storage=None,
+        rate=RATE_LIMIT_RATE,
+        burst=RATE_LIMIT_BURST,
+    ):
+        self.storage = storage or storage_from_url(RATE_LIMIT_STORAGE)
+        self.rate = rate
+        self.burst = burst
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.before_request(self.check)
+
+    def cost(self):
+        view = current_app.view_functions.get(request.endpoint)
+        # a request costing more than a full bucket could never go through
+        return min(view_cost(view, request.method), self.burst)
+
+    def check(self):
+        if request.endpoint == "static":
+            return
+        cost = self.cost()
+        if cost <= 0:
+            return
+        wait = self.storage.take(
+            f"ratelimit:{request.remote_addr}", cost, self.rate, self.burst
+        )
+        if wait > 0:
+            raise TooManyRequests(retry_after=math.ceil(wait))
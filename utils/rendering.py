@@ -0,0 +1,67 @@
+import os
+
+from flask import Response, render_template, stream_template
+
+from utils.metrics import timed, timed_iter
+from utils.resultset import ResultSet
+from utils.security import return_safe_html, safe_html_stream
+from utils.tables import SERVER_SIDE_MIN_ROWS, SERVER_SIDE_TABLES, store_table
+
+# Result tables with at least this many rows are streamed instead of rendered whole
+STREAM_MIN_ROWS = int(os.getenv("STREAM_MIN_ROWS", "1000"))
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", str(64 * 1024)))
+
+
+def _chunked(pieces, size):
+    """Group template output into chunks of about `size` characters.
+
+    Everything before the table body (header, navbar, table head) goes out as
+    soon as it is rendered so the browser can start on it right away.
+    """
+    buffer = []
+    length = 0
+    head_sent = False
+    for piece in pieces:
+        buffer.append(piece)
+        length += len(piece)
+        if length >= size or (not head_sent and "<tbody" in piece):
+            head_sent = True
+            yield "".join(buffer)
+            buffer = []
+            length = 0
+    if buffer:
+        yield "".join(buffer)
+
+
+def render_results(template_name, results, **context):
+    """Render the ResultSet `results`, streaming the page when the table is large.
+
+    Past SERVER_SIDE_MIN_ROWS the page only carries the table head and the
+    browser pages through the rows with /tables/<token>.
+    """
+    if SERVER_SIDE_TABLES and len(results) >= SERVER_SIDE_MIN_ROWS:
+        table_options = store_table(results)
+        with timed("render"):
+            page = render_template(
+                template_name,
+                results=ResultSet(results.fieldnames, []),
+                table_options=table_options,
+                **context,
+            )
+        return return_safe_html(page)
+
+    if len(results) < STREAM_MIN_ROWS:
+        with timed("render"):
+            page = render_template(template_name, results=results, **context)
+        return return_safe_html(page)
+
+    # timed per chunk, Jinja yields a piece for every few characters
+    chunks = timed_iter(
+        _chunked(
+            stream_template(template_name, results=results, **context),
+            STREAM_CHUNK_SIZE,
+        ),
+        "render",
+    )
+    chunks = safe_html_stream(chunks)
+    return Response((chunk.encode() for chunk in chunks), mimetype="text/html")
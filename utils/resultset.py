@@ -0,0 +1,23 @@
+class ResultSet:
+    """A result table as one fieldnames header plus rows of plain tuples.
+
+    A tuple row costs a fraction of a dict with the same values, and the
+    shared templates/_table.html renders the cells in order without a key
+    lookup per cell.
+    """
+
+    __slots__ = ("fieldnames", "rows")
+
+    def __init__(self, fieldnames, rows):
+        self.fieldnames = tuple(fieldnames)
+        self.rows = rows if isinstance(rows, list) else list(rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def records(self):
+        """The rows as dicts, for code that still wants them."""
+        return [dict(zip(self.fieldnames, row)) for row in self.rows]
@@ -1,8 +1,13 @@
 from flask import Response
 from lxml import html
 import os
+import re
+
+from utils.metrics import timed
 
 NO_RATE_LIMIT = os.getenv("NO_RATE_LIMIT", False)
+# "tokenizer" (single pass, see HtmlStreamSanitizer) or "lxml" (full tree round trip)
+SANITIZER = os.getenv("SANITIZER", "tokenizer")
 
 
 # Add security headers to the response
@@ -82,7 +87,172 @@ def return_safe_html(input_string):
     # disable for security testing
     if NO_RATE_LIMIT:
         return input_string
+    with timed("sanitize"):
+        if SANITIZER == "lxml":
+            return lxml_safe_html(input_string)
+        sanitizer = HtmlStreamSanitizer()
+        return sanitizer.feed(input_string) + sanitizer.close()
+
+
+def lxml_safe_html(input_string):
     document_root = html.fromstring(input_string)
     cleaned_html = html.tostring(document_root, pretty_print=True)
     # if `cleaned_html` differs from `input_string`, the input may contain malicious content.
     return cleaned_html
+
+
+# Single pass sanitizer used for every dynamic page, whole or streamed. Markup
+# that our autoescaped templates produce (plain tags, double quoted attributes,
+# escaped text) passes through a single regex untouched, anything else is
+# re-serialized token by token so it cannot change the structure of the page.
+# tests/test_security.py checks it against lxml_safe_html.
+_NAME = r"[a-zA-Z][a-zA-Z0-9-]*"
+_ATTR_NAME = r"(?!on)[a-zA-Z_:][-a-zA-Z0-9_:.]*"
+_ENTITY = r"&(?:[a-zA-Z][a-zA-Z0-9]*|\#[0-9]+|\#[xX][0-9a-fA-F]+);"
+_SAFE_RUN = re.compile(
+    rf"""(?:
+        [^<>&]+
+      | {_ENTITY}
+      | <(?!script|style){_NAME}(?:\s+{_ATTR_NAME}(?:="[^"<>]*")?)*\s*/?>
+      | </{_NAME}\s*>
+      | <!--(?:(?!--).)*-->
+    )++""",
+    re.X | re.S | re.I,
+)
+_START_TAG = re.compile(
+    rf"<({_NAME})((?:\s*[^\s\"'>/=]+(?:\s*=\s*(?:\"[^\"]*\"|'[^']*'|[^\s\"'=<>`]+))?)*)\s*(/?)>",
+    re.S,
+)
+_ATTR = re.compile(
+    r"([^\s\"'>/=]+)(?:\s*=\s*(?:\"([^\"]*)\"|'([^']*)'|([^\s\"'=<>`]+)))?", re.S
+)
+_END_TAG = re.compile(rf"</({_NAME})[^>]*>", re.S)
+_DOCTYPE = re.compile(r"<!doctype\s+html[^>]*>", re.I)
+_VALID_ATTR = re.compile(rf"{_ATTR_NAME}$", re.I)
+# script and style bodies are passed through up to their end tag
+_RAW_TEXT_END = {tag: re.compile(f"</{tag}", re.I) for tag in ("script", "style")}
+
+
+def _clean_start_tag(match):
+    attrs = []
+    for name, double, single, bare in _ATTR.findall(match.group(2)):
+        if not _VALID_ATTR.match(name):
+            continue
+        value = double or single or bare
+        if value:
+            attrs.append(f' {name.lower()}="{value.replace(chr(34), "&quot;")}"')
+        else:
+            attrs.append(f" {name.lower()}")
+    return f"<{match.group(1).lower()}{''.join(attrs)}{match.group(3)}>"
+
+
+class HtmlStreamSanitizer:
+    """Sanitize an HTML document that arrives in chunks.
+
+    `feed` returns the sanitized output that is safe to send so far, an
+    incomplete tag or entity at the end of a chunk is held back until the next
+    one completes it. `close` flushes whatever is left.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._raw_tag = None
+
+    def feed(self, chunk):
+        self._buffer += chunk
+        return self._process(final=False)
+
+    def close(self):
+        return self._process(final=True)
+
+    def _boundary(self, buf, final):
+        if final:
+            return len(buf)
+        end = len(buf)
+        lt = buf.rfind("<")
+        if lt != -1 and buf.find(">", lt) == -1:
+            end = lt
+        comment = buf.rfind("<!--", 0, end)
+        if comment != -1 and buf.find("-->", comment) == -1:
+            end = comment
+        amp = buf.rfind("&", 0, end)
+        if amp != -1 and end - amp < 12 and buf.find(";", amp, end) == -1:
+            end = amp
+        return end
+
+    def _process(self, final):
+        buf = self._buffer
+        out = []
+        pos = 0
+        end = self._boundary(buf, final)
+        while pos < end:
+            if self._raw_tag:
+                match = _RAW_TEXT_END[self._raw_tag].search(buf, pos)
+                if match is None and not final:
+                    break
+                close = match.start() if match else len(buf)
+                out.append(buf[pos:close])
+                pos = close
+                self._raw_tag = None
+                end = self._boundary(buf, final)
+                continue
+
+            match = _SAFE_RUN.match(buf, pos, end)
+            if match:
+                out.append(match.group(0))
+                pos = match.end()
+                continue
+
+            char = buf[pos]
+            if char == ">":
+                out.append("&gt;")
+                pos += 1
+            elif char == "&":
+                out.append("&amp;")
+                pos += 1
+            elif buf.startswith("<!--", pos):
+                close = buf.find("-->", pos, end)
+                if close == -1:
+                    # unterminated comment at the end of the document
+                    pos = end
+                    continue
+                out.append(buf[pos : close + 3].replace("--!>", ""))
+                pos = close + 3
+            elif match := _DOCTYPE.match(buf, pos, end):
+                out.append(match.group(0))
+                pos = match.end()
+            elif buf.startswith(("<!", "<?"), pos):
+                close = buf.find(">", pos, end)
+                pos = end if close == -1 else close + 1
+            elif match := _START_TAG.match(buf, pos, end):
+                out.append(_clean_start_tag(match))
+                pos = match.end()
+                tag = match.group(1).lower()
+                if tag in _RAW_TEXT_END and not match.group(3):
+                    self._raw_tag = tag
+            elif match := _END_TAG.match(buf, pos, end):
+                out.append(f"</{match.group(1).lower()}>")
+                pos = match.end()
+            else:
+                out.append("&lt;")
+                pos += 1
+
+        self._buffer = buf[pos:]
+        return "".join(out)
+
+
+def safe_html_stream(chunks):
+    """Sanitize an iterable of HTML chunks incrementally, yields str chunks."""
+    if NO_RATE_LIMIT:
+        yield from chunks
+        return
+    sanitizer = HtmlStreamSanitizer()
+    for chunk in chunks:
+        with timed("sanitize"):
+            cleaned = sanitizer.feed(chunk)
+        if cleaned:
+            yield cleaned
+    with timed("sanitize"):
+        cleaned = sanitizer.close()
+    if cleaned:
+        yield cleaned
@@ -0,0 +1,43 @@
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """Collapse concurrent calls that share a key into a single execution.
+
+    The first caller for a key runs the function, callers arriving while it is
+    still running wait on the same future and get its result or exception.
+    `collapsed`, a metrics Counter, counts the callers that waited.
+    """
+
+    def __init__(self, collapsed=None):
+        self.collapsed = collapsed
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def join(self, key):
+        """Return (future, is_leader) for `key`, the leader must call `finish`."""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is None:
+                future = self._calls[key] = Future()
+                return future, True
+        if self.collapsed is not None:
+            self.collapsed.inc(())
+        return future, False
+
+    def finish(self, key, fn):
+        future = self._calls[key]
+        try:
+            future.set_result(fn())
+        except BaseException as exc:
+            future.set_exception(exc)
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def do(self, key, fn):
+        future, leader = self.join(key)
+        if leader:
+            self.finish(key, fn)
+        return future.result()
@@ -0,0 +1,72 @@
+import hashlib
+import os
+
+from flask import Response, render_template, request
+
+from utils.compression import accepted_encoding, compress
+from utils.security import return_safe_html
+
+STATIC_PAGE_CACHE = os.getenv("STATIC_PAGE_CACHE", "True").lower() in (
+    "true",
+    "1",
+    "yes",
+)
+
+# cache key -> (body, etag, mimetype), filled on the first request for each page
+_pages = {}
+# (cache key, encoding) -> body compressed at the best level, once per page
+_encoded = {}
+
+
+def cached_page(key, render, mimetype="text/html"):
+    """Serve bytes produced once by `render` with a strong ETag.
+
+    Requests carrying a matching If-None-Match get an empty 304. Clients that
+    accept gzip or br get a copy compressed once, with its own ETag.
+    """
+    page = _pages.get(key)
+    if page is None:
+        body = render()
+        if isinstance(body, str):
+            body = body.encode()
+        page = (body, hashlib.sha256(body).hexdigest()[:32], mimetype)
+        if STATIC_PAGE_CACHE:
+            _pages[key] = page
+
+    body, etag, mimetype = page
+    encoding = accepted_encoding(mimetype, len(body))
+    if encoding is not None:
+        encoded = _encoded.get((key, encoding))
+        if encoded is None:
+            encoded = compress(body, encoding, best=True)
+            if STATIC_PAGE_CACHE:
+                _encoded[(key, encoding)] = encoded
+        body = encoded
+        etag = f"{etag}-{encoding}"
+
+    response = Response(body, mimetype=mimetype)
+    if encoding is not None:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    response.set_etag(etag)
+    # browsers keep the page but always revalidate, a deploy changes the ETag
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
+
+
+def static_template(template_name, sanitize=True):
+    """A page rendered from a template that does not depend on the request."""
+
+    def render():
+        html = render_template(template_name)
+        return return_safe_html(html) if sanitize else html
+
+    return cached_page(template_name, render)
+
+
+def static_file(path, mimetype):
+    def render():
+        with open(path, "rb") as file:
+            return file.read()
+
+    return cached_page(path, render, mimetype)
@@ -0,0 +1,212 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, request, url_for
+from itsdangerous import BadSignature, URLSafeSerializer
+from markupsafe import escape
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import HTTPException
+
+from utils.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+SERVER_SIDE_TABLES = os.getenv("SERVER_SIDE_TABLES", "True").lower() in (
+    "true",
+    "1",
+    "yes",
+)
+# Result tables with at least this many rows are paged by the server
+SERVER_SIDE_MIN_ROWS = int(os.getenv("SERVER_SIDE_MIN_ROWS", "5000"))
+TABLE_CACHE_ENTRIES = int(os.getenv("TABLE_CACHE_ENTRIES", "16"))
+TABLE_CACHE_TTL = int(os.getenv("TABLE_CACHE_TTL", "900"))
+MAX_PAGE_LENGTH = 1000
+
+# views whose POST can be replayed to rebuild a table this process never saw
+_table_views = set()
+
+
+def table_view(view):
+    """Mark a results view as safe to replay from its form for /tables/<token>."""
+    _table_views.add(view)
+    return view
+
+
+def _sort_key(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return (1, value, "")
+    if value is None:
+        return (0, 0, "")
+    text = str(value)
+    try:
+        return (1, float(text), "")
+    except ValueError:
+        return (2, 0, text.lower())
+
+
+class ResultTable:
+    """One ResultSet plus the indexes built lazily while it is paged."""
+
+    def __init__(self, results):
+        self.fieldnames = results.fieldnames
+        self.rows = results.rows
+        self._texts = None
+        self._orders = {}
+        self._lock = threading.Lock()
+
+    def texts(self):
+        if self._texts is None:
+            self._texts = [" ".join(map(str, row)).lower() for row in self.rows]
+        return self._texts
+
+    def order(self, columns):
+        """Row indexes sorted by `columns`, a tuple of (column, descending)."""
+        with self._lock:
+            order = self._orders.get(columns)
+            if order is None:
+                order = list(range(len(self.rows)))
+                # stable sorts applied from the least significant column up
+                for column, descending in reversed(columns):
+                    keys = [_sort_key(row[column]) for row in self.rows]
+                    order.sort(key=keys.__getitem__, reverse=descending)
+                self._orders[columns] = order
+            return order
+
+
+class ResultTableCache:
+    """Small LRU of result tables for the pages currently being browsed."""
+
+    def __init__(self, max_entries=TABLE_CACHE_ENTRIES, ttl=TABLE_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # token -> (expires_at, ResultTable)
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return entry[1]
+
+    def set(self, token, table):
+        with self._lock:
+            self._entries.pop(token, None)
+            self._entries[token] = (time.monotonic() + self.ttl, table)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+result_tables = ResultTableCache()
+# draws for the same expired table share one replay, kept apart from the
+# upstream calls so temp_fe_upstream_collapsed_total only counts those
+replays = SingleFlight()
+
+
+def _serializer():
+    return URLSafeSerializer(current_app.secret_key, salt="result-table")
+
+
+def request_token():
+    """URL safe token holding the path and form of the current request, signed
+    with the app secret so only forms this app rendered can be replayed."""
+    return _serializer().dumps([request.path, sorted(request.form.lists())])
+
+
+def replay_target(token):
+    """(view, path, url values, form) a token replays, None for a token this
+    app did not sign or a view that is not a table_view."""
+    try:
+        path, form = _serializer().loads(token)
+        endpoint, values = current_app.url_map.bind("localhost").match(
+            path, method="POST"
+        )
+    except (BadSignature, ValueError, HTTPException):
+        return None
+    view = current_app.view_functions.get(endpoint)
+    if view not in _table_views:
+        return None
+    data = MultiDict([(key, value) for key, items in form for value in items])
+    return view, path, values, data
+
+
+def store_table(results):
+    """Keep the ResultSet `results` for paging, returns the DataTables options."""
+    token = request_token()
+    result_tables.set(token, ResultTable(results))
+    return {
+        "serverSide": True,
+        "processing": True,
+        "searchDelay": 500,
+        "ajax": url_for("tables.table_data", token=token),
+    }
+
+
+def rebuild_table(token):
+    """Replay the POST a token came from, for tables stored by another worker.
+
+    The replayed view hits the upstream response cache and stores the table
+    under the same token through render_results. Only views marked with
+    table_view are replayed.
+    """
+    target = replay_target(token)
+    if target is None:
+        return None
+    view, path, values, data = target
+
+    def replay():
+        with current_app.test_request_context(path, method="POST", data=data):
+            current_app.ensure_sync(view)(**values)
+        return result_tables.get(token)
+
+    try:
+        return replays.do(token, replay)
+    except Exception:
+        logger.exception("could not rebuild the %s table", path)
+        return None
+
+
+def _int_arg(args, name, default):
+    try:
+        return int(args.get(name, default))
+    except ValueError:
+        return default
+
+
+def query_table(table, args):
+    """Answer a DataTables serverSide request (paging, ordering, global search)."""
+    start = max(_int_arg(args, "start", 0), 0)
+    length = _int_arg(args, "length", 10)
+    if length < 0 or length > MAX_PAGE_LENGTH:
+        length = MAX_PAGE_LENGTH
+
+    columns = []
+    i = 0
+    while f"order[{i}][column]" in args:
+        column = _int_arg(args, f"order[{i}][column]", -1)
+        if 0 <= column < len(table.fieldnames):
+            columns.append((column, args.get(f"order[{i}][dir]") == "desc"))
+        i += 1
+    order = table.order(tuple(columns)) if columns else range(len(table.rows))
+
+    # same rule as the client side search, every word has to appear in the row
+    words = args.get("search[value]", "").lower().split()
+    if words:
+        texts = table.texts()
+        order = [row for row in order if all(word in texts[row] for word in words)]
+
+    page = [table.rows[i] for i in order[start : start + length]]
+    return {
+        "draw": _int_arg(args, "draw", 0),
+        "recordsTotal": len(table.rows),
+        "recordsFiltered": len(order),
+        # cells are escaped exactly like the {{ }} of the rendered table
+        "data": [[str(escape(cell)) for cell in row] for row in page],
+    }
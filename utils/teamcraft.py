@@ -0,0 +1,105 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from utils.jsonstream import iter_pairs
+from utils.upstream import request
+
+TEAMCRAFT_ITEMS_URL = os.getenv(
+    "TEAMCRAFT_ITEMS_URL",
+    "https://raw.githubusercontent.com/ffxiv-teamcraft/ffxiv-teamcraft/staging/libs/data/src/lib/json/items.json",
+)
+# must be writable by the non root user the pod runs as
+CACHE_DIR = os.getenv(
+    "ITEM_NAMES_CACHE_DIR", os.path.join(tempfile.gettempdir(), "temp-fe")
+)
+CACHE_FILE = os.path.join(CACHE_DIR, "ffxiv_item_names.json")
+REVALIDATE_SECONDS = int(os.getenv("ITEM_NAMES_REVALIDATE_SECONDS", "3600"))
+
+logger = logging.getLogger(__name__)
+
+# item id (str) -> english name, plus the validators needed for a conditional GET
+_state = {"names": {}, "etag": None, "last_modified": None, "checked_at": 0.0}
+_refresh_lock = threading.Lock()
+
+
+def load_item_names():
+    """Load the id -> english name projection saved by a previous refresh."""
+    try:
+        with open(CACHE_FILE, "r") as file:
+            _state.update(json.load(file))
+    except (OSError, ValueError):
+        logger.info("no usable item names cache at %s", CACHE_FILE)
+
+
+def _save():
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_file = f"{CACHE_FILE}.{os.getpid()}.tmp"
+        with open(tmp_file, "w") as file:
+            json.dump(_state, file, separators=(",", ":"))
+        os.replace(tmp_file, CACHE_FILE)
+    except OSError as exc:
+        logger.warning("could not write item names cache %s: %s", CACHE_FILE, exc)
+
+
+def refresh_item_names():
+    headers = {}
+    if _state["names"]:
+        if _state["etag"]:
+            headers["If-None-Match"] = _state["etag"]
+        if _state["last_modified"]:
+            headers["If-Modified-Since"] = _state["last_modified"]
+
+    response = request("GET", TEAMCRAFT_ITEMS_URL, headers=headers)
+    if response.status_code == 304:
+        _state["checked_at"] = time.time()
+        _save()
+        return
+    response.raise_for_status()
+
+    # only the english name is used, drop every other language right away,
+    # one item at a time instead of the whole document as dicts
+    names = {
+        item_id: names["en"]
+        for item_id, names in iter_pairs(response.content)
+        if names.get("en")
+    }
+    _state.update(
+        names=names,
+        etag=response.headers.get("ETag"),
+        last_modified=response.headers.get("Last-Modified"),
+        checked_at=time.time(),
+    )
+    _save()
+
+
+def preload_item_names():
+    """Load the names in the gunicorn master, see when_ready in
+    gunicorn.conf.py, so the forked workers share one download."""
+    try:
+        get_item_names()
+    except Exception as exc:
+        logger.warning("could not load item names at startup: %s", exc)
+
+
+def get_item_names():
+    """Return the id -> english name dict, revalidating it when it is stale."""
+    if time.time() - _state["checked_at"] < REVALIDATE_SECONDS:
+        return _state["names"]
+
+    # one thread revalidates, the others keep serving the names already loaded
+    if _refresh_lock.acquire(blocking=not _state["names"]):
+        try:
+            if time.time() - _state["checked_at"] >= REVALIDATE_SECONDS:
+                refresh_item_names()
+        except Exception as exc:
+            if not _state["names"]:
+                raise
+            logger.error("item names revalidation failed, serving cached copy: %s", exc)
+        finally:
+            _refresh_lock.release()
+    return _state["names"]
@@ -0,0 +1,78 @@
+import logging
+import os
+import stat
+import time
+
+from jinja2 import FileSystemBytecodeCache
+
+# compiled templates are kept here between restarts, empty disables the cache.
+# Unset uses Jinja's own per user directory under the temp dir. A directory
+# given here must belong to the user the pod runs as and not be writable by
+# anyone else, since whoever can write it can run code in the app
+TEMPLATE_CACHE_DIR = os.getenv("TEMPLATE_CACHE_DIR")
+PRECOMPILE_TEMPLATES = os.getenv("PRECOMPILE_TEMPLATES", "True").lower() in (
+    "true",
+    "1",
+    "yes",
+)
+# unset follows the debug flag, so production never stats template files
+TEMPLATES_AUTO_RELOAD = os.getenv("TEMPLATES_AUTO_RELOAD")
+
+logger = logging.getLogger(__name__)
+
+
+def configure_templates(app):
+    """Attach the bytecode cache, settle auto reload and compile every template.
+
+    Call once the blueprints are registered so their templates are found too.
+    """
+    env = app.jinja_env
+    if TEMPLATE_CACHE_DIR != "":
+        try:
+            env.bytecode_cache = bytecode_cache(TEMPLATE_CACHE_DIR)
+        except (OSError, RuntimeError) as exc:
+            logger.warning("template bytecode cache disabled: %s", exc)
+
+    if TEMPLATES_AUTO_RELOAD is not None:
+        app.config["TEMPLATES_AUTO_RELOAD"] = TEMPLATES_AUTO_RELOAD.lower() in (
+            "true",
+            "1",
+            "yes",
+        )
+    auto_reload = app.config["TEMPLATES_AUTO_RELOAD"]
+    env.auto_reload = app.debug if auto_reload is None else auto_reload
+
+    if PRECOMPILE_TEMPLATES:
+        precompile_templates(app)
+
+
+def bytecode_cache(directory):
+    """FileSystemBytecodeCache in `directory`, or in Jinja's default
+    directory, which it checks the same way, when None."""
+    if directory is None:
+        return FileSystemBytecodeCache()
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    info = os.lstat(directory)
+    if (
+        not stat.S_ISDIR(info.st_mode)
+        or info.st_uid != os.getuid()
+        or info.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+    ):
+        raise RuntimeError(
+            f"{directory} must be a directory owned by this user and "
+            "writable by nobody else"
+        )
+    return FileSystemBytecodeCache(directory)
+
+
+def precompile_templates(app):
+    """Load every .html template into the environment cache."""
+    start = time.perf_counter()
+    names = app.jinja_env.list_templates(extensions=["html"])
+    for name in names:
+        app.jinja_env.get_template(name)
+    logger.info(
+        "compiled %s templates in %.0fms",
+        len(names),
+        (time.perf_counter() - start) * 1000,
+    )
@@ -0,0 +1,281 @@
+import json
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import EmptyPoolError, ProtocolError, ReadTimeoutError
+
+from utils import deadline
+from utils.cache import endpoint_ttl, make_key, response_cache
+from utils.circuit import CircuitOpenError, UpstreamError, breaker_for, mark_stale
+from utils.deadline import DeadlineExceeded
+from utils.metrics import record_upstream, timed, upstream_collapsed
+from utils.singleflight import SingleFlight
+
+# Connection pool settings, one keep-alive pool per upstream host
+POOL_SIZE = int(os.getenv("UPSTREAM_POOL_SIZE", "20"))
+# seconds to wait for a free pooled connection, less when the latency budget
+# of the request runs out sooner
+POOL_TIMEOUT = float(os.getenv("UPSTREAM_POOL_TIMEOUT", "30"))
+RETRIES = int(os.getenv("UPSTREAM_RETRIES", "2"))
+BACKOFF = float(os.getenv("UPSTREAM_BACKOFF", "0.3"))
+
+# only these are safe to send again, searches are POSTs and never retried
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}
+RETRY_STATUSES = {502, 503, 504}
+BODY_CHUNK_SIZE = 64 * 1024
+
+DEFAULT_HEADERS = {"Accept": "application/json", "User-Agent": "temp-fe"}
+HOST_HEADERS = {
+    "api.saddlebagexchange.com": {"Accept": "application/json"},
+    "universalis.app": {"Accept": "application/json"},
+    "raw.githubusercontent.com": {"Accept": "application/json, text/plain"},
+}
+
+logger = logging.getLogger(__name__)
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+# sessions opened in the gunicorn master before it forks (item names, see
+# gunicorn.conf.py) must not share their sockets with the workers
+os.register_at_fork(after_in_child=_sessions.clear)
+# identical searches in flight share one upstream call
+inflight = SingleFlight(collapsed=upstream_collapsed)
+
+
+def _host_headers(url):
+    return HOST_HEADERS.get(urlsplit(url).hostname, {})
+
+
+class _BudgetPoolMixin:
+    """Wait for a free connection of a full pool only as long as the latency
+    budget allows, urllib3 would wait forever."""
+
+    def urlopen(self, method, url, *args, pool_timeout=None, **kwargs):
+        if pool_timeout is None:
+            pool_timeout = deadline.cap(POOL_TIMEOUT)
+        return super().urlopen(method, url, *args, pool_timeout=pool_timeout, **kwargs)
+
+
+class _BudgetHTTPConnectionPool(_BudgetPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class _BudgetHTTPSConnectionPool(_BudgetPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+class BudgetHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose pools give up waiting when the budget runs out."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _BudgetHTTPConnectionPool,
+            "https": _BudgetHTTPSConnectionPool,
+        }
+
+
+def _new_session(host):
+    session = requests.Session()
+    # at most POOL_SIZE connections per host, a call finding them all busy
+    # waits for one, see BudgetHTTPAdapter
+    adapter = BudgetHTTPAdapter(
+        pool_connections=1, pool_maxsize=POOL_SIZE, pool_block=True
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update(DEFAULT_HEADERS)
+    session.headers.update(_host_headers(f"//{host}"))
+    return session
+
+
+def get_session(url):
+    """Return the shared session for the host of `url`, creating it on first use."""
+    host = urlsplit(url).netloc
+    session = _sessions.get(host)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(host)
+            if session is None:
+                session = _sessions[host] = _new_session(host)
+    return session
+
+
+def _read_body(response):
+    """Read the body like response.content would, but one recv at a time with
+    the socket timeout cut down to what is left of the budget, so an upstream
+    trickling bytes can not hold the request past its deadline either."""
+    chunks = []
+    try:
+        while True:
+            read_timeout = deadline.timeouts()[1]
+            sock = getattr(response.raw.connection, "sock", None)
+            if sock is not None:
+                sock.settimeout(read_timeout)
+            chunk = response.raw.read1(BODY_CHUNK_SIZE, decode_content=True)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    except ReadTimeoutError as exc:
+        response.close()
+        raise requests.ReadTimeout(exc, response=response)
+    except ProtocolError as exc:
+        response.close()
+        raise requests.exceptions.ChunkedEncodingError(exc, response=response)
+    except BaseException:
+        response.close()
+        raise
+    response._content = b"".join(chunks)
+    response._content_consumed = True
+    # back to the pool, the body was read to the end
+    response.close()
+
+
+def request(method, url, **kwargs):
+    """session.request with retries, bounded by the latency budget of the
+    current request, see utils/deadline.py."""
+    session = get_session(url)
+    attempts = RETRIES + 1 if method.upper() in IDEMPOTENT_METHODS else 1
+    for attempt in range(attempts):
+        last_attempt = attempt + 1 == attempts
+        try:
+            response = session.request(
+                method, url, stream=True, timeout=deadline.timeouts(), **kwargs
+            )
+            _read_body(response)
+        except (requests.ConnectionError, requests.Timeout):
+            record_upstream(urlsplit(url).netloc, "error")
+            # timed out because the budget ran out, not because of the upstream
+            deadline.check()
+            if last_attempt:
+                raise
+        except EmptyPoolError as exc:
+            # every pooled connection stayed busy for as long as we could wait
+            deadline.check()
+            raise requests.ConnectionError(exc) from exc
+        else:
+            record_upstream(urlsplit(url).netloc, response.status_code)
+            if last_attempt or response.status_code not in RETRY_STATUSES:
+                return response
+            response.close()
+        time.sleep(deadline.cap(BACKOFF * (2**attempt)))
+
+
+def _before_call(breaker, url):
+    try:
+        breaker.before_call()
+    except CircuitOpenError:
+        record_upstream(urlsplit(url).netloc, "circuit_open")
+        raise
+    return time.monotonic()
+
+
+def _after_call(breaker, response, started, ttl, key):
+    breaker.record(response.status_code < 500, time.monotonic() - started)
+    if response.status_code >= 500:
+        raise UpstreamError(response.status_code, response.content)
+    # only keep good answers, errors should be retried on the next search
+    if ttl and response.status_code == 200:
+        response_cache.set(key, response.content, ttl)
+    return response.content
+
+
+def _fetch(method, url, json_data, ttl, key, **kwargs):
+    # a budget used up before the call is not the upstream's fault
+    deadline.check()
+    breaker = breaker_for(url)
+    started = _before_call(breaker, url)
+    try:
+        response = request(method, url, json=json_data, **kwargs)
+    except DeadlineExceeded:
+        # the request's budget ran out, mostly on earlier calls. That is not
+        # the upstream failing, unless this call alone was already slow
+        if time.monotonic() - started >= breaker.slow_seconds:
+            breaker.record(False)
+        else:
+            breaker.cancel()
+        raise
+    except Exception:
+        breaker.record(False)
+        raise
+    return _after_call(breaker, response, started, ttl, key)
+
+
+# upstream failures that a stale copy of the same answer can stand in for
+UPSTREAM_FAILURES = (
+    CircuitOpenError,
+    DeadlineExceeded,
+    UpstreamError,
+    requests.RequestException,
+)
+
+
+def _fallback(key, exc):
+    """A stale copy of the answer for `key`, or what the caller got before."""
+    stale = response_cache.get_stale(key)
+    if stale is None:
+        if isinstance(exc, UpstreamError):
+            # no copy, the route handles the error body as it always has
+            return exc.content
+        raise exc
+    content, stored_at = stale
+    logger.warning("serving a stale upstream answer: %s", exc)
+    mark_stale(stored_at)
+    return content
+
+
+def _upstream_content(method, url, json_data=None, **kwargs):
+    ttl = endpoint_ttl(url)
+    key = make_key(f"{method} {url}", json_data)
+    with timed("fetch"):
+        content = response_cache.get(key) if ttl else None
+        if content is None:
+            try:
+                content = _shared_fetch(
+                    key, lambda: _fetch(method, url, json_data, ttl, key, **kwargs)
+                )
+            except UPSTREAM_FAILURES as exc:
+                content = _fallback(key, exc)
+    return content
+
+
+def _shared_fetch(key, fetch):
+    """fetch() once for every identical search in flight. A search that joined
+    one whose own budget ran out tries again with what is left of its own."""
+    while True:
+        future, leader = inflight.join(key)
+        if leader:
+            inflight.finish(key, fetch)
+        try:
+            return future.result(timeout=deadline.remaining())
+        except TimeoutError:
+            deadline.check()
+            raise
+        except DeadlineExceeded:
+            if leader:
+                raise
+            deadline.check()
+
+
+def _decode(content):
+    with timed("decode"):
+        return json.loads(content)
+
+
+def get_json(url, **kwargs):
+    return _decode(_upstream_content("GET", url, **kwargs))
+
+
+def post_json(url, json_data, **kwargs):
+    return _decode(_upstream_content("POST", url, json_data, **kwargs))
+
+
+def post_raw(url, json_data, **kwargs):
+    """Undecoded response body, for callers that decode it with utils.jsonstream."""
+    return _upstream_content("POST", url, json_data, **kwargs)